@@ -124,6 +124,23 @@ STATICFILES_DIRS = [BASE_DIR / 'Frontend/static']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Receipt photos are re-encoded at upload: upright, without metadata, at most
+# RECEIPT_MAX_SIDE pixels on the longest side. Set RECEIPT_KEEP_ORIGINALS to also
+# store the file as uploaded.
+RECEIPT_MAX_SIDE = 2000
+RECEIPT_JPEG_QUALITY = 80
+RECEIPT_KEEP_ORIGINALS = False
+
+# Receipts are only served through access-checked views. Set to 'x-accel' (nginx)
+# or 'x-sendfile' (Apache/lighttpd) to let the front-end server send the bytes;
+# None streams them from Django, which is fine for development.
+SENDFILE_BACKEND = None
+# Internal nginx location aliased to MEDIA_ROOT, used with 'x-accel'
+SENDFILE_URL = '/protected-media/'
+
+# Partial files of chunked receipt uploads (kept out of MEDIA_ROOT so they are never served)
+CHUNKED_UPLOAD_DIR = BASE_DIR / 'upload_sessions'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -15,8 +15,6 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.conf import settings
-from django.conf.urls.static import static
 from django.urls import include, path
 from Frontend import views
 
@@ -26,6 +24,3 @@ urlpatterns = [
     path('core/',include('core.urls')),
     path('', include('Frontend.urls')),  # homepage
 ]
-
-if settings.DEBUG:  # serve media only in dev
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
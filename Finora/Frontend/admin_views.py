@@ -7,9 +7,13 @@ from django.core.mail import send_mail
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from django.db.models import Q, Count
+from django.db.models import Q, Count, Sum
 from user_app.models import UserData, CompanyData, PasswordResetToken
-from core.models import Expense, ExpenseApproval, ApprovalRules
+from core.currency import converted_amount
+from core.models import Expense, ExpenseApproval, ApprovalRules, ExpenseRollup
+from core.pagination import keyset_page, page_response
+from core.reports import REPORTED_STATUSES
+from core.search import search_expenses
 from django.utils import timezone
 import json
 import uuid
@@ -34,9 +38,9 @@ def admin_dashboard(request):
     # Get statistics
     total_employees = UserData.objects.filter(company=company).count()
     total_managers = UserData.objects.filter(company=company, role='Manager').count()
-    total_expenses = Expense.objects.filter(employee__company=company).count()
+    total_expenses = Expense.objects.filter(company=company).count()
     pending_approvals = ExpenseApproval.objects.filter(
-        expense__employee__company=company,
+        company=company,
         status='Pending'
     ).count()
     
@@ -45,7 +49,7 @@ def admin_dashboard(request):
     
     # Get recent expenses (last 10)
     recent_expenses = Expense.objects.filter(
-        employee__company=company
+        company=company
     ).order_by('-created_at')[:10]
     
     context = {
@@ -280,21 +284,17 @@ def save_approval_rules(request):
             rules.min_approval_percentage = min_approval_percentage
             rules.save()
         
-        # Handle approvers (simplified - in real implementation, you'd handle multiple approvers)
-        approver_ids = request.POST.getlist('approver_ids')
-        approver_required = request.POST.getlist('approver_required')
-        
-        # Clear existing approvers
+        # Handle approvers: one lookup, stored in the order submitted (the approval sequence)
+        approver_ids = list(dict.fromkeys(int(i) for i in request.POST.getlist('approver_ids') if i))
+        approvers = UserData.objects.filter(company=user_data.company).in_bulk(approver_ids)
         rules.approvers.clear()
-        
-        # Add new approvers
-        for i, approver_id in enumerate(approver_ids):
-            if approver_id:
-                try:
-                    approver = UserData.objects.get(id=approver_id, company=user_data.company)
-                    rules.approvers.add(approver)
-                except UserData.DoesNotExist:
-                    pass
+        ApprovalRules.approvers.through.objects.bulk_create([
+            ApprovalRules.approvers.through(approvalrules=rules, userdata=approvers[approver_id])
+            for approver_id in approver_ids if approver_id in approvers
+        ])
+
+        # Invalidate cached approval plans built from the previous approvers
+        rules.save(update_fields=['version'])
         
         return JsonResponse({'success': True, 'message': 'Approval rules saved successfully'})
         
@@ -373,6 +373,19 @@ def delete_rule(request, rule_id):
         return JsonResponse({'success': False, 'error': str(e)})
 
 
+def company_expenses(company):
+    """All expenses of a company, with the employee needed by the list rows"""
+    return Expense.objects.filter(company=company).select_related('employee')
+
+
+def company_pending_approvals(company):
+    """Pending approvals of a company, with everything the list rows show"""
+    return ExpenseApproval.objects.filter(
+        company=company,
+        status='Pending'
+    ).select_related('expense', 'expense__employee', 'approver')
+
+
 # @login_required
 def admin_expenses(request):
     """Expense management page"""
@@ -387,16 +400,38 @@ def admin_expenses(request):
         messages.error(request, "Access denied. Admin privileges required.")
         return redirect('index')
     
-    # Get all expenses in the company
-    expenses = Expense.objects.filter(employee__company=company).order_by('-created_at')
+    # First page of the company's expenses; the rest load on demand.
+    # A search shows the best matches instead, without paging.
+    query = request.GET.get('q', '').strip()
+    if query:
+        expenses, next_cursor = search_expenses(query, company_id=company.id), None
+    else:
+        expenses, next_cursor = keyset_page(company_expenses(company))
     
     context = {
         'expenses': expenses,
+        'next_cursor': next_cursor,
+        'query': query,
     }
     
     return render(request, 'admin_expenses.html', context)
 
 
+# @login_required
+def admin_expenses_page(request):
+    """Next page of the expenses list for the load-more button"""
+    try:
+        user_data = UserData.objects.get(user=request.user)
+        if user_data.role != 'Admin':
+            return JsonResponse({'success': False, 'error': 'Access denied'})
+        
+        rows, next_cursor = keyset_page(company_expenses(user_data.company), request.GET.get('cursor'))
+        return page_response(request, 'partials/admin_expense_rows.html', rows, next_cursor)
+        
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+
 # @login_required
 def admin_approvals(request):
     """Approvals management page"""
@@ -411,19 +446,32 @@ def admin_approvals(request):
         messages.error(request, "Access denied. Admin privileges required.")
         return redirect('index')
     
-    # Get all pending approvals
-    approvals = ExpenseApproval.objects.filter(
-        expense__employee__company=company,
-        status='Pending'
-    ).order_by('-created_at')
+    # First page of pending approvals; the rest load on demand
+    approvals, next_cursor = keyset_page(company_pending_approvals(company))
     
     context = {
         'approvals': approvals,
+        'next_cursor': next_cursor,
     }
     
     return render(request, 'admin_approvals.html', context)
 
 
+# @login_required
+def admin_approvals_page(request):
+    """Next page of the pending approvals list for the load-more button"""
+    try:
+        user_data = UserData.objects.get(user=request.user)
+        if user_data.role != 'Admin':
+            return JsonResponse({'success': False, 'error': 'Access denied'})
+        
+        rows, next_cursor = keyset_page(company_pending_approvals(user_data.company), request.GET.get('cursor'))
+        return page_response(request, 'partials/admin_approval_rows.html', rows, next_cursor)
+        
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+
 # @login_required
 def admin_reports(request):
     """Reports page"""
@@ -438,18 +486,25 @@ def admin_reports(request):
         messages.error(request, "Access denied. Admin privileges required.")
         return redirect('index')
     
-    # Get report data
-    expenses_by_category = Expense.objects.filter(
-        employee__company=company
-    ).values('category').annotate(count=Count('id')).order_by('-count')
+    # Grouped from the daily rollups, totals converted to the company currency in the query
+    # Drafts are left out, as in the report API
+    rollups = ExpenseRollup.objects.filter(company=company, status__in=REPORTED_STATUSES).order_by()
+    expenses_by_category = rollups.values('category').annotate(
+        count=Sum('expense_count'),
+        total=Sum(converted_amount(company.currency, date='day')),
+    ).order_by('-count')
+    totals = rollups.annotate(
+        converted=converted_amount(company.currency, date='day')
+    ).aggregate(total=Sum('converted'), unconverted=Sum('expense_count', filter=Q(converted__isnull=True), default=0))
     
-    expenses_by_status = Expense.objects.filter(
-        employee__company=company
-    ).values('status').annotate(count=Count('id')).order_by('-count')
+    expenses_by_status = rollups.values('status').annotate(count=Sum('expense_count')).order_by('-count')
     
     context = {
         'expenses_by_category': expenses_by_category,
         'expenses_by_status': expenses_by_status,
+        'company_currency': company.currency,
+        'total_amount': totals['total'],
+        'unconverted_count': totals['unconverted'],
     }
     
     return render(request, 'admin_reports.html', context)
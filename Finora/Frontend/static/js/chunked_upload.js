@@ -0,0 +1,91 @@
+// Chunked, resumable receipt uploads (see core/uploads.py for the protocol).
+// The upload id is remembered per file, so picking the same file again after
+// a dropped connection continues from the last chunk the server confirmed.
+const UPLOAD_RETRIES = 5;
+
+function uploadStorageKey(file) {
+    return `receipt-upload:${file.name}:${file.size}:${file.lastModified}`;
+}
+
+async function sha256Hex(blob) {
+    const digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+    return Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('');
+}
+
+async function postJson(url, options) {
+    const response = await fetch(url, options);
+    return response.json();
+}
+
+// Resolves with the server's final response (which carries expense_id).
+// options: startUrl, chunkUrl(uploadId), csrfToken, onProgress(sent, total)
+async function uploadInChunks(file, options) {
+    const key = uploadStorageKey(file);
+    let uploadId = localStorage.getItem(key);
+    let state = null;
+
+    if (uploadId) {
+        state = await postJson(options.chunkUrl(uploadId), {}).catch(() => null);
+        if (!state || !state.success || state.complete) {
+            uploadId = null;
+        }
+    }
+    if (!uploadId) {
+        state = await postJson(options.startUrl, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json', 'X-CSRFToken': options.csrfToken},
+            body: JSON.stringify({filename: file.name, size: file.size})
+        });
+        if (!state.success) {
+            throw new Error(state.message);
+        }
+        uploadId = state.upload_id;
+        localStorage.setItem(key, uploadId);
+    }
+
+    const chunkSize = state.chunk_size || 1024 * 1024;
+    let offset = state.offset;
+    let failures = 0;
+    while (true) {
+        const chunk = file.slice(offset, offset + chunkSize);
+        try {
+            const result = await postJson(options.chunkUrl(uploadId), {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/octet-stream',
+                    'X-CSRFToken': options.csrfToken,
+                    'X-Upload-Offset': String(offset),
+                    'X-Chunk-SHA256': await sha256Hex(chunk)
+                },
+                body: chunk
+            });
+            if (!result.success && result.offset === undefined) {
+                throw new Error(result.message);
+            }
+            // On a rejected chunk the server reports where to continue from
+            offset = result.offset;
+            if (result.success) {
+                failures = 0;
+            } else if (++failures > UPLOAD_RETRIES) {
+                throw new Error(result.message);
+            }
+            if (options.onProgress) {
+                options.onProgress(offset, file.size);
+            }
+            if (result.complete) {
+                localStorage.removeItem(key);
+                return result;
+            }
+        } catch (error) {
+            if (++failures > UPLOAD_RETRIES) {
+                throw error;
+            }
+            // Network trouble: back off, then ask the server where it got to
+            await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** failures));
+            const status = await postJson(options.chunkUrl(uploadId), {}).catch(() => null);
+            if (status && status.success) {
+                offset = status.offset;
+            }
+        }
+    }
+}
@@ -0,0 +1,38 @@
+// "Load more" buttons for the cursor-paginated tables.
+// The button carries the page endpoint, the next cursor and the id of the tbody to append to.
+function loadMore(button) {
+    const url = new URL(button.dataset.url, window.location.origin);
+    url.searchParams.set('cursor', button.dataset.cursor);
+    button.disabled = true;
+
+    fetch(url)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                // Admin page endpoints report failures as error, the core ones as message
+                throw new Error(data.error || data.message);
+            }
+            document.getElementById(button.dataset.target).insertAdjacentHTML('beforeend', data.html);
+            if (data.next_cursor) {
+                button.dataset.cursor = data.next_cursor;
+                button.disabled = false;
+            } else {
+                button.parentElement.remove();
+            }
+        })
+        .catch(error => {
+            showLoadError('Error loading more rows: ' + error.message);
+            button.disabled = false;
+        });
+}
+
+// The admin pages load showAlert from admin_scripts.js, the dashboards define showToast
+function showLoadError(message) {
+    if (typeof showAlert === 'function') {
+        showAlert(message, 'danger');
+    } else if (typeof showToast === 'function') {
+        showToast(message, 'error');
+    } else {
+        console.error(message);
+    }
+}
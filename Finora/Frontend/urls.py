@@ -12,7 +12,9 @@ urlpatterns = [
     path(f'{ADMIN_PANEL_PREFIX}users/', admin_views.admin_users, name='admin_users'),
     path(f'{ADMIN_PANEL_PREFIX}approval-rules/', admin_views.admin_approval_rules, name='admin_approval_rules'),
     path(f'{ADMIN_PANEL_PREFIX}expenses/', admin_views.admin_expenses, name='admin_expenses'),
+    path(f'{ADMIN_PANEL_PREFIX}expenses/page/', admin_views.admin_expenses_page, name='admin_expenses_page'),
     path(f'{ADMIN_PANEL_PREFIX}approvals/', admin_views.admin_approvals, name='admin_approvals'),
+    path(f'{ADMIN_PANEL_PREFIX}approvals/page/', admin_views.admin_approvals_page, name='admin_approvals_page'),
     path(f'{ADMIN_PANEL_PREFIX}reports/', admin_views.admin_reports, name='admin_reports'),
     
     # Admin API endpoints
@@ -1,15 +1,43 @@
 from django.contrib import admin
-from .models import Expense, ExpenseApproval, ApprovalRules
+from django.db import transaction
+from .blobs import release_blob, store_receipt
+from .models import Expense, ExpenseApproval, ApprovalRules, ExchangeRate, ReceiptBlob, ReceiptScan, ReceiptText
+from .search import fts_query, matching_ids
+from .similarity import flag_similar_receipt
 
 # Register your models here.
 
 @admin.register(Expense)
 class ExpenseAdmin(admin.ModelAdmin):
     list_display = ('employee', 'description', 'date', 'category', 'amount', 'currency', 'status', 'paid_by', 'created_at')
-    list_filter = ('status', 'category', 'date', 'created_at', 'employee__company')
-    search_fields = ('employee__name', 'employee__email', 'description')
+    list_filter = ('status', 'category', 'date', 'created_at', 'company')
+    # Searched through the full-text index, see get_search_results()
+    search_fields = ('description', 'remarks', 'employee__name')
     list_select_related = ('employee', 'paid_by')
     date_hierarchy = 'date'
+
+    def save_model(self, request, obj, form, change):
+        # Route receipts uploaded here through the blob storage as well
+        if 'receipt' in form.changed_data:
+            previous_blob_id = obj.receipt_blob_id
+            with transaction.atomic():
+                if obj.receipt:
+                    blob = store_receipt(obj.receipt.file)
+                    obj.receipt, obj.receipt_blob = blob.file.name, blob
+                else:
+                    obj.receipt_blob = None
+                super().save_model(request, obj, form, change)
+                if previous_blob_id:
+                    release_blob(previous_blob_id)
+            flag_similar_receipt(obj)
+            return
+        super().save_model(request, obj, form, change)
+
+    def get_search_results(self, request, queryset, search_term):
+        query = fts_query(search_term)
+        if not query:
+            return queryset, False
+        return queryset.filter(id__in=matching_ids(query)), False
     
     fieldsets = (
         ('Expense Details', {
@@ -38,3 +66,27 @@ class ApprovalRulesAdmin(admin.ModelAdmin):
     search_fields = ('employee__name', 'manager__name', 'description')
     filter_horizontal = ('approvers',)
     list_select_related = ('employee', 'manager')
+
+@admin.register(ReceiptScan)
+class ReceiptScanAdmin(admin.ModelAdmin):
+    list_display = ('expense', 'status', 'content_hash', 'error', 'updated_at')
+    list_filter = ('status',)
+    list_select_related = ('expense',)
+    raw_id_fields = ('expense',)
+
+@admin.register(ReceiptText)
+class ReceiptTextAdmin(admin.ModelAdmin):
+    list_display = ('content_hash', 'source', 'merchant', 'amount', 'date', 'created_at')
+    list_filter = ('source',)
+    search_fields = ('content_hash', 'merchant')
+
+@admin.register(ReceiptBlob)
+class ReceiptBlobAdmin(admin.ModelAdmin):
+    list_display = ('digest', 'file', 'size', 'ref_count', 'created_at')
+    readonly_fields = ('digest', 'file', 'original', 'size', 'ref_count', 'created_at')
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ('date', 'base', 'quote', 'rate')
+    list_filter = ('base', 'quote')
+    date_hierarchy = 'date'
@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_migrate, pre_migrate
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from .blobs import release_expense_blob
+        from .rollups import drop_rollup_triggers, install_rollup_triggers
+        from .search import drop_search_triggers, install_search_triggers
+
+        # Table rebuilds during migrate trip over the search and rollup triggers
+        pre_migrate.connect(drop_search_triggers, sender=self)
+        pre_migrate.connect(drop_rollup_triggers, sender=self)
+        post_migrate.connect(install_search_triggers, sender=self)
+        post_migrate.connect(install_rollup_triggers, sender=self)
+        # Also fires for queryset and cascade deletes, unlike Expense.delete()
+        post_delete.connect(release_expense_blob, sender=self.get_model('Expense'))
@@ -0,0 +1,174 @@
+"""Batch receipt uploads: a ZIP archive or several files in one request.
+
+The archive stays where Django spooled it; each worker opens it on its
+own and streams one member to a temporary file, so the archive is never
+read into memory. The per-file work (type check, normalisation, hashing,
+thumbnail and perceptual hash) runs on a thread pool, since Pillow, zlib
+and hashlib all release the GIL. The receipts are then stored as blobs
+and all the draft expenses and their OCR jobs are created with one
+``bulk_create`` each.
+"""
+import hashlib
+import io
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+from .blobs import store_receipt
+from .derivatives import derivative_name, render_derivative
+from .images import normalize_receipt
+from .models import Expense, ReceiptBlob, ReceiptScan
+from .ocr import ExtractionError
+from .scans import draft_expense
+from .similarity import dhash, flag_similar_receipt
+from .uploads import MAX_UPLOAD_SIZE, READ_SIZE, RECEIPT_SIGNATURES
+
+MAX_BATCH_FILES = 100
+BATCH_WORKERS = min(8, os.cpu_count() or 1)
+
+
+class BatchError(Exception):
+    """Raised when a batch as a whole is rejected."""
+
+
+def archive_members(path):
+    """The receipt entries of a ZIP archive, skipping folders and the
+    metadata files macOS and Windows add."""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            members = [
+                info for info in archive.infolist()
+                if not info.is_dir()
+                and not info.filename.startswith('__MACOSX/')
+                and not os.path.basename(info.filename).startswith('.')
+                and os.path.basename(info.filename).lower() != 'thumbs.db'
+            ]
+    except zipfile.BadZipFile:
+        raise BatchError('The archive is not a valid ZIP file')
+    if len(members) > MAX_BATCH_FILES:
+        raise BatchError(f'Archives may hold at most {MAX_BATCH_FILES} receipts')
+    return members
+
+
+def extract_member(path, info):
+    """Stream one archive member to a temporary file, refusing oversized
+    entries whatever size the archive claims for them."""
+    if info.file_size > MAX_UPLOAD_SIZE:
+        raise ValueError('File too large')
+    spooled = tempfile.TemporaryFile()
+    with zipfile.ZipFile(path) as archive, archive.open(info) as member:
+        written = 0
+        for data in iter(lambda: member.read(READ_SIZE), b''):
+            written += len(data)
+            if written > MAX_UPLOAD_SIZE:
+                spooled.close()
+                raise ValueError('File too large')
+            spooled.write(data)
+    spooled.seek(0)
+    return File(spooled, name=os.path.basename(info.filename))
+
+
+def prepare_receipt(filename, load):
+    """Validate, normalise and hash one receipt. ``load`` returns it as a File.
+
+    Returns a dict with ``filename`` and either ``error`` or the ``file``
+    to store, the ``original`` upload and its perceptual hash ``phash``.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in RECEIPT_SIGNATURES:
+        return {'filename': filename, 'error': 'Invalid file type. Please upload PDF, JPG, JPEG, or PNG files only.'}
+    file = original = None
+    try:
+        file = original = load()
+        if not 0 < file.size <= MAX_UPLOAD_SIZE:
+            raise ValueError('File is empty or too large')
+        file.seek(0)
+        if not file.read(len(RECEIPT_SIGNATURES[extension])) == RECEIPT_SIGNATURES[extension]:
+            raise ValueError('The file content does not match its type')
+        file.seek(0)
+
+        file = normalize_receipt(file)
+        hasher = hashlib.sha256()
+        content = io.BytesIO()
+        for chunk in file.chunks():
+            hasher.update(chunk)
+            content.write(chunk)
+        file.seek(0)
+        file.sha256 = hasher.hexdigest()
+    except (OSError, ValueError, zipfile.BadZipFile) as e:
+        for opened in {file, original} - {None}:
+            opened.close()
+        return {'filename': filename, 'error': str(e)}
+
+    # Render the thumbnail now, the perceptual hash is taken from it
+    phash = ''
+    try:
+        thumbnail = render_derivative(content.getvalue(), os.path.splitext(file.name)[1].lower(), 'thumbnail')
+        name = derivative_name(file.sha256, 'thumbnail')
+        if not default_storage.exists(name):
+            default_storage.save(name, ContentFile(thumbnail))
+        phash = dhash(Image.open(io.BytesIO(thumbnail)))
+    except (OSError, ValueError, ExtractionError, Image.DecompressionBombError):
+        pass
+    return {'filename': filename, 'file': file, 'original': original, 'phash': phash}
+
+
+def prepare_batch(archive=None, files=(), workers=BATCH_WORKERS):
+    """Prepare every receipt of a ZIP archive (an uploaded file on disk)
+    and of ``files`` on a pool of ``workers`` threads, in upload order."""
+    jobs = []
+    if archive is not None:
+        path = archive.temporary_file_path()
+        for info in archive_members(path):
+            jobs.append((os.path.basename(info.filename), lambda info=info: extract_member(path, info)))
+    for file in files:
+        jobs.append((file.name, lambda file=file: file))
+    if not jobs:
+        raise BatchError('No receipts found in the upload')
+    if len(jobs) > MAX_BATCH_FILES:
+        raise BatchError(f'Upload at most {MAX_BATCH_FILES} receipts at once')
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda job: prepare_receipt(*job), jobs))
+
+
+def create_batch_expenses(employee, prepared):
+    """Store the prepared receipts and create their draft expenses and OCR
+    jobs in bulk. Returns one status dict per receipt."""
+    with transaction.atomic():
+        expenses = []
+        for item in prepared:
+            if 'error' in item:
+                continue
+            blob = store_receipt(item['file'], original=item['original'])
+            if item['phash'] and not blob.phash:
+                ReceiptBlob.objects.filter(pk=blob.pk).update(phash=item['phash'])
+                blob.phash = item['phash']
+            item['expense'] = draft_expense(employee, item['filename'], blob)
+            expenses.append(item['expense'])
+
+        Expense.objects.bulk_create(expenses)
+        ReceiptScan.objects.bulk_create([ReceiptScan(expense=expense) for expense in expenses])
+
+    statuses = []
+    for item in prepared:
+        if 'error' in item:
+            statuses.append({'filename': item['filename'], 'success': False, 'message': item['error']})
+            continue
+        item['file'].close()
+        item['original'].close()
+        expense = item['expense']
+        statuses.append({
+            'filename': item['filename'],
+            'success': True,
+            'expense_id': expense.id,
+            'similar_receipt_id': flag_similar_receipt(expense),
+        })
+    return statuses
@@ -0,0 +1,106 @@
+"""Content-addressed receipt storage.
+
+Uploads are hashed while Django spools them to disk (HashingUploadHandler)
+and stored once per content under their SHA-256 digest, so storing a
+receipt that is already on file is a primary-key lookup and no write.
+Expenses point at their ReceiptBlob and ``Expense.receipt`` names the
+blob's file, so receipt URLs keep working unchanged.
+
+Reference counts are kept with F() updates: store_receipt() adds one and
+deleting an expense (however it is deleted) removes one.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .images import normalize_receipt
+from .models import ReceiptBlob
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """Spools uploads to a temporary file, hashing the stream as it is written.
+
+    The file it returns carries the digest as ``sha256``, and because it
+    is already on disk the storage moves it into place instead of copying.
+    Install it before ``request.FILES`` is first read.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.digest.hexdigest()
+        return file
+
+
+def file_digest(file):
+    """SHA-256 of an uploaded file, hashing it now unless the upload handler already did"""
+    digest = getattr(file, 'sha256', None)
+    if digest is None:
+        hasher = hashlib.sha256()
+        for chunk in file.chunks():
+            hasher.update(chunk)
+        file.seek(0)
+        digest = hasher.hexdigest()
+    return digest
+
+
+def add_reference(digest):
+    """Count one more expense on the blob; False if it no longer exists"""
+    return bool(ReceiptBlob.objects.filter(pk=digest).update(ref_count=F('ref_count') + 1))
+
+
+def release_blob(digest):
+    ReceiptBlob.objects.filter(pk=digest, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+
+
+def store_receipt(file, original=None):
+    """Return the ReceiptBlob holding ``file``'s content, with one more reference.
+
+    Photos are normalised first (see core.images), so the blob holds the
+    re-encoded image; pass the upload as ``original`` when ``file`` was
+    normalised already. The file is only written when its content is not
+    stored yet. Call it in the transaction that saves the referencing expense.
+    """
+    if original is None:
+        original, file = file, normalize_receipt(file)
+    digest = file_digest(file)
+    if add_reference(digest):
+        return ReceiptBlob.objects.get(pk=digest)
+
+    blob = ReceiptBlob(digest=digest, size=file.size, ref_count=1)
+    name = blob.file.field.generate_filename(blob, file.name)
+    if blob.file.storage.exists(name):
+        # Left behind by an earlier upload of this content whose row was never saved
+        blob.file.name = name
+    else:
+        blob.file.save(file.name, file, save=False)
+    if file is not original and settings.RECEIPT_KEEP_ORIGINALS:
+        blob.original.save(original.name, original, save=False)
+    try:
+        with transaction.atomic():
+            blob.save(force_insert=True)
+    except IntegrityError:
+        # A concurrent upload stored the same content first
+        if blob.file.name != name:
+            blob.file.delete(save=False)
+        if blob.original:
+            blob.original.delete(save=False)
+        add_reference(digest)
+        blob = ReceiptBlob.objects.get(pk=digest)
+    return blob
+
+
+def release_expense_blob(sender, instance, **kwargs):
+    """post_delete handler for Expense"""
+    if instance.receipt_blob_id:
+        release_blob(instance.receipt_blob_id)
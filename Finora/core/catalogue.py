@@ -0,0 +1,67 @@
+"""Country and currency catalogue for the signup and expense forms.
+
+The dataset ships with the code in ``core/data/countries.json`` (ISO 3166
+countries with their ISO 4217 currencies), so the forms no longer call a
+third-party API on every page load and keep working offline. It is read
+once per process. The response is built the same way each time, so its
+ETag is the dataset digest plus the codes listed first for the user's
+company: the company currency, then the currencies of its recent expenses.
+"""
+import hashlib
+import json
+import os
+from collections import Counter
+from functools import lru_cache
+
+from .models import Expense
+
+CATALOGUE_PATH = os.path.join(os.path.dirname(__file__), 'data', 'countries.json')
+# How many of the company's latest expenses suggest its usual currencies
+RECENT_EXPENSES = 500
+
+
+@lru_cache(maxsize=None)
+def load_catalogue():
+    """``(data, digest)`` of the bundled dataset"""
+    with open(CATALOGUE_PATH, 'rb') as source:
+        content = source.read()
+    return json.loads(content), hashlib.sha256(content).hexdigest()
+
+
+def preferred_currencies(company):
+    """The company currency, then the ones its latest expenses were filed in, most used first"""
+    if company is None:
+        return []
+    recent = Expense.objects.filter(company=company).order_by('-id').values_list('currency', flat=True)
+    counts = Counter(code.strip().upper() for code in recent[:RECENT_EXPENSES] if code)
+    preferred = [company.currency.strip().upper()] if company.currency else []
+    preferred += [code for code, _ in counts.most_common() if code not in preferred]
+    currencies = load_catalogue()[0]['currencies']
+    return [code for code in preferred if code in currencies]
+
+
+def catalogue_etag(preferred):
+    digest = load_catalogue()[1]
+    return hashlib.md5(f"{digest}:{','.join(preferred)}".encode(), usedforsecurity=False).hexdigest()
+
+
+def catalogue(preferred):
+    """Currencies (``preferred`` first, then by code) and countries (by name)"""
+    data = load_catalogue()[0]
+    countries_by_currency = {}
+    for country in data['countries']:
+        for code in country['currencies']:
+            countries_by_currency.setdefault(code, []).append(country['name'])
+    rank = {code: position for position, code in enumerate(preferred)}
+    codes = sorted(data['currencies'], key=lambda code: (rank.get(code, len(rank)), code))
+    return {
+        'preferred': preferred,
+        'currencies': [
+            {'code': code, **data['currencies'][code], 'countries': countries_by_currency.get(code, [])}
+            for code in codes
+        ],
+        'countries': [
+            {'code': country['code'], 'name': country['name'], 'currency': country['currencies'][0]}
+            for country in data['countries']
+        ],
+    }
@@ -0,0 +1,69 @@
+"""Conditional GET for the expense modal endpoints.
+
+The validators come from one aggregate query over the expense, its
+approvals and every row the payloads show (the employee and their
+company, the approvers, the expense with a similar receipt), so an
+unchanged expense is answered with 304 Not Modified without building the
+payload. Every write path bumps ``updated_at`` on one of those rows, and
+the approval count covers deletions.
+"""
+import hashlib
+
+from django.db.models import Count, Exists, Max, OuterRef, Q
+from django.views.decorators.http import condition
+
+from .models import Expense, ExpenseApproval
+
+
+# Rows whose fields end up in the expense payloads, relative to the expense (itself first)
+VERSIONED_PATHS = (
+    '',
+    'approvals__',
+    'approvals__approver__',
+    'employee__',
+    'employee__company__',
+    'similar_receipt__',
+    'similar_receipt__employee__',
+)
+
+
+def own_expenses(request):
+    """Expenses the user submitted"""
+    return Q(employee__user=request.user)
+
+
+def expenses_to_approve(request):
+    """Expenses the user is (or was) asked to approve"""
+    return Q(Exists(ExpenseApproval.objects.filter(expense=OuterRef('pk'), approver__user=request.user)))
+
+
+def expense_validators(request, expense_id, scope):
+    """Return ``(etag, last_modified)`` for an expense visible through
+    ``scope``, or ``(None, None)`` so the view runs and reports the error.
+
+    Cached on the request because condition() asks for each validator separately.
+    """
+    if not hasattr(request, '_expense_validators'):
+        state = Expense.objects.filter(scope(request), pk=expense_id).aggregate(
+            approval_count=Count('approvals'),
+            **{f'version_{index}': Max(f'{path}updated_at') for index, path in enumerate(VERSIONED_PATHS)},
+        )
+        validators = (None, None)
+        if state['version_0'] is not None:
+            versions = [state[f'version_{index}'] for index in range(len(VERSIONED_PATHS))]
+            version = ':'.join([str(expense_id), str(state['approval_count']), *map(str, versions)])
+            etag = f'W/"{hashlib.md5(version.encode(), usedforsecurity=False).hexdigest()}"'
+            validators = (etag, max(filter(None, versions)))
+        request._expense_validators = validators
+    return request._expense_validators
+
+
+def expense_condition(scope):
+    """Decorator adding ETag/Last-Modified handling to a view taking ``expense_id``"""
+    def etag(request, expense_id):
+        return expense_validators(request, expense_id, scope)[0]
+
+    def last_modified(request, expense_id):
+        return expense_validators(request, expense_id, scope)[1]
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
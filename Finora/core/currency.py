@@ -0,0 +1,134 @@
+"""Conversion of expense amounts to the company's currency.
+
+Rates come from the ExchangeRate table (``manage.py load_exchange_rates``)
+and an amount is converted at the latest rate on or before its date,
+falling back to the inverse of the opposite pair. Totals are converted
+in SQL: ``converted_amount()`` is an expression with one indexed rate
+lookup per row, so reports aggregate thousands of expenses in one query.
+Single amounts shown in the UI go through ``convert()``, which keeps the
+rates it looked up in a bounded in-process LRU cache. Entries expire after
+RATE_CACHE_TTL seconds, so every process picks up newly loaded rates.
+"""
+import threading
+import time
+from collections import OrderedDict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import (
+    Case, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Value, When,
+)
+from django.db.models.functions import Coalesce, Round, Upper
+from django.db.models.lookups import Exact
+
+from .models import ExchangeRate
+
+RATE_CACHE_SIZE = 4096
+RATE_CACHE_TTL = 300
+AMOUNT_FIELD = DecimalField(max_digits=20, decimal_places=2)
+RATE_FIELD = DecimalField(max_digits=20, decimal_places=10)
+
+
+class RateCache:
+    """Least-recently-used cache of rate lookups, each kept for ``ttl``
+    seconds. Missing rates are not cached, so rates loaded later are picked up."""
+
+    def __init__(self, size=RATE_CACHE_SIZE, ttl=RATE_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.rates = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            rate, expires = self.rates.get(key, (None, 0))
+            if rate is None:
+                return None
+            if expires <= time.monotonic():
+                del self.rates[key]
+                return None
+            self.rates.move_to_end(key)
+            return rate
+
+    def set(self, key, rate):
+        with self.lock:
+            self.rates[key] = (rate, time.monotonic() + self.ttl)
+            self.rates.move_to_end(key)
+            while len(self.rates) > self.size:
+                self.rates.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.rates.clear()
+
+
+rate_cache = RateCache()
+
+
+def latest_rate(base, quote, on):
+    return ExchangeRate.objects.filter(base=base, quote=quote, date__lte=on).order_by('-date').values('rate')[:1]
+
+
+def get_rate(base, quote, on):
+    """Units of ``quote`` per unit of ``base`` on date ``on``, or None"""
+    base, quote = base.strip().upper(), quote.strip().upper()
+    if base == quote:
+        return Decimal(1)
+    key = (base, quote, on)
+    rate = rate_cache.get(key)
+    if rate is None:
+        rate = latest_rate(base, quote, on).values_list('rate', flat=True).first()
+        if rate is None:
+            inverse = latest_rate(quote, base, on).values_list('rate', flat=True).first()
+            rate = 1 / inverse if inverse else None
+        if rate is not None:
+            rate_cache.set(key, rate)
+    return rate
+
+
+def convert(amount, currency, to, on):
+    """``amount`` in ``currency`` expressed in ``to``, or None without a rate"""
+    rate = get_rate(currency, to, on)
+    return None if rate is None else (amount * rate).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def converted_amount(to, amount='amount', currency='currency', date='date'):
+    """Expression converting each row's amount to currency ``to``; NULL
+    where no rate is known. Field names are relative to the queryset's model."""
+    to = to.strip().upper()
+    code = Upper(OuterRef(currency))
+    rate = Case(
+        When(Exact(Upper(currency), Value(to)), then=Value(Decimal(1))),
+        default=Coalesce(
+            Subquery(latest_rate(code, to, OuterRef(date)), output_field=RATE_FIELD),
+            # A real numerator: SQLite stores whole-number rates as integers and divides them as such
+            ExpressionWrapper(
+                Value(1.0) / Subquery(latest_rate(to, code, OuterRef(date)), output_field=RATE_FIELD),
+                output_field=RATE_FIELD,
+            ),
+        ),
+        output_field=RATE_FIELD,
+    )
+    # Rounded per row like convert(), so totals add up the amounts shown
+    return Round(ExpressionWrapper(F(amount) * rate, output_field=AMOUNT_FIELD), 2, output_field=AMOUNT_FIELD)
+
+
+def load_rates(rows, batch_size=1000):
+    """Insert or update ``(date, base, quote, rate)`` rows. Returns the row count."""
+    loaded = 0
+    batch = []
+    for date, base, quote, rate in rows:
+        batch.append(ExchangeRate(date=date, base=base.strip().upper(), quote=quote.strip().upper(), rate=rate))
+        if len(batch) >= batch_size:
+            loaded += upsert_rates(batch)
+            batch = []
+    if batch:
+        loaded += upsert_rates(batch)
+    rate_cache.clear()
+    return loaded
+
+
+def upsert_rates(rates):
+    ExchangeRate.objects.bulk_create(
+        rates, update_conflicts=True, unique_fields=['base', 'quote', 'date'], update_fields=['rate']
+    )
+    return len(rates)
@@ -0,0 +1,103 @@
+"""Thumbnail and preview images of receipts.
+
+Derivatives are rendered with Pillow the first time they are asked for
+and cached in the default storage, keyed by the receipt's blob digest and
+the size. A receipt's content never changes under its digest, so the
+URLs carry the digest and the images are served as immutable.
+"""
+import hashlib
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+from .ocr import ExtractionError, open_pdf, page_image
+
+# Longest side in pixels
+DERIVATIVE_SIZES = {
+    'thumbnail': 240,
+    'preview': 1200,
+}
+DERIVATIVE_QUALITY = 80
+DERIVATIVE_MAX_AGE = 60 * 60 * 24 * 365
+DERIVATIVE_ROOT = 'receipts/derivatives'
+
+
+def receipt_key(expense):
+    """Cache key of an expense's receipt: its blob digest, or for receipts
+    stored before blob storage a hash of the file name"""
+    return expense.receipt_blob_id or hashlib.sha256(expense.receipt.name.encode()).hexdigest()
+
+
+def derivative_name(key, size):
+    return f'{DERIVATIVE_ROOT}/{key[:2]}/{key}/{size}.jpg'
+
+
+def derivative_url(expense, size):
+    if not expense.receipt:
+        return None
+    url = reverse('core:receipt_derivative', args=[expense.id, size])
+    return f'{url}?v={receipt_key(expense)[:16]}'
+
+
+def render_pdf_text(page):
+    """Draw the text layer of a PDF page without a scan on a blank page"""
+    width, height = float(page.mediabox.width), float(page.mediabox.height)
+    canvas = Image.new('L', (DERIVATIVE_SIZES['preview'], int(DERIVATIVE_SIZES['preview'] * height / width)), 255)
+    draw = ImageDraw.Draw(canvas)
+    font = ImageFont.load_default(size=max(canvas.width // 50, 10))
+    line_height = font.size * 1.4
+    margin = canvas.width // 12
+    for number, line in enumerate((page.extract_text() or '').splitlines()):
+        top = margin + number * line_height
+        if top > canvas.height - margin:
+            break
+        draw.text((margin, top), line, fill=0, font=font)
+    return canvas
+
+
+def first_page(content, extension):
+    """The receipt as an image: the photo itself, or page 1 of a PDF"""
+    if extension != '.pdf':
+        image = Image.open(io.BytesIO(content))
+        return ImageOps.exif_transpose(image)
+
+    reader = open_pdf(content)
+    if not reader.pages:
+        raise ExtractionError('The PDF has no pages')
+    try:
+        return page_image(reader.pages[0]) or render_pdf_text(reader.pages[0])
+    except ExtractionError:
+        return render_pdf_text(reader.pages[0])
+
+
+def render_derivative(content, extension, size):
+    image = first_page(content, extension)
+    image.thumbnail((DERIVATIVE_SIZES[size], DERIVATIVE_SIZES[size]))
+    if image.mode not in ('RGB', 'L'):
+        # Flatten transparency onto white, JPEG has no alpha
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.convert('RGBA').getchannel('A'))
+        image = background
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=DERIVATIVE_QUALITY, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def get_derivative(expense, size):
+    """Storage name of the derivative, rendering and caching it on first use"""
+    name = derivative_name(receipt_key(expense), size)
+    if not default_storage.exists(name):
+        with expense.receipt.open('rb') as receipt:
+            content = receipt.read()
+        extension = os.path.splitext(expense.receipt.name)[1].lower()
+        default_storage.save(name, ContentFile(render_derivative(content, extension, size)))
+    return name
+
+
+def delete_derivatives(key):
+    for size in DERIVATIVE_SIZES:
+        default_storage.delete(derivative_name(key, size))
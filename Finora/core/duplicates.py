@@ -0,0 +1,46 @@
+"""Duplicate expense detection.
+
+Two expenses are the same claim when their employee, amount, currency,
+date and category match once normalised. ``Expense.fingerprint`` holds
+that key's digest (see ``models.expense_fingerprint``) and the
+(company, fingerprint) index answers the check on insert with a single
+index lookup. Each company's ``duplicate_policy`` decides whether a
+duplicate is only reported back to the employee or refused.
+"""
+from .models import Expense
+
+
+class DuplicateExpenseError(Exception):
+    """Raised when the company refuses duplicate expenses and one was filed."""
+
+    def __init__(self, duplicate_ids):
+        self.duplicate_ids = duplicate_ids
+        super().__init__(
+            'This expense duplicates expense ' + ', '.join(f'#{pk}' for pk in duplicate_ids)
+            + ' already on file'
+        )
+
+
+def duplicate_ids(expense):
+    """Ids of the other, not rejected, expenses filed for the same claim"""
+    fingerprint = expense.compute_fingerprint()
+    if not fingerprint:
+        return []
+    company_id = expense.company_id or expense.employee.company_id
+    duplicates = Expense.objects.filter(company_id=company_id, fingerprint=fingerprint)
+    if expense.pk:
+        duplicates = duplicates.exclude(pk=expense.pk)
+    return list(duplicates.exclude(status='Rejected').order_by('id').values_list('id', flat=True))
+
+
+def check_duplicates(expense):
+    """Return the duplicates of ``expense``, raising DuplicateExpenseError
+    instead when its company blocks duplicates."""
+    duplicates = duplicate_ids(expense)
+    if duplicates and expense.employee.company.duplicate_policy == 'block':
+        raise DuplicateExpenseError(duplicates)
+    return duplicates
+
+
+def duplicate_warning(duplicates):
+    return 'It matches expense ' + ', '.join(f'#{pk}' for pk in duplicates) + ', please check it is not a duplicate.'
@@ -0,0 +1,142 @@
+"""Server-side filtering and faceted counts for the expense query endpoints.
+
+Facets are disjunctive: the status counts ignore the status filter and the
+category counts ignore the category filter, so the sidebar can show how
+many rows each option would add. Both come out of one GROUP BY
+(status, category) query over the rows matching every other filter.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Count
+from django.utils.dateparse import parse_date
+
+from .models import Expense
+from .search import fts_query, matching_ids
+
+
+class FilterError(ValueError):
+    """Raised when a filter parameter cannot be parsed."""
+
+
+def parse_expense_filters(params):
+    """Turn query parameters into ``(lookups, statuses, categories)``.
+
+    ``lookups`` holds the non-facet filters (date, amount and currency
+    ranges); the facet filters are returned as lists so the caller can
+    apply them after counting.
+    """
+    lookups = {}
+
+    for param, lookup in (('date_from', 'date__gte'), ('date_to', 'date__lte')):
+        if params.get(param):
+            value = parse_date(params[param])
+            if value is None:
+                raise FilterError(f'Invalid {param}, expected YYYY-MM-DD')
+            lookups[lookup] = value
+
+    for param, lookup in (('amount_min', 'amount__gte'), ('amount_max', 'amount__lte')):
+        if params.get(param):
+            try:
+                lookups[lookup] = Decimal(params[param])
+            except InvalidOperation:
+                raise FilterError(f'Invalid {param}, expected a number')
+
+    if params.get('currency'):
+        lookups['currency'] = params['currency'].upper()
+
+    statuses = [status for status in params.getlist('status') if status]
+    categories = [category for category in params.getlist('category') if category]
+    valid_statuses = {choice for choice, _ in Expense.STATUS_CHOICES}
+    valid_categories = {choice for choice, _ in Expense.CATEGORY_CHOICES}
+    if not set(statuses) <= valid_statuses:
+        raise FilterError('Invalid status filter')
+    if not set(categories) <= valid_categories:
+        raise FilterError('Invalid category filter')
+
+    return lookups, statuses, categories
+
+
+def facet_counts(queryset, statuses, categories):
+    """Count rows per status and per category with a single aggregate query.
+
+    Returns ``(facets, total)`` where ``total`` is the number of rows that
+    match both facet filters.
+    """
+    facets = {
+        'status': dict.fromkeys((choice for choice, _ in Expense.STATUS_CHOICES), 0),
+        'category': dict.fromkeys((choice for choice, _ in Expense.CATEGORY_CHOICES), 0),
+    }
+    total = 0
+    groups = queryset.order_by().values('status', 'category').annotate(count=Count('id'))
+    for group in groups:
+        status_selected = not statuses or group['status'] in statuses
+        category_selected = not categories or group['category'] in categories
+        if category_selected:
+            facets['status'][group['status']] = facets['status'].get(group['status'], 0) + group['count']
+        if status_selected:
+            facets['category'][group['category']] = facets['category'].get(group['category'], 0) + group['count']
+        if status_selected and category_selected:
+            total += group['count']
+    return facets, total
+
+
+def filter_employee(queryset, params):
+    """``queryset`` narrowed to the expenses of the ``employee`` parameter, if given"""
+    if not params.get('employee'):
+        return queryset
+    try:
+        employee_id = int(params['employee'])
+    except ValueError:
+        raise FilterError('Invalid employee, expected an id')
+    return queryset.filter(employee_id=employee_id)
+
+
+def prefilter_expenses(queryset, params):
+    """Apply the non-facet filters and the ``q`` full-text search.
+    Returns ``(queryset, statuses, categories)``."""
+    lookups, statuses, categories = parse_expense_filters(params)
+    queryset = queryset.filter(**lookups)
+    search = fts_query(params.get('q', ''))
+    if search:
+        queryset = queryset.filter(id__in=matching_ids(search))
+    return queryset, statuses, categories
+
+
+def apply_facets(queryset, statuses, categories):
+    if statuses:
+        queryset = queryset.filter(status__in=statuses)
+    if categories:
+        queryset = queryset.filter(category__in=categories)
+    return queryset
+
+
+def filter_expenses(queryset, params):
+    """Apply the query parameters to ``queryset``.
+
+    ``q`` narrows the rows to full-text matches before anything is
+    counted. Returns ``(filtered_queryset, facets, total)``.
+    """
+    queryset, statuses, categories = prefilter_expenses(queryset, params)
+    facets, total = facet_counts(queryset, statuses, categories)
+    return apply_facets(queryset, statuses, categories), facets, total
+
+
+def filtered_expenses(queryset, params):
+    """``queryset`` narrowed by the same parameters, without the facet counts"""
+    return apply_facets(*prefilter_expenses(queryset, params))
+
+
+def expense_summary(expense):
+    """Row data returned by the query endpoints"""
+    return {
+        'id': expense.id,
+        'employee': expense.employee.name,
+        'description': expense.description,
+        'date': expense.date.strftime('%Y-%m-%d'),
+        'category': expense.category,
+        'amount': float(expense.amount),
+        'currency': expense.currency,
+        'status': expense.status,
+        'has_receipt': bool(expense.receipt),
+        'created_at': expense.created_at.strftime('%Y-%m-%d %H:%M'),
+    }
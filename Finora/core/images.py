@@ -0,0 +1,73 @@
+"""Normalisation of receipt photos at upload.
+
+Phone photos arrive as 4-12 MB JPEG or PNG files carrying EXIF data (GPS
+position included) and an orientation flag. normalize_receipt() turns
+them upright, drops the metadata, caps the longest side at
+``settings.RECEIPT_MAX_SIDE`` and re-encodes them as JPEG at
+``settings.RECEIPT_JPEG_QUALITY``. PDFs, and images Pillow cannot read,
+are stored as sent.
+"""
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+# Metadata Pillow keeps in ``image.info`` that has no place on a receipt
+METADATA_KEYS = {'exif', 'xmp', 'icc_profile', 'photoshop', 'comment'}
+
+
+def needs_normalizing(image):
+    return (
+        image.format != 'JPEG'
+        or max(image.size) > settings.RECEIPT_MAX_SIDE
+        or bool(METADATA_KEYS & image.info.keys())
+        or image.mode not in ('RGB', 'L')
+    )
+
+
+def normalize_image(image):
+    """Upright, metadata-free RGB (or grayscale) copy no larger than RECEIPT_MAX_SIDE"""
+    max_side = settings.RECEIPT_MAX_SIDE
+    # Let the JPEG decoder scale down by a power of two instead of decoding every pixel
+    image.draft('RGB', (max_side, max_side))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P', 'PA'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    return image
+
+
+def normalize_receipt(file):
+    """Return the file to store for an uploaded receipt: a re-encoded JPEG
+    for photos that need it, otherwise ``file`` itself."""
+    stem, extension = os.path.splitext(os.path.basename(file.name))
+    if extension.lower() not in IMAGE_EXTENSIONS:
+        return file
+
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            if not needs_normalizing(image):
+                return file
+            # Only worth keeping when the metadata or resolution had to go
+            # or the re-encode is smaller (PNG screenshots often are not)
+            must_change = max(image.size) > settings.RECEIPT_MAX_SIDE or bool(METADATA_KEYS & image.info.keys())
+            normalized = normalize_image(image)
+            output = io.BytesIO()
+            normalized.save(output, 'JPEG', quality=settings.RECEIPT_JPEG_QUALITY, optimize=True)
+            if not must_change and output.tell() >= file.size:
+                return file
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return file
+    finally:
+        file.seek(0)
+
+    return ContentFile(output.getvalue(), name=f'{stem}.jpg')
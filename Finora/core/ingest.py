@@ -0,0 +1,172 @@
+"""Batch expense ingestion for card feeds and offline clients.
+
+A sync posts many expenses at once, each carrying a client-chosen
+idempotency key. Keys the employee has already used are looked up in one
+query on the (employee, idempotency_key) unique index and reported back
+with the expense they created, so a retried sync files nothing twice.
+The new expenses are validated together, checked against the company's
+duplicate policy with one fingerprint query, and inserted with a single
+``bulk_create``. Every item gets its own result.
+"""
+from datetime import date as Date
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+
+from .duplicates import DuplicateExpenseError
+from .models import Expense
+from .routing import submit_expenses
+
+MAX_BATCH_EXPENSES = 500
+KEY_MAX_LENGTH = Expense._meta.get_field('idempotency_key').max_length
+AMOUNT_LIMIT = Decimal('99999999.99')
+CATEGORIES = {choice for choice, _ in Expense.CATEGORY_CHOICES}
+
+
+class IngestError(ValueError):
+    """Raised when a batch as a whole is rejected."""
+
+
+def parse_item(data):
+    """Validate one item. Returns ``(fields, errors)``."""
+    if not isinstance(data, dict):
+        return None, ['Each expense must be an object']
+    errors = []
+    key = data.get('idempotency_key')
+    if not isinstance(key, str) or not key.strip() or len(key.strip()) > KEY_MAX_LENGTH:
+        errors.append(f'An idempotency_key of at most {KEY_MAX_LENGTH} characters is required')
+        key = None
+
+    description = str(data.get('description') or '').strip()
+    if not description:
+        errors.append('A description is required')
+    try:
+        date = Date.fromisoformat(str(data.get('date')))
+    except ValueError:
+        errors.append('Invalid date, expected YYYY-MM-DD')
+        date = None
+    category = str(data.get('category') or 'Other')
+    if category not in CATEGORIES:
+        errors.append('Invalid category')
+    try:
+        amount = Decimal(str(data.get('amount')))
+        if not 0 < amount <= AMOUNT_LIMIT or amount.as_tuple().exponent < -2:
+            raise InvalidOperation
+    except InvalidOperation:
+        errors.append('The amount must be a positive number with at most two decimals')
+        amount = None
+    currency = str(data.get('currency') or 'INR').strip().upper()
+    if not currency.isalpha() or len(currency) != 3:
+        errors.append('Invalid currency, expected a three-letter code')
+
+    fields = {
+        'idempotency_key': key.strip() if key else None,
+        'description': description,
+        'date': date,
+        'category': category,
+        'amount': amount,
+        'currency': currency,
+        'remarks': str(data.get('remarks') or ''),
+    }
+    return fields, errors
+
+
+def ingest_expenses(employee, items, submit=False):
+    """File the new items of a sync for ``employee``.
+
+    Returns one result per item, in order, with its ``status``:
+    ``created`` (with ``expense_id`` and any ``duplicate_ids``),
+    ``existing`` for keys already used (with the ``expense_id`` they
+    created), or ``rejected`` (with ``errors``). With ``submit``, created
+    expenses are routed to their approvers and ``submit_error`` explains
+    the ones left as drafts.
+    """
+    if not isinstance(items, list) or not items:
+        raise IngestError('Send a non-empty list of expenses')
+    if len(items) > MAX_BATCH_EXPENSES:
+        raise IngestError(f'Send at most {MAX_BATCH_EXPENSES} expenses at once')
+    try:
+        return _ingest(employee, items, submit)
+    except IntegrityError:
+        # A concurrent retry of the same sync used some of the keys first;
+        # they are reported as existing on the second pass
+        pass
+    try:
+        return _ingest(employee, items, submit)
+    except IntegrityError:
+        raise IngestError('Another request is filing the same expenses, please retry')
+
+
+def used_keys(employee, keys):
+    """``{key: expense_id}`` for the ``keys`` the employee has already used"""
+    return dict(Expense.objects.filter(
+        employee=employee, idempotency_key__in=keys
+    ).order_by().values_list('idempotency_key', 'id'))
+
+
+def _ingest(employee, items, submit):
+    parsed = [parse_item(item) for item in items]
+    existing = used_keys(employee, {fields['idempotency_key'] for fields, _ in parsed
+                                    if fields and fields['idempotency_key']})
+
+    results = []
+    new = []
+    seen = set()
+    for index, (fields, errors) in enumerate(parsed):
+        key = fields['idempotency_key'] if fields else None
+        result = {'index': index, 'idempotency_key': key}
+        results.append(result)
+        if key in existing:
+            result.update(status='existing', expense_id=existing[key])
+            continue
+        if key in seen:
+            errors = [*errors, 'The idempotency_key is repeated in this batch']
+        if errors:
+            result.update(status='rejected', errors=errors)
+            continue
+        seen.add(key)
+        expense = Expense(employee=employee, company_id=employee.company_id, status='Draft', **fields)
+        expense.fingerprint = expense.compute_fingerprint()
+        new.append((result, expense))
+
+    # Claims already on file, one indexed query for the whole batch
+    on_file = {}
+    for pk, fingerprint in Expense.objects.filter(
+        company_id=employee.company_id, fingerprint__in={expense.fingerprint for _, expense in new}
+    ).exclude(status='Rejected').order_by().values_list('id', 'fingerprint'):
+        on_file.setdefault(fingerprint, []).append(pk)
+    for duplicates in on_file.values():
+        duplicates.sort()
+    blocking = employee.company.duplicate_policy == 'block'
+
+    expenses = []
+    batch = {}
+    for result, expense in new:
+        duplicates = on_file.get(expense.fingerprint, [])
+        if blocking and duplicates:
+            result.update(status='rejected', duplicate_ids=duplicates,
+                          errors=[str(DuplicateExpenseError(duplicates))])
+            continue
+        if blocking and expense.fingerprint in batch:
+            result.update(status='rejected', duplicate_ids=[],
+                          errors=['This expense duplicates an earlier one in this batch'])
+            continue
+        result.update(status='created', duplicate_ids=list(duplicates))
+        expenses.append((result, expense))
+        batch.setdefault(expense.fingerprint, []).append(result)
+
+    with transaction.atomic():
+        Expense.objects.bulk_create([expense for _, expense in expenses])
+        for result, expense in expenses:
+            result['expense_id'] = expense.id
+    # Duplicates filed earlier in the same batch have ids only now
+    for results_of_claim in batch.values():
+        for position, result in enumerate(results_of_claim):
+            result['duplicate_ids'] += [earlier['expense_id'] for earlier in results_of_claim[:position]]
+
+    if submit and expenses:
+        errors = submit_expenses([expense for _, expense in expenses])
+        for result, expense in expenses:
+            if errors.get(expense.pk):
+                result['submit_error'] = errors[expense.pk]
+    return results
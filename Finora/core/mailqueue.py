@@ -0,0 +1,82 @@
+"""Queue of outgoing emails.
+
+Views and imports record QueuedEmail rows instead of talking to the SMTP
+server on the request, so a bulk import does not wait on one round trip
+per recipient. ``manage.py send_queued_emails`` sends the queue in
+batches over a single connection and retries failures up to
+MAX_ATTEMPTS times, waiting longer after each one.
+
+Each batch is claimed before anything is sent, so senders running at the
+same time never send an email twice. An email left claimed by a sender
+that died is queued again after CLAIM_TIMEOUT.
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import QueuedEmail
+
+MAX_ATTEMPTS = 3
+RETRY_DELAY = timedelta(minutes=1)
+CLAIM_TIMEOUT = timedelta(minutes=15)
+
+
+def queue_emails(messages):
+    """Queue ``(recipient, subject, body)`` triples with one INSERT per batch"""
+    return QueuedEmail.objects.bulk_create(
+        [QueuedEmail(recipient=recipient, subject=subject, body=body) for recipient, subject, body in messages],
+        batch_size=500,
+    )
+
+
+def claim_emails(limit):
+    """Claim up to ``limit`` emails that are due, oldest first, and return them"""
+    now = timezone.now()
+    claim = uuid.uuid4()
+    with transaction.atomic():
+        QueuedEmail.objects.filter(status='Sending', updated_at__lt=now - CLAIM_TIMEOUT).update(
+            status='Queued', claim=None, updated_at=now
+        )
+        ids = list(QueuedEmail.objects.filter(
+            status='Queued', next_attempt_at__lte=now
+        ).order_by('id').values_list('id', flat=True)[:limit])
+        # Only the sender whose update still finds them Queued gets them
+        QueuedEmail.objects.filter(id__in=ids, status='Queued').update(
+            status='Sending', claim=claim, updated_at=now
+        )
+    return list(QueuedEmail.objects.filter(id__in=ids, claim=claim).order_by('id'))
+
+
+def send_queued_emails(limit=100):
+    """Send up to ``limit`` queued emails, oldest first. Returns ``(sent, failed)``."""
+    emails = claim_emails(limit)
+    if not emails:
+        return 0, 0
+
+    sent = failed = 0
+    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@finora.com')
+    with get_connection() as connection:
+        for email in emails:
+            email.attempts += 1
+            email.claim = None
+            try:
+                EmailMessage(email.subject, email.body, from_email, [email.recipient], connection=connection).send()
+            except Exception as e:
+                email.error = str(e)
+                if email.attempts >= MAX_ATTEMPTS:
+                    email.status, email.body = 'Failed', ''
+                else:
+                    email.status = 'Queued'
+                    email.next_attempt_at = timezone.now() + RETRY_DELAY * 2 ** (email.attempts - 1)
+                failed += 1
+            else:
+                email.status, email.body, email.error = 'Sent', '', ''
+                sent += 1
+    QueuedEmail.objects.bulk_update(
+        emails, ['status', 'body', 'attempts', 'next_attempt_at', 'claim', 'error', 'updated_at']
+    )
+    return sent, failed
@@ -0,0 +1,63 @@
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Max, Min
+
+from core.blobs import file_digest
+from core.models import Expense, ReceiptBlob
+
+
+class Command(BaseCommand):
+    help = 'Move receipts uploaded before blob storage into it, deleting the duplicate files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Number of expense ids handled per transaction')
+
+    def handle(self, *args, **options):
+        storage = Expense._meta.get_field('receipt').storage
+        legacy = Expense.objects.filter(receipt_blob__isnull=True).exclude(receipt='').exclude(receipt__isnull=True)
+        bounds = legacy.aggregate(first=Min('id'), last=Max('id'))
+        if bounds['first'] is None:
+            self.stdout.write('No receipts to move.')
+            return
+
+        digests = {}      # legacy file name -> digest
+        superseded = set()  # legacy files whose content is stored under another name
+        moved = missing = 0
+        chunk_size = options['chunk_size']
+        for start in range(bounds['first'], bounds['last'] + 1, chunk_size):
+            rows = legacy.filter(id__gte=start, id__lt=start + chunk_size).values_list('id', 'receipt')
+            by_name = {}
+            for expense_id, name in rows:
+                by_name.setdefault(name, []).append(expense_id)
+
+            with transaction.atomic():
+                for name, expense_ids in by_name.items():
+                    if name not in digests:
+                        try:
+                            with storage.open(name, 'rb') as receipt:
+                                digests[name] = file_digest(File(receipt))
+                        except OSError:
+                            missing += len(expense_ids)
+                            continue
+                    digest = digests[name]
+                    blob, _ = ReceiptBlob.objects.get_or_create(
+                        digest=digest, defaults={'file': name, 'size': storage.size(name)}
+                    )
+                    Expense.objects.filter(id__in=expense_ids).update(receipt=blob.file.name, receipt_blob=blob)
+                    ReceiptBlob.objects.filter(pk=digest).update(ref_count=F('ref_count') + len(expense_ids))
+                    if blob.file.name != name:
+                        superseded.add(name)
+                    moved += len(expense_ids)
+
+        freed = 0
+        for name in superseded:
+            if storage.exists(name):
+                freed += storage.size(name)
+                storage.delete(name)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {moved} receipts into blob storage ({missing} files missing), '
+            f'deleted {len(superseded)} duplicate files freeing {freed} bytes.'
+        ))
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import UploadSession
+from core.uploads import discard_part
+
+
+class Command(BaseCommand):
+    help = 'Abort chunked receipt uploads that stopped receiving chunks and delete their partial files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24,
+                            help='Abort open uploads idle for longer than this')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale = list(UploadSession.objects.filter(status='Open', updated_at__lt=cutoff))
+        for session in stale:
+            discard_part(session)
+        UploadSession.objects.filter(pk__in=[session.pk for session in stale]).update(status='Aborted')
+
+        self.stdout.write(self.style.SUCCESS(f'Aborted {len(stale)} abandoned uploads.'))
@@ -0,0 +1,42 @@
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+
+from core.models import Expense
+from user_app.models import CompanyData
+
+
+class Command(BaseCommand):
+    help = 'List clusters of expenses filed for the same claim (same employee, amount, currency, date and category)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Only scan this company id')
+        parser.add_argument('--include-rejected', action='store_true',
+                            help='Also count rejected expenses as cluster members')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Rows fetched per round trip while streaming the index')
+
+    def handle(self, *args, **options):
+        companies = CompanyData.objects.order_by('id').values_list('id', flat=True)
+        if options['company']:
+            companies = companies.filter(id=options['company'])
+
+        clusters = duplicates = 0
+        for company_id in companies:
+            # Walks expense_fingerprint_idx in order, so a cluster's rows arrive together
+            rows = Expense.objects.filter(company_id=company_id, fingerprint__gt='')
+            if not options['include_rejected']:
+                rows = rows.exclude(status='Rejected')
+            rows = rows.order_by('fingerprint', 'id').values_list('fingerprint', 'id')
+
+            for fingerprint, group in groupby(rows.iterator(chunk_size=options['chunk_size']), key=lambda row: row[0]):
+                expense_ids = [expense_id for _, expense_id in group]
+                if len(expense_ids) > 1:
+                    clusters += 1
+                    duplicates += len(expense_ids) - 1
+                    self.stdout.write(
+                        f'Company {company_id}: expenses {", ".join(map(str, expense_ids))} '
+                        f'are the same claim ({fingerprint[:12]})'
+                    )
+
+        self.stdout.write(self.style.SUCCESS(f'Found {clusters} duplicate clusters with {duplicates} extra expenses.'))
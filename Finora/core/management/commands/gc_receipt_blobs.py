@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.derivatives import delete_derivatives
+from core.models import ReceiptBlob
+
+
+class Command(BaseCommand):
+    help = 'Delete receipt blobs that no expense references any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=int, default=24,
+                            help='Keep unreferenced blobs younger than this, an upload may be about to use them')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+        candidates = ReceiptBlob.objects.filter(ref_count=0, created_at__lt=cutoff).values_list('digest', 'file', 'original')
+        storage = ReceiptBlob._meta.get_field('file').storage
+
+        deleted = freed = 0
+        for digest, name, original in candidates.iterator():
+            with transaction.atomic():
+                # Re-checked in the DELETE, an upload may have referenced it since
+                removed, _ = ReceiptBlob.objects.filter(pk=digest, ref_count=0, expenses__isnull=True).delete()
+            if removed:
+                for stored in filter(None, (name, original)):
+                    if storage.exists(stored):
+                        freed += storage.size(stored)
+                        storage.delete(stored)
+                delete_derivatives(digest)
+                deleted += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} unreferenced receipt blobs, freeing {freed} bytes.'))
@@ -0,0 +1,48 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from core.models import Expense
+from core.similarity import HASH_VERSION_KEY, flag_similar_receipt, hash_receipt
+
+
+class Command(BaseCommand):
+    help = 'Hash receipts stored before near-duplicate detection and flag likely re-submissions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Number of expense ids read per query')
+
+    def id_ranges(self, queryset, chunk_size):
+        bounds = queryset.aggregate(first=Min('id'), last=Max('id'))
+        if bounds['first'] is None:
+            return
+        for start in range(bounds['first'], bounds['last'] + 1, chunk_size):
+            yield queryset.filter(id__gte=start, id__lt=start + chunk_size).order_by('id')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+
+        # First hash every blob, so the trees built below hold every receipt
+        hashed = set()
+        unhashed = Expense.objects.filter(receipt_blob__phash='').select_related('receipt_blob')
+        for chunk in self.id_ranges(unhashed, chunk_size):
+            for expense in chunk:
+                if expense.receipt_blob_id not in hashed and hash_receipt(expense):
+                    hashed.add(expense.receipt_blob_id)
+
+        # Make every process rebuild its trees with the receipts hashed above
+        cache.set(HASH_VERSION_KEY, time.time_ns(), None)
+
+        flagged = 0
+        unflagged = Expense.objects.filter(receipt_blob__phash__gt='', similar_receipt__isnull=True)
+        for chunk in self.id_ranges(unflagged.select_related('receipt_blob'), chunk_size):
+            for expense in chunk:
+                if flag_similar_receipt(expense):
+                    flagged += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Hashed {len(hashed)} receipts, flagged {flagged} expenses as possible duplicates.'
+        ))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.onboarding import OnboardingError, import_users, read_user_rows, validate_rows
+from core.passwords import HASH_WORKERS
+from user_app.models import CompanyData
+
+
+class Command(BaseCommand):
+    help = 'Create a company\'s users from a CSV (username,email,role,manager header) or JSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('company', type=int, help='Id of the company the users join')
+        parser.add_argument('path', help='File to import; .json files are read as JSON, anything else as CSV')
+        parser.add_argument('--workers', type=int, default=HASH_WORKERS,
+                            help='Processes hashing the passwords; 1 hashes them in this process')
+        parser.add_argument('--login-url', default='http://localhost:8000/user/login/',
+                            help='Login link put in the welcome emails')
+
+    def handle(self, *args, **options):
+        try:
+            company = CompanyData.objects.get(pk=options['company'])
+        except CompanyData.DoesNotExist:
+            raise CommandError(f'Company {options["company"]} does not exist')
+        try:
+            with open(options['path'], 'rb') as source:
+                content = source.read()
+        except OSError as e:
+            raise CommandError(f'Cannot read {options["path"]}: {e}')
+
+        try:
+            rows = validate_rows(company, read_user_rows(content, options['path']))
+        except OnboardingError as e:
+            for error in e.errors:
+                self.stderr.write(f'Row {error["row"]} ({error["username"]}): {"; ".join(error["errors"])}')
+            raise CommandError(str(e))
+        profiles = import_users(company, rows, options['login_url'], options['workers'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(profiles)} users; run send_queued_emails to send their credentials.'
+        ))
@@ -0,0 +1,50 @@
+import csv
+import json
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.currency import load_rates
+
+FIELDS = ('date', 'base', 'quote', 'rate')
+
+
+class Command(BaseCommand):
+    help = 'Load exchange rates from a CSV (date,base,quote,rate header) or JSON (list of objects) file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to load; .json files are read as JSON, anything else as CSV')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rates written per statement')
+
+    def parse(self, number, record):
+        try:
+            rate = Decimal(str(record['rate']))
+            if rate <= 0:
+                raise InvalidOperation
+            return date.fromisoformat(record['date']), record['base'], record['quote'], rate
+        except (KeyError, TypeError, ValueError, InvalidOperation):
+            raise CommandError(f'Invalid exchange rate in record {number}: {record}')
+
+    def records(self, path):
+        if path.endswith('.json'):
+            with open(path) as source:
+                yield from json.load(source)
+            return
+        with open(path, newline='') as source:
+            reader = csv.DictReader(source)
+            if not set(FIELDS) <= set(reader.fieldnames or ()):
+                raise CommandError(f'The CSV header must name the columns {", ".join(FIELDS)}')
+            yield from reader
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                rows = (self.parse(number, record) for number, record in enumerate(self.records(options['path']), 1))
+                loaded = load_rates(rows, options['batch_size'])
+        except OSError as e:
+            raise CommandError(f'Cannot read {options["path"]}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'Loaded {loaded} exchange rates.'))
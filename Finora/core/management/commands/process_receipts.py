@@ -0,0 +1,50 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from core.ocr import init_worker
+from core.scans import claim_scans, process_scans, requeue_interrupted
+
+
+class Command(BaseCommand):
+    help = 'Read the queued receipt uploads with OCR (or their PDF text layer) in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Worker processes; 0 processes the receipts in this process')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Scans claimed at a time (default: four per worker)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for new uploads instead of exiting once the queue is empty')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        batch_size = options['batch_size'] or max(workers, 1) * 4
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker) if workers else None
+
+        requeued = requeue_interrupted()
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} receipts left unfinished by an earlier run.')
+
+        processed = succeeded = 0
+        try:
+            while True:
+                scans = claim_scans(batch_size)
+                if scans:
+                    succeeded += process_scans(scans, executor)
+                    processed += len(scans)
+                elif options['loop']:
+                    time.sleep(options['interval'])
+                else:
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} receipts, {succeeded} read successfully.'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.rollups import install_rollup_triggers, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recount the daily expense rollups the reports read from'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Number of expense ids counted per statement')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            install_rollup_triggers()
+            counted = rebuild_rollups(options['chunk_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {counted} expenses.'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.search import install_search_triggers, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Re-index every expense in the full-text search table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Number of expense ids indexed per statement')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            install_search_triggers()
+            indexed = rebuild_search_index(options['chunk_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} expenses for search.'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from core.models import Expense, ApprovalRules
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the approval counters and status of every expense from its approval rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Number of expense ids updated per statement')
+        parser.add_argument('--sync-rules', action='store_true',
+                            help="Re-snapshot each expense's approval percentage from the employee's current rule")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        bounds = Expense.objects.aggregate(first=Min('id'), last=Max('id'))
+        if bounds['first'] is None:
+            self.stdout.write('No expenses to recompute.')
+            return
+
+        updated = 0
+        for start in range(bounds['first'], bounds['last'] + 1, chunk_size):
+            chunk = Expense.objects.filter(id__gte=start, id__lt=start + chunk_size)
+            with transaction.atomic():
+                if options['sync_rules']:
+                    percentage = ApprovalRules.objects.filter(
+                        employee=OuterRef('employee_id')
+                    ).order_by('id').values('min_approval_percentage')[:1]
+                    chunk.update(min_approval_percentage=Coalesce(Subquery(percentage), 100))
+                updated += chunk.recompute_approval_counters()
+
+        self.stdout.write(self.style.SUCCESS(f'Recomputed approval counters for {updated} expenses.'))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.mailqueue import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = 'Send the queued outgoing emails (welcome emails from bulk imports and the like)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Emails sent over one SMTP connection')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for new emails instead of exiting once the queue is empty')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        try:
+            while True:
+                sent, failed = send_queued_emails(options['batch_size'])
+                total_sent += sent
+                total_failed += failed
+                if sent or failed:
+                    # Emails that failed are retried after a delay
+                    if not sent and not options['loop']:
+                        break
+                elif options['loop']:
+                    time.sleep(options['interval'])
+                else:
+                    break
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'Sent {total_sent} emails, {total_failed} attempts failed.'))
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('user_app', '0002_companydata_name_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['-date', '-created_at'], name='expense_date_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['employee', '-created_at'], name='expense_emp_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['employee', 'status', '-created_at'], name='expense_emp_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenseapproval',
+            index=models.Index(fields=['approver', 'status', '-created_at'], name='approval_appr_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenseapproval',
+            index=models.Index(fields=['approver', '-updated_at'], name='approval_appr_updated_idx'),
+        ),
+    ]
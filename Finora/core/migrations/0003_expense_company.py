@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_expense_lookup_indexes'),
+        ('user_app', '0002_companydata_name_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='company',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='expenses', to='user_app.companydata'),
+        ),
+        migrations.AddField(
+            model_name='expenseapproval',
+            name='company',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='expense_approvals', to='user_app.companydata'),
+        ),
+    ]
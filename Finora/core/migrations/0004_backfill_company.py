@@ -0,0 +1,42 @@
+from django.db import migrations
+from django.db.models import Max, Min, OuterRef, Subquery
+
+BATCH_SIZE = 5000
+
+
+def backfill_in_chunks(queryset, value):
+    """Update ``company`` over consecutive primary-key ranges so each
+    statement only touches BATCH_SIZE rows."""
+    bounds = queryset.aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return
+    for start in range(bounds['first'], bounds['last'] + 1, BATCH_SIZE):
+        queryset.filter(
+            id__gte=start, id__lt=start + BATCH_SIZE, company__isnull=True
+        ).update(company=value)
+
+
+def backfill_company(apps, schema_editor):
+    UserData = apps.get_model('user_app', 'UserData')
+    Expense = apps.get_model('core', 'Expense')
+    ExpenseApproval = apps.get_model('core', 'ExpenseApproval')
+
+    backfill_in_chunks(
+        Expense.objects.all(),
+        Subquery(UserData.objects.filter(id=OuterRef('employee_id')).values('company_id')[:1]),
+    )
+    backfill_in_chunks(
+        ExpenseApproval.objects.all(),
+        Subquery(Expense.objects.filter(id=OuterRef('expense_id')).values('company_id')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_expense_company'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_company, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_backfill_company'),
+        ('user_app', '0002_companydata_name_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='expense',
+            name='company',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='expenses', to='user_app.companydata'),
+        ),
+        migrations.AlterField(
+            model_name='expenseapproval',
+            name='company',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='expense_approvals', to='user_app.companydata'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['company', '-created_at'], name='expense_company_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['company', 'status'], name='expense_company_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['company', 'category'], name='expense_company_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenseapproval',
+            index=models.Index(fields=['company', 'status', '-created_at'], name='approval_company_status_idx'),
+        ),
+    ]
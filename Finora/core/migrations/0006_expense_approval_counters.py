@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_company_not_null'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='approved_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='min_approval_percentage',
+            field=models.PositiveSmallIntegerField(default=100, help_text='Snapshot of the approval rule percentage this expense is decided against'),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='pending_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='rejected_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations
+from django.db.models import Count, Max, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 5000
+
+APPROVAL_COUNTERS = {
+    'Approved': 'approved_count',
+    'Rejected': 'rejected_count',
+    'Pending': 'pending_count',
+}
+
+
+def backfill_counters(apps, schema_editor):
+    """Count existing approvals into the new columns and snapshot each
+    employee's rule percentage. Statuses are left as they are; run the
+    recompute_approval_counters command to re-derive them."""
+    Expense = apps.get_model('core', 'Expense')
+    ExpenseApproval = apps.get_model('core', 'ExpenseApproval')
+    ApprovalRules = apps.get_model('core', 'ApprovalRules')
+
+    values = {}
+    for status, field in APPROVAL_COUNTERS.items():
+        count = ExpenseApproval.objects.filter(
+            expense=OuterRef('pk'), status=status
+        ).values('expense').annotate(count=Count('id')).values('count')
+        values[field] = Coalesce(Subquery(count), 0)
+    percentage = ApprovalRules.objects.filter(
+        employee=OuterRef('employee_id')
+    ).order_by('id').values('min_approval_percentage')[:1]
+    values['min_approval_percentage'] = Coalesce(Subquery(percentage), 100)
+
+    bounds = Expense.objects.aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return
+    for start in range(bounds['first'], bounds['last'] + 1, BATCH_SIZE):
+        Expense.objects.filter(id__gte=start, id__lt=start + BATCH_SIZE).update(**values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_expense_approval_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_backfill_approval_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='approvalrules',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
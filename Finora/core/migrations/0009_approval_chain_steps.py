@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:10
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def point_submitted_expenses_at_first_step(apps, schema_editor):
+    """Existing approvals all become step 1, so any expense that has
+    approvals is waiting on step 1."""
+    Expense = apps.get_model('core', 'Expense')
+    ExpenseApproval = apps.get_model('core', 'ExpenseApproval')
+    Expense.objects.filter(
+        Exists(ExpenseApproval.objects.filter(expense=OuterRef('pk')))
+    ).update(current_step=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_approvalrules_version'),
+        ('user_app', '0002_companydata_name_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='current_step',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='expenseapproval',
+            name='step',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AddIndex(
+            model_name='expenseapproval',
+            index=models.Index(fields=['expense', 'step'], name='approval_expense_step_idx'),
+        ),
+        migrations.RunPython(point_submitted_expenses_at_first_step, migrations.RunPython.noop),
+    ]
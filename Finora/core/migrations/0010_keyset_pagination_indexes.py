@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_approval_chain_steps'),
+        ('user_app', '0002_companydata_name_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='expense',
+            name='expense_emp_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='expense',
+            name='expense_company_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='expenseapproval',
+            name='approval_appr_status_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='expenseapproval',
+            name='approval_appr_updated_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='expenseapproval',
+            name='approval_company_status_idx',
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['employee', '-created_at', '-id'], name='expense_emp_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['company', '-created_at', '-id'], name='expense_company_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenseapproval',
+            index=models.Index(fields=['approver', 'status', '-created_at', '-id'], name='approval_appr_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenseapproval',
+            index=models.Index(fields=['approver', '-updated_at', '-id'], name='approval_appr_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenseapproval',
+            index=models.Index(fields=['company', 'status', '-created_at', '-id'], name='approval_company_status_idx'),
+        ),
+    ]
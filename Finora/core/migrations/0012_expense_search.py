@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:40
+
+from django.db import migrations
+
+CREATE_TABLE = """
+CREATE VIRTUAL TABLE core_expense_fts USING fts5(
+    description, remarks, employee_name, tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+# The triggers keeping the index current are installed by the post_migrate
+# handler in core.search, after any later migration has rebuilt core_expense
+BACKFILL = """
+INSERT INTO core_expense_fts (rowid, description, remarks, employee_name)
+SELECT e.id, e.description, COALESCE(e.remarks, ''), u.name
+FROM core_expense e JOIN user_app_userdata u ON u.id = e.employee_id
+"""
+
+DROP_TRIGGERS = [
+    f'DROP TRIGGER IF EXISTS {name}' for name in (
+        'core_expense_fts_insert', 'core_expense_fts_update',
+        'core_expense_fts_delete', 'core_expense_fts_employee',
+    )
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_expense_facet_indexes'),
+        ('user_app', '0002_companydata_name_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_TABLE, 'DROP TABLE core_expense_fts'),
+        migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+        migrations.RunSQL(migrations.RunSQL.noop, DROP_TRIGGERS),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_expense_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptText',
+            fields=[
+                ('content_hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('source', models.CharField(choices=[('pdf', 'PDF text layer'), ('ocr', 'OCR')], max_length=10)),
+                ('text', models.TextField(blank=True)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('date', models.DateField(blank=True, null=True)),
+                ('merchant', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReceiptScan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('Queued', 'Queued'), ('Processing', 'Processing'), ('Done', 'Done'), ('Failed', 'Failed')], default='Queued', max_length=20)),
+                ('content_hash', models.CharField(blank=True, max_length=64)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('expense', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='scan', to='core.expense')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='scan_status_idx')],
+            },
+        ),
+    ]
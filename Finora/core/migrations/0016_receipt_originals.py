@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:32
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receiptblob',
+            name='original',
+            field=models.FileField(blank=True, upload_to=core.models.original_upload_path),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_receipt_originals'),
+        ('user_app', '0002_companydata_name_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='similar_receipt',
+            field=models.ForeignKey(blank=True, help_text='Earlier expense whose receipt looks like a re-submission of this one', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.expense'),
+        ),
+        migrations.AddField(
+            model_name='receiptblob',
+            name='phash',
+            field=models.CharField(blank=True, max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['company', 'id'], name='expense_company_id_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+import hashlib
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Max, Min
+
+BATCH_SIZE = 5000
+
+
+def expense_fingerprint(employee_id, amount, currency, date, category):
+    # Frozen copy of core.models.expense_fingerprint as of this migration
+    amount = Decimal(str(amount or 0)).quantize(Decimal('0.01'))
+    if not amount:
+        return ''
+    key = f"{employee_id}|{amount}|{(currency or '').strip().upper()}|{date.isoformat()}|{(category or '').strip().lower()}"
+    return hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+
+
+def backfill_fingerprint(apps, schema_editor):
+    Expense = apps.get_model('core', 'Expense')
+    bounds = Expense.objects.aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return
+    for start in range(bounds['first'], bounds['last'] + 1, BATCH_SIZE):
+        expenses = list(Expense.objects.filter(id__gte=start, id__lt=start + BATCH_SIZE).only(
+            'employee_id', 'amount', 'currency', 'date', 'category'
+        ))
+        for expense in expenses:
+            expense.fingerprint = expense_fingerprint(
+                expense.employee_id, expense.amount, expense.currency, expense.date, expense.category
+            )
+        Expense.objects.bulk_update(expenses, ['fingerprint'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_expense_fingerprint'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_fingerprint, migrations.RunPython.noop),
+    ]
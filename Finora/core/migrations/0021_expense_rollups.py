@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The triggers keeping the rollups current are installed by the post_migrate
+# handler in core.rollups
+BACKFILL = """
+INSERT INTO core_expenserollup (company_id, day, employee_id, category, status, currency, expense_count, amount)
+SELECT company_id, date, employee_id, category, status, UPPER(currency), COUNT(*), SUM(amount)
+FROM core_expense
+GROUP BY company_id, date, employee_id, category, status, UPPER(currency)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_exchange_rates'),
+        ('user_app', '0003_companydata_duplicate_policy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('category', models.CharField(max_length=50)),
+                ('status', models.CharField(max_length=20)),
+                ('currency', models.CharField(max_length=10)),
+                ('expense_count', models.IntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('company', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='user_app.companydata')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='user_app.userdata')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('company', 'day', 'employee', 'category', 'status', 'currency'), name='expense_rollup_key')],
+            },
+        ),
+        migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+    ]
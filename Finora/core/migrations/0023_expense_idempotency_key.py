@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_queued_emails'),
+        ('user_app', '0003_companydata_duplicate_policy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, max_length=100, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='expense',
+            constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key__isnull', False)), fields=('employee', 'idempotency_key'), name='expense_idempotency_key'),
+        ),
+    ]
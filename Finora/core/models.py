@@ -1,22 +1,175 @@
 # Create your models here.
-from django.db import models
+import hashlib
+import os
+import uuid
+from datetime import date as Date
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import Exact, GreaterThanOrEqual, LessThan
+from django.utils import timezone
 from user_app.models import UserData, CompanyData
 
 
-class Expense(models.Model):
+# Approval status -> Expense counter column. Draft approvals are later steps
+# of a sequential chain that are not active yet, so they are still outstanding.
+APPROVAL_COUNTERS = {
+    'Approved': 'approved_count',
+    'Rejected': 'rejected_count',
+    'Pending': 'pending_count',
+    'Draft': 'pending_count',
+}
+
+
+def approval_status(approved, rejected, pending, percentage):
+    """SQL expression deriving an expense status from its approval counters.
+
+    Approved once ``percentage`` of the approvals are approved, Rejected once
+    that share can no longer be reached, Pending in between and Draft when the
+    expense has no approvals at all.
+    """
+    total = approved + rejected + pending
+    return Case(
+        When(Exact(total, 0), then=Value('Draft')),
+        When(GreaterThanOrEqual(approved * 100, total * percentage), then=Value('Approved')),
+        When(LessThan((approved + pending) * 100, total * percentage), then=Value('Rejected')),
+        default=Value('Pending'),
+    )
+
+
+class ExpenseQuerySet(models.QuerySet):
+
+    def apply_approval_transition(self, old_status, new_status):
+        """Move one approval from ``old_status`` to ``new_status`` in the
+        counters and re-derive the status, all in a single UPDATE."""
+        deltas = dict.fromkeys(APPROVAL_COUNTERS.values(), 0)
+        if old_status in APPROVAL_COUNTERS:
+            deltas[APPROVAL_COUNTERS[old_status]] -= 1
+        if new_status in APPROVAL_COUNTERS:
+            deltas[APPROVAL_COUNTERS[new_status]] += 1
+        if not any(deltas.values()):
+            return 0
+
+        counters = {field: F(field) + delta for field, delta in deltas.items()}
+        return self.update(
+            status=approval_status(
+                counters['approved_count'],
+                counters['rejected_count'],
+                counters['pending_count'],
+                F('min_approval_percentage'),
+            ),
+            updated_at=timezone.now(),
+            **{field: counters[field] for field, delta in deltas.items() if delta},
+        )
+
+    def recompute_approval_counters(self, **extra):
+        """Rebuild the counters and status of every expense in the queryset
+        from its approval rows, in a single UPDATE. ``extra`` is passed on to
+        the UPDATE (e.g. ``updated_at``)."""
+        counters = {}
+        for field in dict.fromkeys(APPROVAL_COUNTERS.values()):
+            statuses = [status for status, counter in APPROVAL_COUNTERS.items() if counter == field]
+            count = ExpenseApproval.objects.filter(
+                expense=OuterRef('pk'), status__in=statuses
+            ).values('expense').annotate(count=Count('id')).values('count')
+            counters[field] = Coalesce(Subquery(count), 0)
+        return self.update(
+            status=approval_status(
+                counters['approved_count'],
+                counters['rejected_count'],
+                counters['pending_count'],
+                F('min_approval_percentage'),
+            ),
+            **counters,
+            **extra,
+        )
+
+
+class ExpenseApprovalQuerySet(models.QuerySet):
+
+    def advance_chains(self, decided):
+        """Activate the next step of every sequential chain whose current
+        step was just decided.
+
+        ``decided`` is an iterable of ``(expense_id, step)`` pairs. Queued
+        (Draft) approvals of step + 1 become Pending while the expense is
+        still undecided, and the expense's step pointer moves with them.
+        Parallel plans have no queued steps, so nothing changes for them.
+        """
+        by_step = {}
+        for expense_id, step in decided:
+            by_step.setdefault(step, set()).add(expense_id)
+
+        now = timezone.now()
+        for step, expense_ids in by_step.items():
+            active = Expense.objects.filter(pk__in=expense_ids, status='Pending', current_step=step)
+            self.filter(
+                expense__in=active, step=step + 1, status='Draft'
+            ).update(status='Pending', updated_at=now)
+            Expense.objects.filter(
+                pk__in=self.filter(expense__in=active, step=step + 1, status='Pending').values('expense_id')
+            ).update(current_step=step + 1)
+
+
+# Fields that make two expenses the same claim (see core.duplicates)
+FINGERPRINT_FIELDS = ('employee', 'amount', 'currency', 'date', 'category')
+
+
+def expense_fingerprint(employee_id, amount, currency, date, category):
+    """Normalised digest of the fields that identify a claim.
+
+    Blank for a zero amount: receipt uploads start at zero until the OCR
+    workers read the total, and those placeholders are not duplicates.
+    """
+    amount = Decimal(str(amount or 0)).quantize(Decimal('0.01'))
+    if not amount:
+        return ''
+    if isinstance(date, str):
+        date = Date.fromisoformat(date)
+    key = f"{employee_id}|{amount}|{(currency or '').strip().upper()}|{date.isoformat()}|{(category or '').strip().lower()}"
+    return hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+
+
+def blob_upload_path(instance, filename):
+    extension = os.path.splitext(filename)[1].lower()
+    return f"receipts/blobs/{instance.digest[:2]}/{instance.digest[2:4]}/{instance.digest}{extension}"
+
+
+def original_upload_path(instance, filename):
+    extension = os.path.splitext(filename)[1].lower()
+    return f"receipts/originals/{instance.digest[:2]}/{instance.digest[2:4]}/{instance.digest}{extension}"
 
-    def update_status_from_approvals(self):
-        approvals = self.approvals.all()
-        if approvals.exists():
-            if all(a.status == 'Approved' for a in approvals):
-                self.status = 'Approved'
-            elif any(a.status == 'Rejected' for a in approvals):
-                self.status = 'Rejected'
-            elif any(a.status == 'Pending' for a in approvals):
-                self.status = 'Pending'
-        else:
-            self.status = 'Draft'
-        self.save()
+
+class ReceiptBlob(models.Model):
+    """A receipt file stored once per content under its SHA-256 digest.
+
+    ``ref_count`` is the number of expenses pointing at the blob (see
+    core.blobs); unreferenced blobs are removed by ``manage.py gc_receipt_blobs``.
+    Photos are normalised before they are stored (see core.images); the
+    file as uploaded is kept in ``original`` only with RECEIPT_KEEP_ORIGINALS.
+    """
+    digest = models.CharField(max_length=64, primary_key=True)
+    file = models.FileField(upload_to=blob_upload_path)
+    original = models.FileField(upload_to=original_upload_path, blank=True)
+    # dHash of the receipt for near-duplicate detection (see core.similarity)
+    phash = models.CharField(max_length=16, blank=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Garbage collection only ever looks at unreferenced blobs
+            models.Index(fields=['created_at'], condition=Q(ref_count=0), name='blob_unreferenced_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.digest[:12]} ({self.ref_count} references)"
+
+
+class Expense(models.Model):
 
     def receipt_upload_path(instance, filename):
         return f"{instance.employee.company.name}/receipts/user_{instance.employee.id}/{filename}"
@@ -44,6 +197,8 @@ class Expense(models.Model):
     ]
 
     employee = models.ForeignKey(UserData, on_delete=models.CASCADE, related_name='expenses')
+    # Denormalized from employee.company so tenant-scoped queries skip the join
+    company = models.ForeignKey(CompanyData, on_delete=models.CASCADE, related_name='expenses', db_index=False)
     description = models.TextField()
     date = models.DateField()
     category = models.CharField(max_length=50, choices=CATEGORY_CHOICES, default='Other')
@@ -60,12 +215,72 @@ class Expense(models.Model):
     currency = models.CharField(max_length=10, default='INR')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Draft')
     receipt = models.FileField(upload_to=receipt_upload_path, null=True, blank=True)
+    # Content-addressed blob holding the receipt; ``receipt`` names the blob's file
+    receipt_blob = models.ForeignKey(
+        ReceiptBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='expenses'
+    )
+    fingerprint = models.CharField(max_length=32, blank=True, default='', editable=False)
+    # Client-supplied key of a batch-ingested expense, so a retried sync is not filed twice
+    idempotency_key = models.CharField(max_length=100, null=True, blank=True, editable=False)
+    similar_receipt = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+        help_text='Earlier expense whose receipt looks like a re-submission of this one'
+    )
+    # Approval counters maintained by ExpenseApproval.save()/delete(); status is derived from them
+    approved_count = models.PositiveIntegerField(default=0)
+    rejected_count = models.PositiveIntegerField(default=0)
+    pending_count = models.PositiveIntegerField(default=0)
+    min_approval_percentage = models.PositiveSmallIntegerField(
+        default=100,
+        help_text='Snapshot of the approval rule percentage this expense is decided against'
+    )
+    # Step of the approval chain currently awaiting a decision (0 until submitted)
+    current_step = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    
+
+    objects = ExpenseQuerySet.as_manager()
 
     class Meta:
         ordering = ['-date', '-created_at']
+        indexes = [
+            # Default ordering (Django admin changelist, unscoped listings)
+            models.Index(fields=['-date', '-created_at'], name='expense_date_created_idx'),
+            # Employee dashboard: all expenses newest first (keyset pages on created_at, id)
+            models.Index(fields=['employee', '-created_at', '-id'], name='expense_emp_created_idx'),
+            # Employee dashboard: per-status counts and filtered lists
+            models.Index(fields=['employee', 'status', '-created_at'], name='expense_emp_status_idx'),
+            # Expense query API: status/category facet counts group along the index
+            models.Index(fields=['employee', 'status', 'category'], name='expense_emp_facet_idx'),
+            # Admin views: company-wide listings and report groupings
+            models.Index(fields=['company', '-created_at', '-id'], name='expense_company_created_idx'),
+            models.Index(fields=['company', 'status', 'category'], name='expense_company_facet_idx'),
+            models.Index(fields=['company', 'category'], name='expense_company_category_idx'),
+            # Receipt similarity index: expenses filed since a company's tree was last extended
+            models.Index(fields=['company', 'id'], name='expense_company_id_idx'),
+            # Duplicate checks on insert and the duplicate cluster scan
+            models.Index(fields=['company', 'fingerprint'], name='expense_fingerprint_idx'),
+        ]
+        constraints = [
+            # Batch ingestion skips keys already seen; scoped per employee
+            models.UniqueConstraint(
+                fields=['employee', 'idempotency_key'],
+                condition=Q(idempotency_key__isnull=False),
+                name='expense_idempotency_key',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.company_id is None and self.employee_id is not None:
+            self.company_id = self.employee.company_id
+        self.fingerprint = self.compute_fingerprint()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'employee_id', *FINGERPRINT_FIELDS} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'fingerprint'}
+        super().save(*args, **kwargs)
+
+    def compute_fingerprint(self):
+        return expense_fingerprint(self.employee_id, self.amount, self.currency, self.date, self.category)
 
     def __str__(self):
         return f"{self.employee.name} - {self.category} - {self.amount} - {self.status}"
@@ -80,10 +295,53 @@ class ExpenseApproval(models.Model):
     ]
     expense = models.ForeignKey(Expense, on_delete=models.CASCADE, related_name='approvals')
     approver = models.ForeignKey(UserData, on_delete=models.CASCADE, related_name='approvals')
+    # Denormalized from expense.company so tenant-scoped queries skip the join
+    company = models.ForeignKey(CompanyData, on_delete=models.CASCADE, related_name='expense_approvals', db_index=False)
+    # Position in a sequential chain; every approval of a parallel plan is step 1
+    step = models.PositiveSmallIntegerField(default=1)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Draft')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ExpenseApprovalQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Manager dashboard: pending queue newest first
+            models.Index(fields=['approver', 'status', '-created_at', '-id'], name='approval_appr_status_idx'),
+            # Manager history: processed approvals by last update
+            models.Index(fields=['approver', '-updated_at', '-id'], name='approval_appr_updated_idx'),
+            # Admin views: company-wide pending queue
+            models.Index(fields=['company', 'status', '-created_at', '-id'], name='approval_company_status_idx'),
+            # Sequential chains: activating the next step of an expense
+            models.Index(fields=['expense', 'step'], name='approval_expense_step_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.status
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.company_id is None and self.expense_id is not None:
+            self.company_id = self.expense.company_id
+        previous_status = None if self._state.adding else getattr(self, '_loaded_status', None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if previous_status != self.status:
+                Expense.objects.filter(pk=self.expense_id).apply_approval_transition(previous_status, self.status)
+                if previous_status == 'Pending' and self.status in ('Approved', 'Rejected'):
+                    ExpenseApproval.objects.advance_chains([(self.expense_id, self.step)])
+        self._loaded_status = self.status
+
+    def delete(self, *args, **kwargs):
+        previous_status = getattr(self, '_loaded_status', self.status)
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Expense.objects.filter(pk=self.expense_id).apply_approval_transition(previous_status, None)
+        return result
+
     def __str__(self):
         return f"Expense: {self.expense.id} - Approver: {self.approver.email} - Status: {self.status}"
 
@@ -96,3 +354,169 @@ class ApprovalRules(models.Model):
     approvers = models.ManyToManyField(UserData, related_name='approver_approval_rules')
     approval_sequence = models.BooleanField(default=False)
     min_approval_percentage = models.IntegerField(default=51)
+    # Bumped on every change so compiled approval plans can be cached per version
+    version = models.PositiveIntegerField(default=1)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
+
+
+class ReceiptScan(models.Model):
+    """OCR job for an uploaded receipt, worked off by ``manage.py process_receipts``"""
+    STATUS_CHOICES = [
+        ('Queued', 'Queued'),
+        ('Processing', 'Processing'),
+        ('Done', 'Done'),
+        ('Failed', 'Failed'),
+    ]
+    expense = models.OneToOneField(Expense, on_delete=models.CASCADE, related_name='scan')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Queued')
+    # SHA-256 of the receipt file, the key of its ReceiptText
+    content_hash = models.CharField(max_length=64, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim the oldest queued jobs first
+            models.Index(fields=['status', 'id'], name='scan_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Scan of expense {self.expense_id} - {self.status}"
+
+
+class ReceiptText(models.Model):
+    """Text and fields read from a receipt, cached by the file's content hash
+    so an identical receipt is never OCRed twice"""
+    SOURCE_CHOICES = [
+        ('pdf', 'PDF text layer'),
+        ('ocr', 'OCR'),
+    ]
+    content_hash = models.CharField(max_length=64, primary_key=True)
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES)
+    text = models.TextField(blank=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    date = models.DateField(null=True, blank=True)
+    merchant = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} - {self.merchant or 'unknown merchant'}"
+
+
+class UploadSession(models.Model):
+    """A chunked, resumable receipt upload (see core.uploads)"""
+    STATUS_CHOICES = [
+        ('Open', 'Open'),
+        ('Complete', 'Complete'),
+        ('Aborted', 'Aborted'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    employee = models.ForeignKey(UserData, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    # Bytes written so far, the offset the next chunk has to start at
+    received = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Open')
+    expense = models.OneToOneField(
+        Expense, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_session'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Cleanup of abandoned sessions
+            models.Index(fields=['status', 'updated_at'], name='upload_status_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"Upload {self.id} - {self.filename} ({self.received}/{self.size})"
+
+
+class ExchangeRate(models.Model):
+    """Units of ``quote`` one unit of ``base`` bought on ``date``.
+
+    Loaded from a file with ``manage.py load_exchange_rates``; conversions
+    use the latest rate on or before the expense date (see core.currency).
+    """
+    date = models.DateField()
+    base = models.CharField(max_length=10)
+    quote = models.CharField(max_length=10)
+    rate = models.DecimalField(max_digits=20, decimal_places=10)
+
+    class Meta:
+        constraints = [
+            # Also the index conversions look rates up by, newest date first
+            models.UniqueConstraint(fields=['base', 'quote', 'date'], name='exchange_rate_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.date}: 1 {self.base} = {self.rate} {self.quote}"
+
+
+class ExpenseRollup(models.Model):
+    """Expense count and amount per (company, day, employee, category,
+    status, currency), the table reports aggregate instead of core_expense.
+
+    Kept current by SQLite triggers on core_expense (see core.rollups) and
+    rebuilt with ``manage.py rebuild_expense_rollups``.
+    """
+    company = models.ForeignKey(CompanyData, on_delete=models.CASCADE, related_name='+', db_index=False)
+    day = models.DateField()
+    employee = models.ForeignKey(UserData, on_delete=models.CASCADE, related_name='+')
+    category = models.CharField(max_length=50)
+    status = models.CharField(max_length=20)
+    currency = models.CharField(max_length=10)
+    expense_count = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            # The triggers' upsert target; also serves company + day range reports
+            models.UniqueConstraint(
+                fields=['company', 'day', 'employee', 'category', 'status', 'currency'],
+                name='expense_rollup_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.category} {self.status}: {self.expense_count} ({self.amount} {self.currency})"
+
+
+class QueuedEmail(models.Model):
+    """Outgoing email, sent by ``manage.py send_queued_emails`` instead of on the request"""
+    STATUS_CHOICES = [
+        ('Queued', 'Queued'),
+        ('Sending', 'Sending'),
+        ('Sent', 'Sent'),
+        ('Failed', 'Failed'),
+    ]
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=200)
+    # Cleared once sent or given up on: welcome emails carry a temporary password
+    body = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Failed attempts are retried with a growing delay
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Set by the sender that claimed the email, so no two senders send it
+    claim = models.UUIDField(null=True, blank=True, editable=False)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # The sender works off the oldest queued emails first
+            models.Index(fields=['status', 'id'], name='email_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {self.recipient} ({self.status})"
@@ -0,0 +1,204 @@
+"""Receipt text extraction.
+
+Everything here works on raw file bytes and plain values and never
+touches the ORM, so it can run in worker processes; the queue around it
+lives in ``core.scans``.
+"""
+import io
+import os
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from PIL import Image, ImageOps, ImageStat
+
+try:
+    import pytesseract
+except ImportError:  # pragma: no cover - declared in requirements.txt
+    pytesseract = None
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pragma: no cover - declared in requirements.txt
+    PdfReader = None
+
+# Tesseract gains nothing above this resolution, it only gets slower
+MAX_OCR_SIDE = 2000
+DESKEW_SIDE = 800
+DESKEW_ANGLES = [step / 2 for step in range(-10, 11)]
+# A text layer shorter than this is a scanner stamp, not the receipt
+MIN_TEXT_LAYER = 20
+TESSERACT_CONFIG = '--psm 4'
+
+
+class ExtractionError(Exception):
+    """Raised when no text can be read from a receipt."""
+
+
+def init_worker():
+    """Process pool initializer: the pool already uses every core, so stop
+    tesseract from starting a thread per core in each worker as well."""
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+
+
+def deskew_angle(image):
+    """Angle (degrees, within +/-5) that best straightens the text lines.
+
+    Straight lines of text give rows that are either all ink or all
+    paper, so the variance of the per-row averages peaks at the right
+    rotation. Resizing to one pixel wide with a box filter averages each
+    row without leaving Pillow.
+    """
+    sample = image.copy()
+    sample.thumbnail((DESKEW_SIDE, DESKEW_SIDE))
+    sample = ImageOps.invert(sample)
+    best_angle, best_score = 0, -1
+    for angle in DESKEW_ANGLES:
+        rotated = sample.rotate(angle, resample=Image.BILINEAR, expand=True)
+        rows = rotated.resize((1, rotated.height), Image.BOX)
+        score = ImageStat.Stat(rows).var[0]
+        if score > best_score:
+            best_angle, best_score = angle, score
+    return best_angle
+
+
+def preprocess_image(image):
+    """Grayscale, upright, downscaled and deskewed copy of a receipt photo"""
+    image = ImageOps.exif_transpose(image)
+    image = ImageOps.grayscale(image)
+    image.thumbnail((MAX_OCR_SIDE, MAX_OCR_SIDE))
+    image = ImageOps.autocontrast(image)
+    angle = deskew_angle(image)
+    if angle:
+        image = image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    return image
+
+
+def ocr_image(image):
+    if pytesseract is None:
+        raise ExtractionError('pytesseract is not installed')
+    try:
+        return pytesseract.image_to_string(preprocess_image(image), config=TESSERACT_CONFIG)
+    except pytesseract.TesseractNotFoundError:
+        raise ExtractionError('The tesseract binary is not installed')
+
+
+def open_pdf(content):
+    if PdfReader is None:
+        raise ExtractionError('pypdf is not installed')
+    try:
+        return PdfReader(io.BytesIO(content))
+    except Exception as e:
+        raise ExtractionError(f'Unreadable PDF: {e}')
+
+
+def page_image(page):
+    """The largest image embedded in a PDF page, or None. Scanned PDFs are
+    one image per page, so this is the scan itself."""
+    try:
+        images = list(page.images)
+        return max(images, key=lambda embedded: len(embedded.data)).image if images else None
+    except Exception as e:
+        raise ExtractionError(f'Unreadable PDF image: {e}')
+
+
+def read_pdf(content):
+    """Return ``(text, source)`` for a PDF: its text layer when it has one,
+    otherwise OCR of the scan on the first page."""
+    reader = open_pdf(content)
+    try:
+        text = '\n'.join(page.extract_text() or '' for page in reader.pages)
+    except Exception as e:
+        raise ExtractionError(f'Unreadable PDF: {e}')
+    if len(text.strip()) >= MIN_TEXT_LAYER:
+        return text, 'pdf'
+
+    image = page_image(reader.pages[0]) if reader.pages else None
+    if image is None:
+        raise ExtractionError('The PDF has neither text nor images')
+    return ocr_image(image), 'ocr'
+
+
+AMOUNT_RE = re.compile(r'(?<![\d.])(\d{1,3}(?:[,\s]\d{3})+|\d+)[.,](\d{2})(?!\d)')
+GROUPING_RE = re.compile(r'[,\s]')
+TOTAL_RE = re.compile(r'grand\s*total|amount\s*(?:due|paid|payable)|\btotal\b|\bbalance\b|\bnet\b', re.I)
+SUBTOTAL_RE = re.compile(r'sub\s*-?\s*total', re.I)
+DATE_PATTERNS = [
+    (re.compile(r'\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b'), ('%Y %m %d',)),
+    (re.compile(r'\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})\b'), ('%d %m %Y', '%m %d %Y')),
+    (re.compile(r'\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{2})\b'), ('%d %m %y', '%m %d %y')),
+    (re.compile(r'\b(\d{1,2})\s*([A-Za-z]{3})[a-z]*[\s,.-]*(\d{4})\b'), ('%d %b %Y',)),
+    (re.compile(r'\b([A-Za-z]{3})[a-z]*\s*(\d{1,2}),?\s*(\d{4})\b'), ('%b %d %Y',)),
+]
+NOT_MERCHANT_RE = re.compile(r'receipt|invoice|bill|tax|gst|vat|tel|phone|date|www\.|@|^\W*$', re.I)
+
+
+def parse_amount(text):
+    """The total of a receipt: the last amount on a "total" line, or the
+    largest amount anywhere when no line is labelled."""
+    totals, amounts = [], []
+    for line in text.splitlines():
+        found = []
+        for whole, cents in AMOUNT_RE.findall(line):
+            try:
+                found.append(Decimal(GROUPING_RE.sub('', whole) + '.' + cents))
+            except InvalidOperation:
+                continue
+        amounts.extend(found)
+        if found and TOTAL_RE.search(line) and not SUBTOTAL_RE.search(line):
+            totals.append(found[-1])
+    if totals:
+        return totals[-1]
+    return max(amounts) if amounts else None
+
+
+def parse_date(text, today=None):
+    """First date on the receipt that is not in the future"""
+    today = today or date.today()
+    for line in text.splitlines():
+        for pattern, formats in DATE_PATTERNS:
+            for match in pattern.finditer(line):
+                for fmt in formats:
+                    try:
+                        parsed = datetime.strptime(' '.join(match.groups()), fmt).date()
+                    except ValueError:
+                        continue
+                    if parsed <= today:
+                        return parsed
+    return None
+
+
+def parse_merchant(text):
+    """Receipts open with the merchant's name: the first line that looks like one"""
+    for line in text.splitlines()[:8]:
+        line = ' '.join(line.split())
+        if len(line) < 3 or NOT_MERCHANT_RE.search(line) or AMOUNT_RE.search(line):
+            continue
+        if sum(char.isalpha() for char in line) >= len(line) / 2:
+            return line[:255]
+    return ''
+
+
+def parse_receipt(text):
+    return {
+        'amount': parse_amount(text),
+        'date': parse_date(text),
+        'merchant': parse_merchant(text),
+    }
+
+
+def extract_receipt(content, extension):
+    """Read a receipt file and return its text and the fields found in it.
+
+    Runs in the worker processes of ``manage.py process_receipts``.
+    """
+    if extension == '.pdf':
+        text, source = read_pdf(content)
+    else:
+        try:
+            image = Image.open(io.BytesIO(content))
+            image.load()
+        except Exception as e:
+            raise ExtractionError(f'Unreadable image: {e}')
+        text, source = ocr_image(image), 'ocr'
+    return {'text': text, 'source': source, **parse_receipt(text)}
@@ -0,0 +1,212 @@
+"""Bulk onboarding of a company's users from a CSV or JSON file.
+
+Every row is validated before anything is written: the usernames and
+emails already taken are found with one query, as are the managers named
+by rows that refer to existing users. A row's manager may also be another
+row of the same file. The temporary passwords are hashed on a process
+pool (see core.passwords). The users, their profiles and their default
+approval rules are then inserted with one ``bulk_create`` each, and the
+welcome emails are queued for ``manage.py send_queued_emails``.
+"""
+import csv
+import io
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from user_app.models import UserData
+from .mailqueue import queue_emails
+from .models import ApprovalRules
+from .passwords import generate_password, hash_passwords, init_worker
+
+MAX_IMPORT_USERS = 5000
+FIELDS = ('username', 'email', 'role', 'manager')
+ROLES = {role.lower(): role for role, _ in UserData.ROLE_CHOICES}
+USERNAME_MAX_LENGTH = User._meta.get_field('username').max_length
+
+
+class OnboardingError(Exception):
+    """Raised when an import is rejected; ``errors`` lists ``{'row', 'errors'}`` per bad row."""
+
+    def __init__(self, message, errors=()):
+        super().__init__(message)
+        self.errors = list(errors)
+
+
+def welcome_email(username, password, login_url):
+    """``(subject, body)`` of the email with a new user's credentials"""
+    return 'Welcome to Finora Expense Management', f'''
+            Welcome to Finora Expense Management System!
+
+            Your account has been created with the following credentials:
+
+            Username: {username}
+            Password: {password}
+            Login URL: {login_url}
+
+            Please change your password after your first login.
+
+            Best regards,
+            Finora Team
+            '''
+
+
+def read_user_rows(content, filename):
+    """Rows of a ``.json`` file (a list of objects) or a CSV file with a header line"""
+    try:
+        if filename.lower().endswith('.json'):
+            rows = json.loads(content)
+            if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+                raise OnboardingError('The JSON file must hold a list of objects')
+        else:
+            reader = csv.DictReader(io.StringIO(content.decode('utf-8-sig') if isinstance(content, bytes) else content))
+            if not {'username', 'email', 'role'} <= set(reader.fieldnames or ()):
+                raise OnboardingError('The CSV header must name the columns username, email, role (and optionally manager)')
+            rows = list(reader)
+    except (UnicodeDecodeError, ValueError, csv.Error) as e:
+        raise OnboardingError(f'Cannot read {filename}: {e}')
+    if not rows:
+        raise OnboardingError('The file holds no users')
+    if len(rows) > MAX_IMPORT_USERS:
+        raise OnboardingError(f'Import at most {MAX_IMPORT_USERS} users at once')
+    return [{field: str(row.get(field) or '').strip() for field in FIELDS} for row in rows]
+
+
+def validate_rows(company, rows):
+    """Check every row and resolve its manager.
+
+    Sets ``row['role']`` to its canonical spelling and ``row['manager']``
+    to an existing UserData, the index of another row, or None. Raises
+    OnboardingError listing every bad row.
+    """
+    # Usernames and emails compare case-insensitively, so Alice@x.com is taken by alice@x.com
+    taken_usernames, taken_emails = set(), set()
+    for username, email in User.objects.annotate(username_lower=Lower('username'), email_lower=Lower('email')).filter(
+        Q(username_lower__in={row['username'].lower() for row in rows})
+        | Q(email_lower__in={row['email'].lower() for row in rows})
+    ).values_list('username', 'email'):
+        taken_usernames.add(username.lower())
+        taken_emails.add(email.lower())
+
+    batch = {}
+    for index, row in enumerate(rows):
+        batch.setdefault(row['username'].lower(), index)
+        batch.setdefault(row['email'].lower(), index)
+    references = {row['manager'].lower() for row in rows if row['manager'] and row['manager'].lower() not in batch}
+    existing = {}
+    for manager in UserData.objects.filter(company=company).annotate(
+        username_lower=Lower('user__username'), email_lower=Lower('email')
+    ).filter(Q(username_lower__in=references) | Q(email_lower__in=references)).select_related('user'):
+        existing[manager.user.username.lower()] = existing[(manager.email or '').lower()] = manager
+
+    errors = []
+    seen = set()
+    for index, row in enumerate(rows):
+        problems = []
+        username, email = row['username'].lower(), row['email'].lower()
+        if not row['username'] or len(row['username']) > USERNAME_MAX_LENGTH:
+            problems.append('A username of at most 150 characters is required')
+        elif username in taken_usernames:
+            problems.append('Username already exists')
+        elif username in seen:
+            problems.append('Username appears more than once in the file')
+        try:
+            validate_email(row['email'])
+        except ValidationError:
+            problems.append('A valid email is required')
+        else:
+            if email in taken_emails:
+                problems.append('Email already exists')
+            elif email in seen:
+                problems.append('Email appears more than once in the file')
+        seen.update((username, email))
+
+        role = ROLES.get(row['role'].lower())
+        if role is None:
+            problems.append('Role must be Admin, Manager or Employee')
+        row['role'] = role
+
+        name, reference = row['manager'], row['manager'].lower()
+        row['manager'] = None
+        if reference:
+            if reference in batch:
+                manager_index = batch[reference]
+                manager_role = ROLES.get((rows[manager_index]['role'] or '').lower())
+                if manager_index == index:
+                    problems.append('A user cannot be their own manager')
+                row['manager'] = manager_index
+            elif reference in existing:
+                manager_role = existing[reference].role
+                row['manager'] = existing[reference]
+            else:
+                manager_role = None
+                problems.append(f'Manager {name} not found')
+            if role == 'Admin' and manager_role not in (None, 'Admin'):
+                problems.append('Only admins can manage admins')
+        if problems:
+            errors.append({'row': index + 1, 'username': row['username'], 'errors': problems})
+
+    if errors:
+        raise OnboardingError(f'{len(errors)} of {len(rows)} rows are invalid, no users were created', errors)
+    return rows
+
+
+def import_users(company, rows, login_url, workers=1):
+    """Create the users of validated ``rows`` with temporary passwords,
+    hashed on ``workers`` processes. Returns the created UserData in row order.
+
+    The default hashes in this process; only the management command should
+    pass more workers, since forking a pool inside a web worker is unsafe.
+    """
+    passwords = [generate_password() for _ in rows]
+    if workers > 1 and len(rows) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            hashes = hash_passwords(passwords, executor)
+    else:
+        hashes = hash_passwords(passwords)
+
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(username=row['username'], email=row['email'], password=password_hash)
+            for row, password_hash in zip(rows, hashes)
+        ])
+        # bulk_create skips UserData.save(), which copies these from the user
+        profiles = UserData.objects.bulk_create([
+            UserData(
+                user=user, name=user.username, email=user.email, role=row['role'], company=company,
+                manager=row['manager'] if isinstance(row['manager'], UserData) else None,
+            )
+            for row, user in zip(rows, users)
+        ])
+        # Managers from the same file have ids only now
+        managed = []
+        for row, profile in zip(rows, profiles):
+            if isinstance(row['manager'], int):
+                profile.manager = profiles[row['manager']]
+                managed.append(profile)
+        UserData.objects.bulk_update(managed, ['manager'])
+
+        # Default approval rule, as add_user creates; the rule needs a manager to route to
+        ApprovalRules.objects.bulk_create([
+            ApprovalRules(
+                employee=profile,
+                description=f"Default approval rule for {profile.role}",
+                manager=profile.manager,
+                manager_approval=profile.role == 'Employee',
+                approval_sequence=False,
+                min_approval_percentage=51,
+            )
+            for profile in profiles if profile.role in ('Employee', 'Manager') and profile.manager
+        ])
+
+        queue_emails(
+            (user.email, *welcome_email(user.username, password, login_url))
+            for user, password in zip(users, passwords)
+        )
+    return profiles
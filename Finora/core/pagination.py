@@ -0,0 +1,62 @@
+"""Keyset (cursor) pagination for the expense and approval lists.
+
+Pages are ordered newest first on ``(field, id)`` and each page starts
+strictly after the last row of the previous one, so fetching a page costs
+the same index range scan no matter how deep into the history it is.
+"""
+import base64
+import json
+
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+from django.utils.dateparse import parse_datetime
+
+PAGE_SIZE = 25
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor cannot be decoded."""
+
+
+def encode_cursor(value, pk):
+    payload = json.dumps([value.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, pk = json.loads(base64.urlsafe_b64decode(padded))
+        value = parse_datetime(value)
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+    if value is None or not isinstance(pk, int):
+        raise InvalidCursor('Invalid cursor')
+    return value, pk
+
+
+def keyset_page(queryset, cursor=None, field='created_at', page_size=PAGE_SIZE):
+    """Return ``(rows, next_cursor)`` for the page after ``cursor``.
+
+    ``next_cursor`` is None on the last page. The range filter on ``field``
+    is what walks the index; the exclude only drops the already-seen rows
+    that share the boundary timestamp.
+    """
+    queryset = queryset.order_by(f'-{field}', '-id')
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        queryset = queryset.filter(**{f'{field}__lte': value}).exclude(**{field: value, 'id__gte': pk})
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(getattr(rows[-1], field), rows[-1].pk)
+    return rows, next_cursor
+
+
+def page_response(request, template_name, rows, next_cursor, context=None):
+    """JSON page for the "load more" buttons: the rendered table rows plus
+    the cursor of the following page."""
+    html = render_to_string(template_name, {**(context or {}), 'rows': rows}, request=request)
+    return JsonResponse({'success': True, 'html': html, 'next_cursor': next_cursor, 'count': len(rows)})
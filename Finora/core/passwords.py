@@ -0,0 +1,39 @@
+"""Password hashing on a process pool, for bulk onboarding.
+
+Each PBKDF2 hash deliberately costs a sizeable fraction of a second of
+CPU, so hashing thousands of them is spread over worker processes. This
+module imports no models, so spawned workers can load it before Django
+is set up.
+"""
+import os
+import secrets
+import string
+
+HASH_WORKERS = os.cpu_count() or 1
+
+
+def generate_password(length=12):
+    """Generate a secure random password"""
+    characters = string.ascii_letters + string.digits + "!@#$%^&*"
+    return ''.join(secrets.choice(characters) for _ in range(length))
+
+
+def init_worker():
+    """Process pool initializer: set Django up in spawned workers (forked ones already are)"""
+    from django.apps import apps
+    if not apps.ready:
+        import django
+        django.setup()
+
+
+def hash_password(password):
+    from django.contrib.auth.hashers import make_password
+    return make_password(password)
+
+
+def hash_passwords(passwords, executor=None):
+    """Hashes of ``passwords`` in order, computed on ``executor`` (or inline when it is None)"""
+    if executor is None:
+        return [hash_password(password) for password in passwords]
+    chunk_size = max(1, len(passwords) // (4 * HASH_WORKERS))
+    return list(executor.map(hash_password, passwords, chunksize=chunk_size))
@@ -0,0 +1,15 @@
+"""Who may see an expense and its receipt: the employee who filed it, any
+approver on it, and the admins of its company."""
+from django.db.models import Exists, OuterRef, Q
+
+from .models import Expense, ExpenseApproval
+
+
+def viewable_expenses(user_data):
+    """Expenses ``user_data`` may open, as one indexed query per lookup"""
+    visible = Q(employee=user_data) | Q(Exists(
+        ExpenseApproval.objects.filter(expense=OuterRef('pk'), approver=user_data)
+    ))
+    if user_data.role == 'Admin':
+        visible |= Q(company_id=user_data.company_id)
+    return Expense.objects.filter(visible)
@@ -0,0 +1,111 @@
+"""Expense reports built on the daily rollups (see core.rollups).
+
+Every report groups ``ExpenseRollup`` rows rather than expenses, so its
+cost follows the number of (day, employee, category, status, currency)
+buckets in the period, not the size of core_expense. Amounts are
+converted to the company currency per bucket at the rate of its day
+(core.currency). Buckets without a known rate are left out of the totals
+and counted in ``unconverted``.
+"""
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth, TruncQuarter
+from django.db.models.lookups import IsNull
+from django.utils.dateparse import parse_date
+
+from .currency import converted_amount
+from .models import Expense, ExpenseRollup
+
+PERIODS = {'month': TruncMonth, 'quarter': TruncQuarter}
+TOP_SPENDERS = 10
+MAX_TOP_SPENDERS = 100
+# Drafts have not been claimed yet
+REPORTED_STATUSES = ('Pending', 'Approved', 'Rejected')
+
+
+class ReportError(ValueError):
+    """Raised when a report parameter cannot be parsed."""
+
+
+def report_rollups(company, params):
+    """The company's rollups narrowed by the ``date_from``, ``date_to``,
+    ``status`` and ``category`` parameters"""
+    rollups = ExpenseRollup.objects.filter(company=company)
+    for param, lookup in (('date_from', 'day__gte'), ('date_to', 'day__lte')):
+        if params.get(param):
+            value = parse_date(params[param])
+            if value is None:
+                raise ReportError(f'Invalid {param}, expected YYYY-MM-DD')
+            rollups = rollups.filter(**{lookup: value})
+
+    statuses = [status for status in params.getlist('status') if status] or REPORTED_STATUSES
+    categories = [category for category in params.getlist('category') if category]
+    if not set(statuses) <= {choice for choice, _ in Expense.STATUS_CHOICES}:
+        raise ReportError('Invalid status filter')
+    if not set(categories) <= {choice for choice, _ in Expense.CATEGORY_CHOICES}:
+        raise ReportError('Invalid category filter')
+    rollups = rollups.filter(status__in=statuses)
+    if categories:
+        rollups = rollups.filter(category__in=categories)
+    return rollups.order_by()
+
+
+def measures(currency):
+    return {
+        'count': Sum('expense_count', default=0),
+        'total': Sum(converted_amount(currency, date='day')),
+        'unconverted': Sum('expense_count', filter=IsNull(converted_amount(currency, date='day'), True), default=0),
+    }
+
+
+def measured(row):
+    return {
+        'count': row['count'],
+        'total': float(row['total'] or 0),
+        'unconverted': row['unconverted'],
+    }
+
+
+def trends(rollups, currency, period='month'):
+    """Count and total per month or quarter, oldest first"""
+    if period not in PERIODS:
+        raise ReportError(f'Invalid period, expected one of {", ".join(PERIODS)}')
+    rows = rollups.annotate(period=PERIODS[period]('day')).values('period').annotate(
+        **measures(currency)
+    ).order_by('period')
+    return [{'period': row['period'].strftime('%Y-%m-%d'), **measured(row)} for row in rows]
+
+
+def top_spenders(rollups, currency, limit=TOP_SPENDERS):
+    """The ``limit`` employees with the highest converted totals"""
+    rows = rollups.values('employee_id', 'employee__name').annotate(
+        **measures(currency)
+    ).order_by('-total', 'employee_id')[:limit]
+    return [{'employee_id': row['employee_id'], 'employee': row['employee__name'], **measured(row)} for row in rows]
+
+
+def category_mix(rollups, currency):
+    """Count, total and share of the overall total per category, largest first"""
+    rows = [
+        {'category': row['category'], **measured(row)}
+        for row in rollups.values('category').annotate(**measures(currency)).order_by('-total', 'category')
+    ]
+    overall = sum(row['total'] for row in rows)
+    for row in rows:
+        row['share'] = round(100 * row['total'] / overall, 1) if overall else 0.0
+    return rows
+
+
+def expense_report(company, params):
+    """Trends, top spenders and category mix for the admin report API"""
+    rollups = report_rollups(company, params)
+    try:
+        limit = max(1, min(int(params.get('limit') or TOP_SPENDERS), MAX_TOP_SPENDERS))
+    except ValueError:
+        raise ReportError('Invalid limit, expected a number')
+    return {
+        'currency': company.currency,
+        'totals': measured(rollups.aggregate(**measures(company.currency))),
+        'trends': trends(rollups, company.currency, params.get('period') or 'month'),
+        'top_spenders': top_spenders(rollups, company.currency, limit),
+        'category_mix': category_mix(rollups, company.currency),
+    }
@@ -0,0 +1,97 @@
+"""Daily expense rollups for reports.
+
+``core_expenserollup`` holds one row per (company, day, employee,
+category, status, currency) with the number and amount of expenses
+behind it, so a report reads a few rows per day instead of every
+expense. Like the search index, the table is maintained by SQLite
+triggers on core_expense. This means queryset ``update()`` calls from
+the approval engine and ``bulk_create()`` batches are counted as well as
+``save()``. An update moves the expense from its old bucket to its new
+one, and buckets that drop to zero are deleted. The triggers are
+dropped before every ``migrate`` and re-created after it; run
+``manage.py rebuild_expense_rollups`` to recount everything.
+"""
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+from .models import Expense, ExpenseRollup
+
+ROLLUP_TABLE = ExpenseRollup._meta.db_table
+KEY = 'company_id, day, employee_id, category, status, currency'
+
+ADD_NEW = f"""
+        INSERT INTO {ROLLUP_TABLE} ({KEY}, expense_count, amount)
+        VALUES (new.company_id, new.date, new.employee_id, new.category, new.status, UPPER(new.currency), 1, new.amount)
+        ON CONFLICT ({KEY}) DO UPDATE SET expense_count = expense_count + 1, amount = amount + excluded.amount;
+"""
+
+OLD_KEY = (
+    'company_id = old.company_id AND day = old.date AND employee_id = old.employee_id '
+    'AND category = old.category AND status = old.status AND currency = UPPER(old.currency)'
+)
+
+REMOVE_OLD = f"""
+        UPDATE {ROLLUP_TABLE} SET expense_count = expense_count - 1, amount = amount - old.amount WHERE {OLD_KEY};
+        DELETE FROM {ROLLUP_TABLE} WHERE {OLD_KEY} AND expense_count <= 0;
+"""
+
+TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_expense_rollup_insert AFTER INSERT ON core_expense
+    BEGIN{ADD_NEW}    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_expense_rollup_update
+    AFTER UPDATE OF company_id, date, employee_id, category, status, currency, amount ON core_expense
+    WHEN new.company_id IS NOT old.company_id OR new.date IS NOT old.date
+        OR new.employee_id IS NOT old.employee_id OR new.category IS NOT old.category
+        OR new.status IS NOT old.status OR new.currency IS NOT old.currency OR new.amount IS NOT old.amount
+    BEGIN{REMOVE_OLD}{ADD_NEW}    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_expense_rollup_delete AFTER DELETE ON core_expense
+    BEGIN{REMOVE_OLD}    END
+    """,
+]
+
+TRIGGER_NAMES = ['core_expense_rollup_insert', 'core_expense_rollup_update', 'core_expense_rollup_delete']
+
+
+def drop_rollup_triggers(using=DEFAULT_DB_ALIAS, **kwargs):
+    """pre_migrate handler, the triggers would get in the way of table rebuilds"""
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        for trigger in TRIGGER_NAMES:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+
+
+def install_rollup_triggers(using=DEFAULT_DB_ALIAS, **kwargs):
+    """post_migrate handler re-creating the triggers"""
+    db = connections[using]
+    if db.vendor != 'sqlite' or ROLLUP_TABLE not in db.introspection.table_names():
+        return
+    with db.cursor() as cursor:
+        for trigger in TRIGGERS:
+            cursor.execute(trigger)
+
+
+def rebuild_rollups(chunk_size=5000):
+    """Recount every expense, in id ranges of ``chunk_size``. Returns the number of expenses counted."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {ROLLUP_TABLE}')
+        cursor.execute(f'SELECT MIN(id), MAX(id) FROM {Expense._meta.db_table}')
+        first, last = cursor.fetchone()
+        if first is None:
+            return 0
+        for start in range(first, last + 1, chunk_size):
+            cursor.execute(
+                f'INSERT INTO {ROLLUP_TABLE} ({KEY}, expense_count, amount) '
+                f'SELECT company_id, date, employee_id, category, status, UPPER(currency), COUNT(*), SUM(amount) '
+                f'FROM {Expense._meta.db_table} WHERE id >= %s AND id < %s '
+                f'GROUP BY company_id, date, employee_id, category, status, UPPER(currency) '
+                f'ON CONFLICT ({KEY}) DO UPDATE SET expense_count = expense_count + excluded.expense_count, amount = amount + excluded.amount',
+                [start, start + chunk_size],
+            )
+        cursor.execute(f'SELECT COALESCE(SUM(expense_count), 0) FROM {ROLLUP_TABLE}')
+        return cursor.fetchone()[0]
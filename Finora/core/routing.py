@@ -0,0 +1,134 @@
+"""Turns an employee's ApprovalRules into ExpenseApproval rows on submission.
+
+A rule is compiled into a plan (ordered approver ids plus the decision
+settings) that is cached per rule version, so submissions only read the
+rule row and never the approvers M2M table while the rule is unchanged.
+"""
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Value
+from django.utils import timezone
+
+from .models import Expense, ExpenseApproval, ApprovalRules, approval_status
+
+PLAN_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+class RoutingError(Exception):
+    """Raised when an expense cannot be submitted for approval."""
+
+
+def plan_cache_key(rule):
+    return f'core:approval-plan:{rule.id}:{rule.version}'
+
+
+def compile_approval_plan(rule):
+    """Flatten a rule into the ordered list of approver ids: the manager
+    first when manager approval is required, then the approvers in the
+    order they were configured."""
+    approver_ids = []
+    if rule.manager_approval and rule.manager_id:
+        approver_ids.append(rule.manager_id)
+    configured = ApprovalRules.approvers.through.objects.filter(
+        approvalrules=rule
+    ).order_by('id').values_list('userdata_id', flat=True)
+    for approver_id in configured:
+        if approver_id not in approver_ids:
+            approver_ids.append(approver_id)
+
+    return {
+        'approver_ids': approver_ids,
+        'sequential': rule.approval_sequence,
+        'min_approval_percentage': rule.min_approval_percentage,
+    }
+
+
+def get_approval_plan(employee):
+    """Return the cached approval plan for an employee's rule.
+
+    Employees without a rule are routed to their direct manager, who must
+    then approve on their own.
+    """
+    rule = ApprovalRules.objects.filter(employee=employee).order_by('id').first()
+    if rule is None:
+        return {
+            'approver_ids': [employee.manager_id] if employee.manager_id else [],
+            'sequential': False,
+            'min_approval_percentage': 100,
+        }
+
+    key = plan_cache_key(rule)
+    plan = cache.get(key)
+    if plan is None:
+        plan = compile_approval_plan(rule)
+        cache.set(key, plan, PLAN_CACHE_TIMEOUT)
+    return plan
+
+
+def submit_expenses(expenses):
+    """Route draft expenses to their approvers.
+
+    All approval rows are written with a single bulk_create and the
+    counters of expenses sharing a plan with a single UPDATE. Sequential
+    plans get one step per approver with only the first step Pending.
+    Returns a dict mapping each expense id to None on success or an error
+    message.
+    """
+    results = {}
+    plans = {}
+    submitted = defaultdict(list)
+    approvals = []
+
+    with transaction.atomic():
+        # Only untouched drafts can be submitted; locking them stops a double submit
+        draft_ids = set(Expense.objects.select_for_update().filter(
+            pk__in=[expense.pk for expense in expenses],
+            status='Draft', approved_count=0, rejected_count=0, pending_count=0,
+        ).values_list('pk', flat=True))
+
+        for expense in expenses:
+            if expense.pk not in draft_ids:
+                results[expense.pk] = 'Only draft expenses can be submitted'
+                continue
+            if expense.employee_id not in plans:
+                plans[expense.employee_id] = get_approval_plan(expense.employee)
+            plan = plans[expense.employee_id]
+            if not plan['approver_ids']:
+                results[expense.pk] = 'No approvers are configured for this employee'
+                continue
+
+            # Sequential plans activate one step at a time; later steps wait as Draft
+            approvals.extend(
+                ExpenseApproval(
+                    expense=expense,
+                    approver_id=approver_id,
+                    company_id=expense.company_id,
+                    step=position if plan['sequential'] else 1,
+                    status='Pending' if position == 1 or not plan['sequential'] else 'Draft',
+                )
+                for position, approver_id in enumerate(plan['approver_ids'], start=1)
+            )
+            submitted[(len(plan['approver_ids']), plan['min_approval_percentage'])].append(expense.pk)
+            results[expense.pk] = None
+
+        ExpenseApproval.objects.bulk_create(approvals)
+        now = timezone.now()
+        for (pending, percentage), expense_ids in submitted.items():
+            Expense.objects.filter(pk__in=expense_ids).update(
+                pending_count=pending,
+                min_approval_percentage=percentage,
+                current_step=1,
+                status=approval_status(Value(0), Value(0), Value(pending), Value(percentage)),
+                updated_at=now,
+            )
+
+    return results
+
+
+def submit_expense(expense):
+    """Route a single draft expense, raising RoutingError if it can't be."""
+    error = submit_expenses([expense])[expense.pk]
+    if error:
+        raise RoutingError(error)
@@ -0,0 +1,158 @@
+"""Queue of receipt OCR jobs.
+
+``upload_expense`` only records a ReceiptScan, so the upload returns at
+once; ``manage.py process_receipts`` claims queued scans in batches and
+fans the extraction out to a process pool. Run a single process_receipts
+at a time, it uses every core on its own. Results are cached in
+ReceiptText by the SHA-256 of the file, so a receipt that was read once
+is never OCRed again, whoever uploads it.
+"""
+import hashlib
+import os
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Expense, ReceiptScan, ReceiptText
+from .ocr import ExtractionError, extract_receipt
+
+UPLOAD_DESCRIPTION_PREFIX = 'Uploaded receipt: '
+UPLOAD_REMARK = 'Receipt uploaded for processing'
+READ_REMARK = 'Details read from the receipt, please review them before submitting'
+FAILED_REMARK = 'The receipt could not be read automatically, please enter the details'
+
+
+def draft_expense(employee, filename, blob):
+    """Unsaved draft expense for an uploaded receipt; the OCR workers fill it in"""
+    return Expense(
+        employee=employee,
+        company_id=employee.company_id,
+        description=f"{UPLOAD_DESCRIPTION_PREFIX}{filename}",
+        date=timezone.now().date(),
+        category='Other',
+        amount=0,  # Filled in by the OCR workers
+        currency='INR',
+        remarks=UPLOAD_REMARK,
+        status='Draft',
+        receipt=blob.file.name,
+        receipt_blob=blob
+    )
+
+
+def enqueue_scan(expense):
+    return ReceiptScan.objects.create(expense=expense)
+
+
+def requeue_interrupted():
+    """Put scans left Processing by a worker that died back in the queue.
+
+    Only safe while no other process_receipts is running.
+    """
+    return ReceiptScan.objects.filter(status='Processing').update(status='Queued', updated_at=timezone.now())
+
+
+def claim_scans(limit):
+    """Mark up to ``limit`` queued scans as Processing and return them, oldest first"""
+    with transaction.atomic():
+        ids = list(ReceiptScan.objects.filter(status='Queued').order_by('id').values_list('id', flat=True)[:limit])
+        ReceiptScan.objects.filter(id__in=ids, status='Queued').update(status='Processing', updated_at=timezone.now())
+    return list(ReceiptScan.objects.filter(id__in=ids, status='Processing').select_related('expense').order_by('id'))
+
+
+def read_receipt(expense):
+    with expense.receipt.open('rb') as receipt:
+        return receipt.read()
+
+
+def process_scans(scans, executor=None):
+    """Extract and apply the receipts of ``scans``.
+
+    Receipts already in the cache are not read at all and duplicates
+    within the batch are read once; the rest are submitted to ``executor`` (or run inline when
+    it is None). Returns the number of scans that succeeded.
+    """
+    # Receipts in blob storage are keyed by their digest already, so a
+    # cached result is found without reading the file
+    for scan in scans:
+        scan.content_hash = scan.expense.receipt_blob_id or ''
+    results = ReceiptText.objects.in_bulk([scan.content_hash for scan in scans if scan.content_hash])
+
+    contents = {}
+    for scan in scans:
+        if scan.content_hash in results or scan.content_hash in contents:
+            continue
+        try:
+            content = read_receipt(scan.expense)
+        except (OSError, ValueError) as e:
+            scan.error = f'Receipt file unavailable: {e}'
+            continue
+        scan.content_hash = scan.content_hash or hashlib.sha256(content).hexdigest()
+        extension = os.path.splitext(scan.expense.receipt.name)[1].lower()
+        contents.setdefault(scan.content_hash, (content, extension))
+
+    results.update(ReceiptText.objects.in_bulk([key for key in contents if key not in results]))
+    errors = {}
+    pending = {
+        content_hash: (executor.submit(extract_receipt, *job) if executor else job)
+        for content_hash, job in contents.items() if content_hash not in results
+    }
+    for content_hash, job in pending.items():
+        try:
+            extracted = job.result() if executor else extract_receipt(*job)
+        except ExtractionError as e:
+            errors[content_hash] = str(e)
+            continue
+        except Exception as e:
+            errors[content_hash] = f'Extraction crashed: {e!r}'
+            continue
+        results[content_hash] = ReceiptText.objects.create(content_hash=content_hash, **extracted)
+
+    succeeded = 0
+    for scan in scans:
+        result = results.get(scan.content_hash)
+        if result is None:
+            fail_scan(scan, scan.error or errors.get(scan.content_hash, 'Extraction failed'))
+        else:
+            apply_scan(scan, result)
+            succeeded += 1
+    return succeeded
+
+
+def apply_scan(scan, result):
+    """Fill in the fields the employee has not entered yet from ``result``"""
+    fields = ['updated_at']
+    with transaction.atomic():
+        # The employee may have edited or submitted the expense while it was read
+        expense = Expense.objects.select_for_update().get(pk=scan.expense_id)
+        if expense.status == 'Draft':
+            if not expense.amount and result.amount:
+                expense.amount = result.amount
+                fields.append('amount')
+            # The placeholder description means nothing was edited since the upload
+            if expense.description.startswith(UPLOAD_DESCRIPTION_PREFIX):
+                if result.date:
+                    expense.date = result.date
+                    fields.append('date')
+                if result.merchant:
+                    expense.description = result.merchant
+                    fields.append('description')
+            if expense.remarks == UPLOAD_REMARK:
+                expense.remarks = READ_REMARK
+                fields.append('remarks')
+            if len(fields) > 1:
+                expense.save(update_fields=fields)
+        scan.expense = expense
+
+        scan.status = 'Done'
+        scan.error = ''
+        scan.save(update_fields=['status', 'content_hash', 'error', 'updated_at'])
+
+
+def fail_scan(scan, error):
+    with transaction.atomic():
+        Expense.objects.filter(pk=scan.expense_id, remarks=UPLOAD_REMARK).update(
+            remarks=FAILED_REMARK, updated_at=timezone.now()
+        )
+        scan.status = 'Failed'
+        scan.error = error
+        scan.save(update_fields=['status', 'content_hash', 'error', 'updated_at'])
@@ -0,0 +1,145 @@
+"""Full-text search over expense descriptions, remarks and employee names.
+
+Backed by the SQLite FTS5 table ``core_expense_fts`` whose rowid is the
+expense id. Triggers keep it in sync with core_expense (and the employee
+names with user_app_userdata), so queryset ``update()`` and
+``bulk_create()`` calls are indexed as well as ``save()``. Django
+rebuilds core_expense on SQLite for some schema changes, which the
+triggers get in the way of, so they are dropped before every ``migrate``
+and re-created after it; run ``manage.py rebuild_expense_search`` to
+re-index existing rows.
+"""
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models.expressions import RawSQL
+
+from .models import Expense
+
+FTS_TABLE = 'core_expense_fts'
+SEARCH_LIMIT = 50
+
+# Column weights for bm25(): description, remarks, employee name
+RANK = f'bm25({FTS_TABLE}, 2.0, 1.0, 1.0)'
+
+EMPLOYEE_NAME = 'SELECT name FROM user_app_userdata WHERE id = new.employee_id'
+
+TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_expense_fts_insert AFTER INSERT ON core_expense
+    BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, description, remarks, employee_name)
+        VALUES (new.id, new.description, COALESCE(new.remarks, ''), ({EMPLOYEE_NAME}));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_expense_fts_update AFTER UPDATE OF description, remarks, employee_id ON core_expense
+    WHEN new.description IS NOT old.description OR new.remarks IS NOT old.remarks
+        OR new.employee_id IS NOT old.employee_id
+    BEGIN
+        UPDATE {FTS_TABLE}
+        SET description = new.description, remarks = COALESCE(new.remarks, ''), employee_name = ({EMPLOYEE_NAME})
+        WHERE rowid = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_expense_fts_delete AFTER DELETE ON core_expense
+    BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_expense_fts_employee AFTER UPDATE OF name ON user_app_userdata
+    WHEN new.name IS NOT old.name
+    BEGIN
+        UPDATE {FTS_TABLE} SET employee_name = new.name
+        WHERE rowid IN (SELECT id FROM core_expense WHERE employee_id = new.id);
+    END
+    """,
+]
+
+TRIGGER_NAMES = [
+    'core_expense_fts_insert', 'core_expense_fts_update', 'core_expense_fts_delete', 'core_expense_fts_employee',
+]
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def drop_search_triggers(using=DEFAULT_DB_ALIAS, **kwargs):
+    """pre_migrate handler. A table rebuild renames core_expense, which
+    SQLite refuses while the user_app_userdata trigger refers to it."""
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        for trigger in TRIGGER_NAMES:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+
+
+def install_search_triggers(using=DEFAULT_DB_ALIAS, **kwargs):
+    """post_migrate handler re-creating the triggers"""
+    db = connections[using]
+    if db.vendor != 'sqlite' or FTS_TABLE not in db.introspection.table_names():
+        return
+    with db.cursor() as cursor:
+        for trigger in TRIGGERS:
+            cursor.execute(trigger)
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query: every word has to match and the
+    last one may be a prefix, so results narrow while the user types."""
+    terms = [f'"{token}"' for token in TOKEN_RE.findall(text)]
+    if terms:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def matching_ids(query):
+    """Subquery of the ids of expenses matching an FTS5 query, for id__in filters"""
+    return RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (query,))
+
+
+def search_expenses(text, limit=SEARCH_LIMIT, **scope):
+    """Return the expenses matching ``text``, best match first.
+
+    ``scope`` restricts the search by equality on core_expense columns,
+    e.g. ``company_id=...`` or ``employee_id=...``.
+    """
+    query = fts_query(text)
+    if not query:
+        return []
+
+    conditions = ''.join(f' AND e.{connection.ops.quote_name(column)} = %s' for column in scope)
+    sql = (
+        f'SELECT e.id FROM {FTS_TABLE} JOIN {Expense._meta.db_table} e ON e.id = {FTS_TABLE}.rowid '
+        f'WHERE {FTS_TABLE} MATCH %s{conditions} ORDER BY {RANK} LIMIT %s'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [query, *scope.values(), limit])
+        ids = [row[0] for row in cursor.fetchall()]
+
+    expenses = Expense.objects.select_related('employee').order_by().in_bulk(ids)
+    return [expenses[pk] for pk in ids if pk in expenses]
+
+
+def rebuild_search_index(chunk_size=5000):
+    """Re-index every expense, in id ranges of ``chunk_size``. Returns the row count."""
+    indexed = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(f'SELECT MIN(id), MAX(id) FROM {Expense._meta.db_table}')
+        first, last = cursor.fetchone()
+        if first is None:
+            return 0
+        for start in range(first, last + 1, chunk_size):
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, description, remarks, employee_name) '
+                f'SELECT e.id, e.description, COALESCE(e.remarks, \'\'), u.name '
+                f'FROM {Expense._meta.db_table} e JOIN user_app_userdata u ON u.id = e.employee_id '
+                f'WHERE e.id >= %s AND e.id < %s',
+                [start, start + chunk_size],
+            )
+            indexed += cursor.rowcount
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return indexed
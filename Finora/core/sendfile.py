@@ -0,0 +1,139 @@
+"""Serving stored files without streaming them through Python.
+
+Views check access and validators, then hand the transfer over. With
+``settings.SENDFILE_BACKEND`` set the response is empty apart from an
+``X-Sendfile`` (Apache mod_xsendfile, lighttpd) or ``X-Accel-Redirect``
+(nginx) header, and the front-end server sends the file itself, range
+requests included. Without one (runserver, tests) the file is streamed
+from here, still honouring a single byte range so large PDFs can be paged
+through.
+
+nginx needs an internal location aliased to MEDIA_ROOT::
+
+    location /protected-media/ {
+        internal;
+        alias /path/to/Finora/media/;
+    }
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+SENDFILE_HEADERS = {
+    'x-sendfile': 'X-Sendfile',
+    'x-accel': 'X-Accel-Redirect',
+}
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 64 * 1024
+
+
+def parse_range(header, size):
+    """Return ``(start, end)`` (inclusive) of a single byte range, None to
+    send the whole file, or False when the range is unsatisfiable.
+
+    Multiple ranges are answered with the whole file, which RFC 9110 allows.
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        return (max(size - length, 0), size - 1) if length and size else False
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    return (start, end) if start < size else False
+
+
+def if_range_matches(request, etag, last_modified):
+    """Whether a Range may be honoured: the If-Range validator, if any, must
+    still match (strong ETag comparison, or the exact Last-Modified date)."""
+    validator = request.headers.get('If-Range')
+    if not validator:
+        return True
+    if validator.startswith(('"', 'W/')):
+        return bool(etag) and not validator.startswith('W/') and validator == etag
+    return last_modified is not None and parse_http_date_safe(validator) == last_modified
+
+
+def file_range(file, start, length):
+    with file:
+        file.seek(start)
+        while length > 0:
+            data = file.read(min(BLOCK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def offload_response(name, storage):
+    header = SENDFILE_HEADERS[settings.SENDFILE_BACKEND]
+    response = HttpResponse()
+    if settings.SENDFILE_BACKEND == 'x-accel':
+        response[header] = settings.SENDFILE_URL + quote(name)
+    else:
+        response[header] = storage.path(name)
+    return response
+
+
+def stream_response(request, name, storage, etag, last_modified):
+    try:
+        file = storage.open(name, 'rb')
+        size = storage.size(name)
+    except (FileNotFoundError, NotImplementedError):
+        raise Http404('File not found')
+
+    byte_range = None
+    if 'Range' in request.headers and if_range_matches(request, etag, last_modified):
+        byte_range = parse_range(request.headers['Range'], size)
+    if byte_range is False:
+        file.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    start, end = byte_range or (0, size - 1)
+    response = StreamingHttpResponse(file_range(file, start, end - start + 1), status=206 if byte_range else 200)
+    response['Content-Length'] = str(end - start + 1)
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def send_file(request, name, etag=None, last_modified=None, filename=None, content_type=None, storage=default_storage):
+    """Respond with the stored file ``name`` once the caller has checked access.
+
+    ``etag`` (unquoted or quoted) and ``last_modified`` (a datetime) are
+    sent as validators and answered with 304 when the client's copy is
+    current. ``filename`` is suggested to the browser for saving.
+    """
+    etag = quote_etag(etag) if etag else None
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        if settings.SENDFILE_BACKEND:
+            response = offload_response(name, storage)
+        else:
+            response = stream_response(request, name, storage, etag, timestamp)
+        if response.status_code == 416:
+            return response
+        response['Content-Type'] = content_type or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        response['Content-Disposition'] = content_disposition_header(False, filename or os.path.basename(name))
+        response['Accept-Ranges'] = 'bytes'
+
+    if etag:
+        response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    return response
@@ -0,0 +1,170 @@
+"""Near-duplicate receipt detection.
+
+A re-photographed receipt (cropped, slightly rotated, re-compressed) has
+different bytes but nearly the same difference hash: a 64-bit dHash of
+the receipt's thumbnail with the paper margins trimmed off. Hashes are
+stored once per ReceiptBlob, and each company's hashes are held in an
+in-process BK-tree. Hamming-distance lookups in the tree only visit the
+branches that can hold a match, not every receipt.
+
+Trees are built on first use and then extended with the expenses filed
+since, read by (company, id) range. ``manage.py hash_receipts`` bumps
+HASH_VERSION_KEY after a backfill so that, with a shared cache backend,
+every process rebuilds its trees. Deleted expenses drop out when the
+candidates are re-read.
+"""
+import threading
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .derivatives import get_derivative
+from .models import Expense, ReceiptBlob
+from .ocr import ExtractionError
+
+HASH_SIZE = 8
+# Bits out of 64 two photos of the same receipt may differ by
+SIMILAR_DISTANCE = 10
+HASH_VERSION_KEY = 'core:receipt-hash-version'
+# Anything darker than this is ink when trimming the margins
+INK_LEVEL = 160
+
+
+def dhash(image):
+    """64-bit difference hash, as 16 hex digits: whether each pixel is
+    brighter than its right-hand neighbour on a 9x8 grayscale grid of the
+    receipt with its paper margins trimmed."""
+    image = ImageOps.grayscale(image)
+    box = image.point(lambda level: 255 if level < INK_LEVEL else 0).getbbox()
+    if box:
+        image = image.crop(box)
+    pixels = list(image.resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(HASH_SIZE):
+        for column in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + column]
+            bits = bits << 1 | (left > pixels[row * (HASH_SIZE + 1) + column + 1])
+    return f'{bits:0{HASH_SIZE * HASH_SIZE // 4}x}'
+
+
+def distance(a, b):
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+def receipt_hash(expense):
+    """Hash of an expense's receipt, from its (cached) thumbnail"""
+    with default_storage.open(get_derivative(expense, 'thumbnail'), 'rb') as thumbnail:
+        return dhash(Image.open(thumbnail))
+
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance.
+
+    Every node's children are keyed by their distance to the node, so by
+    the triangle inequality a search of radius ``r`` from a node at
+    distance ``d`` only descends into children keyed ``d - r`` to ``d + r``.
+    """
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, key, value):
+        if self.root is None:
+            self.root = (key, [value], {})
+            return
+        node = self.root
+        while True:
+            node_key, values, children = node
+            gap = distance(key, node_key)
+            if gap == 0:
+                values.append(value)
+                return
+            if gap not in children:
+                children[gap] = (key, [value], {})
+                return
+            node = children[gap]
+
+    def search(self, key, radius):
+        """Yield ``(distance, value)`` for every value within ``radius`` of ``key``"""
+        pending = [self.root] if self.root else []
+        while pending:
+            node_key, values, children = pending.pop()
+            gap = distance(key, node_key)
+            if gap <= radius:
+                for value in values:
+                    yield gap, value
+            for child_gap, child in children.items():
+                if gap - radius <= child_gap <= gap + radius:
+                    pending.append(child)
+
+
+class CompanyIndex:
+    def __init__(self, version):
+        self.version = version
+        self.tree = BKTree()
+        self.last_id = 0
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def company_index(company_id):
+    """The company's BK-tree, extended with any expenses filed since it was last used"""
+    version = cache.get_or_set(HASH_VERSION_KEY, 1, None)
+    with _lock:
+        index = _indexes.get(company_id)
+        if index is None or index.version != version:
+            index = _indexes[company_id] = CompanyIndex(version)
+        new = Expense.objects.filter(
+            company_id=company_id, id__gt=index.last_id, receipt_blob__phash__gt=''
+        ).order_by('id').values_list('id', 'receipt_blob__phash')
+        for expense_id, phash in new.iterator():
+            index.tree.add(phash, expense_id)
+            index.last_id = expense_id
+    return index
+
+
+def similar_expenses(expense, phash, radius=SIMILAR_DISTANCE):
+    """Earlier expenses of the company whose receipts are within ``radius``
+    of ``phash``, as ``(distance, expense_id)`` closest first"""
+    index = company_index(expense.company_id)
+    with _lock:
+        matches = [(gap, pk) for gap, pk in index.tree.search(phash, radius) if pk < expense.pk]
+    existing = set(Expense.objects.filter(company_id=expense.company_id, id__in=[pk for _, pk in matches])
+                   .order_by().values_list('id', flat=True))
+    return sorted(match for match in matches if match[1] in existing)
+
+
+def hash_receipt(expense):
+    """The hash of the expense's receipt blob, computed and saved on first use.
+    None when there is no blob or it cannot be read."""
+    blob = expense.receipt_blob
+    if blob is None:
+        return None
+    if not blob.phash:
+        try:
+            blob.phash = receipt_hash(expense)
+        except (OSError, ValueError, ExtractionError, Image.DecompressionBombError):
+            # An unreadable receipt simply goes unchecked
+            return None
+        ReceiptBlob.objects.filter(pk=blob.pk).update(phash=blob.phash)
+    return blob.phash
+
+
+def flag_similar_receipt(expense):
+    """Point ``similar_receipt`` at the closest earlier receipt of the
+    company, if one is close enough. Returns the match's id or None."""
+    phash = hash_receipt(expense)
+    if phash is None:
+        return None
+
+    matches = similar_expenses(expense, phash)
+    if matches:
+        expense.similar_receipt_id = matches[0][1]
+        Expense.objects.filter(pk=expense.pk).update(
+            similar_receipt=expense.similar_receipt_id, updated_at=timezone.now()
+        )
+    return expense.similar_receipt_id
@@ -1,3 +1,1597 @@
-from django.test import TestCase
+import csv
+import hashlib
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import uuid
+import zipfile
+from datetime import date
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Count, Sum
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from user_app.models import UserData, CompanyData
+from .models import Expense, ExpenseApproval, ApprovalRules, ExchangeRate, ExpenseRollup, QueuedEmail, ReceiptBlob, ReceiptScan, ReceiptText, UploadSession
+from . import currency
+from .currency import convert, converted_amount, get_rate, load_rates
+from .derivatives import DERIVATIVE_SIZES, derivative_name
+from .exports import HEADER, export_rows
+from .ingest import IngestError, ingest_expenses
+from .mailqueue import queue_emails, send_queued_emails
+from .ocr import parse_receipt
+from .onboarding import OnboardingError, read_user_rows, validate_rows
+from .pagination import PAGE_SIZE, encode_cursor, keyset_page
+from .rollups import rebuild_rollups
+from .routing import RoutingError, submit_expense, submit_expenses
+from .scans import claim_scans, process_scans
+from .search import search_expenses
+from . import similarity
+
+
+class ExpenseFixtureTestCase(TestCase):
+    """A company with an employee, their manager, an admin and five Travel
+    expenses, three of them approved by the manager."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = CompanyData.objects.create(name='Acme', country='India', currency='INR')
+        cls.employee = cls.create_user_data('employee', 'Employee')
+        cls.manager = cls.create_user_data('manager', 'Manager')
+        cls.admin = cls.create_user_data('admin', 'Admin')
+        cls.employee.manager = cls.manager
+        cls.employee.save()
+
+        for i in range(5):
+            expense = Expense.objects.create(
+                employee=cls.employee,
+                description=f'Expense {i}',
+                date=date(2025, 10, i + 1),
+                category='Travel',
+                amount=100 + i,
+                status='Pending',
+            )
+            ExpenseApproval.objects.create(
+                expense=expense,
+                approver=cls.manager,
+                status='Pending' if i % 2 else 'Approved',
+            )
+
+    @classmethod
+    def create_user_data(cls, username, role):
+        user = User.objects.create_user(username=username, email=f'{username}@acme.test', password='secret')
+        return UserData.objects.create(user=user, company=cls.company, role=role)
+
+
+class QueryPlanTestCase(ExpenseFixtureTestCase):
+    """Runs EXPLAIN QUERY PLAN on every query a view issues against the
+    tables listed in ``watched_tables`` and fails on full scans or temp sorts."""
+
+    watched_tables = ('core_expense', 'core_expenseapproval', 'user_app_companydata')
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def watched_queries(self, captured):
+        for query in captured.captured_queries:
+            sql = query['sql']
+            if sql.startswith('SELECT') and any(f'"{table}"' in sql for table in self.watched_tables):
+                yield sql
+
+    def assertIndexedPlan(self, sql, allow_scan=False):
+        plan = self.explain(sql)
+        for step in plan:
+            self.assertNotIn('USE TEMP B-TREE', step, f'Temp sort in plan {plan} for {sql}')
+            if not allow_scan:
+                scanned = step.split()[1] if step.startswith('SCAN ') else None
+                self.assertNotIn(scanned, self.watched_tables, f'Full scan in plan {plan} for {sql}')
+
+    def assertViewUsesIndexes(self, user_data, url, method='get', **kwargs):
+        self.client.force_login(user_data.user)
+        with CaptureQueriesContext(connection) as captured:
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 400)
+        queries = list(self.watched_queries(captured))
+        self.assertTrue(queries, f'No watched queries captured for {url}')
+        for sql in queries:
+            self.assertIndexedPlan(sql)
+        return response
+
+    def assertQuerysetUsesIndexes(self, queryset):
+        with CaptureQueriesContext(connection) as captured:
+            list(queryset)
+        for sql in self.watched_queries(captured):
+            self.assertIndexedPlan(sql)
+
+
+class ExpenseQueryPlanTests(QueryPlanTestCase):
+
+    def test_employee_dashboard(self):
+        self.assertViewUsesIndexes(self.employee, reverse('core:employee_dashboard'))
+
+    def test_manager_dashboard(self):
+        self.assertViewUsesIndexes(self.manager, reverse('core:manager_dashboard'))
+
+    def test_manager_history(self):
+        self.assertViewUsesIndexes(self.manager, reverse('core:manager_history'))
+
+    def test_default_ordering(self):
+        # Unfiltered listings walk the ordering index; they must never sort.
+        sql = str(Expense.objects.all()[:25].query)
+        self.assertIndexedPlan(sql, allow_scan=True)
+        self.assertTrue(any('expense_date_created_idx' in step for step in self.explain(sql)))
+
+    def test_signup_company_lookup(self):
+        with CaptureQueriesContext(connection) as captured:
+            self.client.post(reverse('user_app:signup'), {
+                'username': 'founder',
+                'email': 'founder@acme.test',
+                'password': 'secret',
+                'confirm_password': 'secret',
+                'company_name': 'Acme',
+                'country': 'India',
+                'currency': 'INR',
+            })
+        queries = list(self.watched_queries(captured))
+        self.assertTrue(queries)
+        for sql in queries:
+            self.assertIndexedPlan(sql)
+
+    def test_admin_dashboard(self):
+        self.assertViewUsesIndexes(self.admin, reverse('core:admin_dashboard'))
+
+    def test_admin_company_listings(self):
+        # Querysets built by Frontend.admin_views (admin_expenses, admin_approvals, admin_reports)
+        self.assertQuerysetUsesIndexes(Expense.objects.filter(company=self.company).order_by('-created_at'))
+        self.assertQuerysetUsesIndexes(
+            ExpenseApproval.objects.filter(company=self.company, status='Pending').order_by('-created_at')
+        )
+        for field in ('category', 'status'):
+            self.assertQuerysetUsesIndexes(
+                Expense.objects.filter(company=self.company).values(field).annotate(count=Count('id'))
+            )
+
+
+class CompanyDenormalizationTests(QueryPlanTestCase):
+
+    def test_company_copied_on_create(self):
+        expense = Expense.objects.create(
+            employee=self.employee, description='Taxi', date=date(2025, 10, 10), amount=20,
+        )
+        approval = ExpenseApproval.objects.create(expense=expense, approver=self.manager)
+        self.assertEqual(expense.company_id, self.company.id)
+        self.assertEqual(approval.company_id, self.company.id)
+
+    def test_admin_dashboard_skips_employee_join(self):
+        self.client.force_login(self.admin.user)
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(reverse('core:admin_dashboard'))
+        for sql in self.watched_queries(captured):
+            if '"core_expense' in sql:
+                self.assertNotIn('JOIN "user_app_userdata"', sql)
+
+
+class ApprovalStatusEngineTests(ExpenseFixtureTestCase):
+
+    def create_expense(self, percentage=100, approvers=1):
+        expense = Expense.objects.create(
+            employee=self.employee, description='Hotel', date=date(2025, 10, 12), amount=300,
+            min_approval_percentage=percentage,
+        )
+        approvals = [
+            ExpenseApproval.objects.create(expense=expense, approver=self.manager, status='Pending')
+            for _ in range(approvers)
+        ]
+        return expense, approvals
+
+    def test_counters_follow_approval_changes(self):
+        expense, (approval,) = self.create_expense()
+        expense.refresh_from_db()
+        self.assertEqual((expense.pending_count, expense.status), (1, 'Pending'))
+
+        approval.status = 'Approved'
+        with CaptureQueriesContext(connection) as captured:
+            approval.save()
+        self.assertFalse([q for q in captured.captured_queries
+                          if q['sql'].startswith('SELECT') and 'core_expenseapproval' in q['sql']])
+        expense.refresh_from_db()
+        self.assertEqual((expense.approved_count, expense.pending_count, expense.status), (1, 0, 'Approved'))
+
+        approval.delete()
+        expense.refresh_from_db()
+        self.assertEqual((expense.approved_count, expense.status), (0, 'Draft'))
+
+    def test_min_approval_percentage(self):
+        expense, approvals = self.create_expense(percentage=50, approvers=2)
+        approvals[0].status = 'Rejected'
+        approvals[0].save()
+        expense.refresh_from_db()
+        self.assertEqual(expense.status, 'Pending')
+
+        approvals[1].status = 'Approved'
+        approvals[1].save()
+        expense.refresh_from_db()
+        self.assertEqual(expense.status, 'Approved')
+
+    def test_unreachable_percentage_rejects(self):
+        expense, approvals = self.create_expense(percentage=100, approvers=3)
+        approvals[0].status = 'Rejected'
+        approvals[0].save()
+        expense.refresh_from_db()
+        self.assertEqual(expense.status, 'Rejected')
+
+    def test_recompute_command(self):
+        expense, approvals = self.create_expense(approvers=2)
+        ExpenseApproval.objects.filter(expense=expense).update(status='Approved')
+        Expense.objects.filter(pk=expense.pk).update(approved_count=0, pending_count=0, status='Draft')
+
+        call_command('recompute_approval_counters', chunk_size=2, stdout=StringIO())
+        expense.refresh_from_db()
+        self.assertEqual((expense.approved_count, expense.pending_count, expense.status), (2, 0, 'Approved'))
+
+
+class ApprovalRoutingTests(ExpenseFixtureTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.approver = self.create_user_data('approver', 'Manager')
+        self.rule = ApprovalRules.objects.create(
+            employee=self.employee, description='Travel policy', manager=self.manager,
+            manager_approval=True, min_approval_percentage=50,
+        )
+        self.rule.approvers.add(self.approver)
+
+    def create_draft(self):
+        return Expense.objects.create(
+            employee=self.employee, description='Flight', date=date(2025, 10, 20), amount=500,
+        )
+
+    def test_submit_creates_approvals_from_rule(self):
+        expense = self.create_draft()
+        submit_expense(expense)
+        expense.refresh_from_db()
+        self.assertEqual(
+            list(expense.approvals.values_list('approver_id', 'status')),
+            [(self.manager.id, 'Pending'), (self.approver.id, 'Pending')],
+        )
+        self.assertEqual((expense.status, expense.pending_count, expense.min_approval_percentage), ('Pending', 2, 50))
+
+        with self.assertRaises(RoutingError):
+            submit_expense(expense)
+
+    def test_plan_cached_per_rule_version(self):
+        submit_expense(self.create_draft())
+        through_table = ApprovalRules.approvers.through._meta.db_table
+
+        with CaptureQueriesContext(connection) as captured:
+            submit_expenses([self.create_draft() for _ in range(3)])
+        sql = [query['sql'] for query in captured.captured_queries]
+        self.assertFalse([q for q in sql if through_table in q])
+        self.assertEqual(len([q for q in sql if q.startswith('INSERT INTO "core_expenseapproval"')]), 1)
+
+        self.rule.approvers.clear()
+        self.rule.save()
+        expense = self.create_draft()
+        submit_expense(expense)
+        self.assertEqual(list(expense.approvals.values_list('approver_id', flat=True)), [self.manager.id])
+
+    def test_sequential_chain_activates_one_step_at_a_time(self):
+        self.rule.approval_sequence = True
+        self.rule.min_approval_percentage = 100
+        self.rule.save()
+        expense = self.create_draft()
+        submit_expense(expense)
+        expense.refresh_from_db()
+        first, second = expense.approvals.order_by('step')
+        self.assertEqual((expense.current_step, expense.pending_count), (1, 2))
+        self.assertEqual([(first.step, first.status), (second.step, second.status)],
+                         [(1, 'Pending'), (2, 'Draft')])
+        self.assertFalse(ExpenseApproval.objects.filter(approver=self.approver, status='Pending').exists())
+
+        first.status = 'Approved'
+        first.save()
+        expense.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((expense.current_step, expense.status, second.status), (2, 'Pending', 'Pending'))
+
+        second.status = 'Approved'
+        second.save()
+        expense.refresh_from_db()
+        self.assertEqual((expense.current_step, expense.status), (2, 'Approved'))
+
+    def test_sequential_chain_after_rejection(self):
+        self.rule.approval_sequence = True
+        self.rule.save()
+        expense = self.create_draft()
+        submit_expense(expense)
+        first = expense.approvals.get(step=1)
+        first.status = 'Rejected'
+        first.save()
+        expense.refresh_from_db()
+        # 50% of two approvals can still be reached, so the chain moves on
+        self.assertEqual((expense.status, expense.current_step), ('Pending', 2))
+
+        self.rule.min_approval_percentage = 100
+        self.rule.save()
+        expense = self.create_draft()
+        submit_expense(expense)
+        first = expense.approvals.get(step=1)
+        first.status = 'Rejected'
+        first.save()
+        expense.refresh_from_db()
+        # Decided: the rest of the chain is never activated
+        self.assertEqual((expense.status, expense.current_step), ('Rejected', 1))
+        self.assertEqual(expense.approvals.get(step=2).status, 'Draft')
+
+
+class BulkApprovalTests(ExpenseFixtureTestCase):
+
+    def test_bulk_approve(self):
+        pending = list(Expense.objects.filter(approvals__status='Pending').values_list('id', flat=True))
+        Expense.objects.filter(pk=pending[1]).update(remarks='Client visit')
+        approved = Expense.objects.filter(approvals__status='Approved').values_list('id', flat=True).first()
+        self.client.force_login(self.manager.user)
+
+        response = self.client.post(
+            reverse('core:bulk_approve_expenses'),
+            data=json.dumps({'expense_ids': pending + [approved], 'action': 'approve', 'remarks': 'Month end'}),
+            content_type='application/json',
+        )
+        results = {item['expense_id']: item for item in response.json()['results']}
+        for expense_id in pending:
+            self.assertEqual((results[expense_id]['success'], results[expense_id]['status']), (True, 'Approved'))
+        self.assertFalse(results[approved]['success'])
+
+        expense = Expense.objects.get(pk=pending[0])
+        self.assertEqual((expense.approved_count, expense.pending_count), (1, 0))
+        self.assertEqual(expense.remarks, 'Manager Note: Month end')
+        self.assertEqual(Expense.objects.get(pk=pending[1]).remarks, 'Client visit\nManager Note: Month end')
+        self.assertFalse(ExpenseApproval.objects.filter(approver=self.manager, status='Pending').exists())
+
+    def test_single_and_bulk_store_the_same_note(self):
+        single, bulk = Expense.objects.filter(approvals__status='Pending').values_list('id', flat=True)
+        self.client.force_login(self.manager.user)
+        for remarks in (None, ' Client visit'):
+            Expense.objects.filter(pk__in=[single, bulk]).update(remarks=remarks)
+            ExpenseApproval.objects.filter(expense__in=[single, bulk]).update(status='Pending')
+
+            self.client.post(reverse('core:approve_expense', args=[single]), content_type='application/json',
+                             data=json.dumps({'action': 'approve', 'remarks': 'Looks fine '}))
+            self.client.post(reverse('core:bulk_approve_expenses'), content_type='application/json',
+                             data=json.dumps({'expense_ids': [bulk], 'action': 'approve', 'remarks': 'Looks fine '}))
+
+            stored = Expense.objects.get(pk=single).remarks
+            self.assertEqual(stored, Expense.objects.get(pk=bulk).remarks)
+            self.assertEqual(stored, f"{remarks}\nManager Note: Looks fine" if remarks else 'Manager Note: Looks fine')
+
+
+class KeysetPaginationTests(QueryPlanTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        created_at = Expense.objects.order_by('created_at').first().created_at
+        for i in range(PAGE_SIZE + 5):
+            Expense.objects.create(employee=cls.employee, description=f'Extra {i}', date=date(2025, 9, 1), amount=1)
+        # Shared timestamps exercise the id tie-breaker
+        Expense.objects.filter(description__startswith='Extra').update(created_at=created_at)
+
+    def test_pages_cover_every_row_once(self):
+        expenses = Expense.objects.filter(employee=self.employee)
+        seen, cursor = [], None
+        while True:
+            rows, cursor = keyset_page(expenses, cursor)
+            seen.extend(row.id for row in rows)
+            if not cursor:
+                break
+        self.assertEqual(seen, list(expenses.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    def test_page_endpoint(self):
+        self.client.force_login(self.employee.user)
+        first = self.client.get(reverse('core:employee_dashboard'))
+        self.assertEqual(len(first.context['expenses']), PAGE_SIZE)
+
+        url = reverse('core:employee_expenses_page')
+        response = self.assertViewUsesIndexes(self.employee, url, data={'cursor': first.context['next_cursor']})
+        data = response.json()
+        self.assertEqual((data['count'], data['next_cursor']), (Expense.objects.count() - PAGE_SIZE, None))
+
+        self.assertFalse(self.client.get(url, {'cursor': 'garbage'}).json()['success'])
+
+    def test_manager_pages_use_indexes(self):
+        cursor = encode_cursor(timezone.now(), 10 ** 6)
+        self.assertViewUsesIndexes(self.manager, reverse('core:manager_pending_page'), data={'cursor': cursor})
+        self.assertViewUsesIndexes(self.manager, reverse('core:manager_history_page'), data={'cursor': cursor})
+
+
+class ExpenseQueryTests(QueryPlanTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Expense.objects.create(employee=cls.employee, description='Lunch', date=date(2025, 10, 2),
+                               category='Food', amount=40, currency='USD')
+
+    def test_facets_ignore_their_own_filter(self):
+        response = self.assertViewUsesIndexes(
+            self.employee, reverse('core:employee_expense_query'), data={'category': 'Food'}
+        )
+        data = response.json()
+        self.assertEqual(data['total'], 1)
+        self.assertEqual([row['description'] for row in data['expenses']], ['Lunch'])
+        self.assertEqual(data['facets']['category']['Travel'], 5)
+        self.assertEqual(data['facets']['status'], {'Draft': 1, 'Pending': 0, 'Approved': 0, 'Rejected': 0})
+
+    def test_range_filters(self):
+        response = self.assertViewUsesIndexes(self.admin, reverse('core:admin_expense_query'), data={
+            'date_from': '2025-10-02', 'date_to': '2025-10-04', 'amount_min': '101', 'currency': 'inr',
+        })
+        data = response.json()
+        self.assertEqual(sorted(row['description'] for row in data['expenses']),
+                         ['Expense 1', 'Expense 2', 'Expense 3'])
+        self.assertEqual(data['facets']['category'], {**data['facets']['category'], 'Travel': 3, 'Food': 0})
+
+    def test_employee_filter_narrows_the_facets(self):
+        Expense.objects.create(employee=self.manager, description='Dinner', date=date(2025, 10, 3),
+                               category='Food', amount=80)
+        response = self.assertViewUsesIndexes(self.admin, reverse('core:admin_expense_query'),
+                                              data={'employee': self.manager.id})
+        data = response.json()
+        self.assertEqual([row['description'] for row in data['expenses']], ['Dinner'])
+        self.assertEqual(data['total'], 1)
+        self.assertEqual(data['facets']['category']['Travel'], 0)
+        self.assertEqual(self.client.get(reverse('core:admin_expense_query'), {'employee': 'x'}).json()['error'],
+                         'Invalid employee, expected an id')
+
+    def test_invalid_filter(self):
+        self.client.force_login(self.employee.user)
+        response = self.client.get(reverse('core:employee_expense_query'), {'amount_min': 'lots'})
+        self.assertFalse(response.json()['success'])
+
+
+class ExpenseSearchTests(QueryPlanTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.taxi = Expense.objects.create(employee=cls.employee, description='Taxi to airport', date=date(2025, 10, 9),
+                                          category='Travel', amount=30)
+        Expense.objects.create(employee=cls.employee, description='Team lunch', date=date(2025, 10, 9),
+                               category='Food', amount=60, remarks='Airport cafe')
+
+    def search(self, text, **scope):
+        return [expense.description for expense in search_expenses(text, **scope)]
+
+    def test_triggers_keep_index_in_sync(self):
+        self.assertEqual(self.search('airport'), ['Taxi to airport', 'Team lunch'])
+        self.assertEqual(self.search('airp'), ['Taxi to airport', 'Team lunch'])
+        UserData.objects.filter(pk=self.employee.pk).update(name='Priya Sharma')
+        self.assertEqual(len(self.search('priya')), Expense.objects.count())
+
+        # Queryset updates bypass save() but not the triggers
+        Expense.objects.filter(pk=self.taxi.pk).update(description='Cab to station')
+        self.assertEqual(self.search('airport'), ['Team lunch'])
+        self.assertEqual(self.search('station', employee_id=self.employee.id), ['Cab to station'])
+        self.assertEqual(self.search('station', employee_id=self.manager.id), [])
+
+        self.taxi.delete()
+        self.assertEqual(self.search('station'), [])
+        self.assertEqual(self.search('!!!'), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM core_expense_fts')
+        out = StringIO()
+        call_command('rebuild_expense_search', stdout=out)
+        self.assertIn(f'Indexed {Expense.objects.count()} expenses', out.getvalue())
+        self.assertEqual(self.search('taxi'), ['Taxi to airport'])
+
+    def test_search_views(self):
+        response = self.assertViewUsesIndexes(self.employee, reverse('core:employee_dashboard'), data={'q': 'airport'})
+        self.assertEqual(len(response.context['expenses']), 2)
+
+        response = self.assertViewUsesIndexes(self.admin, reverse('core:admin_expense_query'),
+                                              data={'q': 'airport', 'category': 'Food'})
+        data = response.json()
+        self.assertEqual([row['description'] for row in data['expenses']], ['Team lunch'])
+        self.assertEqual(data['facets']['category']['Travel'], 1)
+
+
+class ConditionalGetTests(QueryPlanTestCase):
+
+    def setUp(self):
+        self.expense = Expense.objects.filter(approvals__status='Pending').first()
+
+    def revalidate(self, user_data, url):
+        self.client.force_login(user_data.user)
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first['ETag'].startswith('W/"'))
+        self.assertIn('no-cache', first['Cache-Control'])
+        return first, self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+    def test_employee_details_not_modified(self):
+        url = reverse('core:expense_details', args=[self.expense.id])
+        first, second = self.revalidate(self.employee, url)
+        self.assertEqual(second.status_code, 304)
+
+        self.assertViewUsesIndexes(self.employee, url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+        # Another employee's expense is neither served nor revalidated
+        self.client.force_login(self.manager.user)
+        self.assertFalse(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).json()['success'])
+
+    def test_approval_changes_etag(self):
+        url = reverse('core:expense_approval', args=[self.expense.id])
+        first, second = self.revalidate(self.manager, url)
+        self.assertEqual(second.status_code, 304)
+        self.assertViewUsesIndexes(self.manager, url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+        approval = self.expense.approvals.get()
+        approval.status = 'Approved'
+        approval.save()
+        third = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(third.status_code, 200)
+        self.assertEqual(third.json()['expense']['status'], 'Approved')
+
+    def test_related_rows_change_etag(self):
+        similar = Expense.objects.exclude(pk=self.expense.pk).first()
+        Expense.objects.filter(pk=self.expense.pk).update(similar_receipt=similar)
+        url = reverse('core:expense_approval', args=[self.expense.id])
+        etag = self.revalidate(self.manager, url)[0]['ETag']
+
+        similar.status = 'Rejected'
+        similar.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['expense']['similar_receipt']['status'], 'Rejected')
+
+        company = self.employee.company
+        company.name = 'Acme Labs'
+        company.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.json()['expense']['employee']['department'], 'Acme Labs')
+
+        self.manager.user.username = 'lead'
+        self.manager.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.json()['expense']['approvals'][0]['approver_name'], 'lead')
+
+    def test_compressed(self):
+        self.client.force_login(self.manager.user)
+        response = self.client.get(reverse('core:expense_approval', args=[self.expense.id]),
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+
+class DuplicateExpenseTests(QueryPlanTestCase):
+    claim = {'description': 'Taxi to airport', 'date': '2025-10-20', 'category': 'Travel',
+             'amount': 450.5, 'currency': 'inr'}
+
+    def add(self, **overrides):
+        return self.assertViewUsesIndexes(
+            self.employee, reverse('core:add_expense'), method='post',
+            data=json.dumps({**self.claim, **overrides}), content_type='application/json'
+        ).json()
+
+    def test_duplicate_is_reported(self):
+        first = self.add()
+        self.assertEqual(first['duplicate_ids'], [])
+        second = self.add(description='Airport cab', currency='INR', amount='450.50')
+        self.assertTrue(second['success'])
+        self.assertEqual(second['duplicate_ids'], [first['expense_id']])
+        self.assertIn(f"#{first['expense_id']}", second['message'])
+        self.assertEqual(self.add(date='2025-10-21')['duplicate_ids'], [])
+
+        # Rejected claims may be filed again
+        Expense.objects.filter(pk__in=[first['expense_id'], second['expense_id']]).update(status='Rejected')
+        self.assertEqual(self.add()['duplicate_ids'], [])
+
+    def test_company_policy_blocks(self):
+        CompanyData.objects.filter(pk=self.company.pk).update(duplicate_policy='block')
+        first = self.add()
+        count = Expense.objects.count()
+        second = self.add()
+        self.assertFalse(second['success'])
+        self.assertEqual(second['duplicate_ids'], [first['expense_id']])
+        self.assertEqual(Expense.objects.count(), count)
+
+        # A receipt upload only gets its amount once read, and is checked on submission
+        upload = Expense.objects.create(employee=self.employee, description='Uploaded receipt: taxi.jpg',
+                                        date=date(2025, 10, 20), category='Travel', amount=0)
+        self.assertEqual(upload.fingerprint, '')
+        upload.amount = Decimal('450.50')
+        upload.save(update_fields=['amount'])
+        self.assertEqual(Expense.objects.get(pk=upload.pk).fingerprint,
+                         Expense.objects.get(pk=first['expense_id']).fingerprint)
+        response = self.client.post(reverse('core:submit_expense', args=[upload.id])).json()
+        self.assertFalse(response['success'])
+        self.assertEqual(Expense.objects.get(pk=upload.pk).status, 'Draft')
+
+    def test_cluster_command(self):
+        first = self.add()['expense_id']
+        second = self.add()['expense_id']
+        self.add(amount=12)
+        out = StringIO()
+        call_command('find_duplicate_expenses', stdout=out)
+        self.assertIn(f'expenses {first}, {second} are the same claim', out.getvalue())
+        self.assertIn('Found 1 duplicate clusters with 1 extra expenses', out.getvalue())
+
+        rows = Expense.objects.filter(company=self.company, fingerprint__gt='').order_by('fingerprint', 'id')
+        self.assertQuerysetUsesIndexes(rows.values_list('fingerprint', 'id'))
+
+
+def text_pdf(lines):
+    """A one-page PDF whose text layer holds ``lines``"""
+    stream = 'BT /F1 12 Tf 72 720 Td 14 TL ' + ' '.join(f'({line}) Tj T*' for line in lines) + ' ET'
+    objects = [
+        '<< /Type /Catalog /Pages 2 0 R >>',
+        '<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R '
+        '/Resources << /Font << /F1 5 0 R >> >> >>',
+        f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream',
+        '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    pdf, offsets = '%PDF-1.4\n', []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f'{number} 0 obj\n{body}\nendobj\n'
+    xref = len(pdf)
+    pdf += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'
+    pdf += ''.join(f'{offset:010d} 00000 n \n' for offset in offsets)
+    pdf += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'
+    return pdf.encode()
+
+
+class TempMediaMixin:
+    """Points MEDIA_ROOT (and the other ``temp_settings``) at temporary
+    directories for the test class and removes them afterwards."""
+    temp_settings = ('MEDIA_ROOT',)
+    receipt_name = 'receipt.pdf'
+
+    @classmethod
+    def setUpClass(cls):
+        directories = {setting: tempfile.mkdtemp(prefix='finora-test-') for setting in cls.temp_settings}
+        for directory in directories.values():
+            cls.addClassCleanup(shutil.rmtree, directory, ignore_errors=True)
+        overridden = override_settings(**directories)
+        overridden.enable()
+        cls.addClassCleanup(overridden.disable)
+        super().setUpClass()
+
+    def upload(self, content, name=None):
+        """Upload a receipt through upload_expense as the employee; returns its draft expense"""
+        self.client.force_login(self.employee.user)
+        response = self.client.post(reverse('core:upload_expense'),
+                                    {'receipt_file': SimpleUploadedFile(name or self.receipt_name, content)})
+        return Expense.objects.select_related('receipt_blob').get(pk=response.json()['expense_id'])
+
+
+class ReceiptScanTests(TempMediaMixin, ExpenseFixtureTestCase):
+    receipt = text_pdf(['Cafe Aroma', 'Date: 14/03/2025', 'Cappuccino 180.00', 'Subtotal 180.00', 'Total 189.00'])
+
+    def process(self):
+        out = StringIO()
+        call_command('process_receipts', workers=0, stdout=out)
+        return out.getvalue()
+
+    def test_parse_receipt(self):
+        fields = parse_receipt('Blue Tokai Coffee\nGSTIN 29AB\n12 Mar 2025\nSubtotal 1,300.00\nGrand Total 1,365.00\n')
+        self.assertEqual(fields, {'amount': Decimal('1365.00'), 'date': date(2025, 3, 12),
+                                  'merchant': 'Blue Tokai Coffee'})
+
+    def test_pdf_text_layer_fills_expense(self):
+        expense = self.upload(self.receipt)
+        self.assertEqual(expense.scan.status, 'Queued')
+
+        self.assertIn('1 read successfully', self.process())
+        expense.refresh_from_db()
+        self.assertEqual((expense.description, expense.amount, expense.date),
+                         ('Cafe Aroma', Decimal('189.00'), date(2025, 3, 14)))
+        self.assertEqual(expense.scan.status, 'Done')
+        self.assertEqual(ReceiptText.objects.get().source, 'pdf')
+
+    def test_identical_receipt_read_once(self):
+        self.upload(self.receipt)
+        self.process()
+        expense = self.upload(self.receipt, name='again.pdf')
+        with mock.patch('core.scans.extract_receipt', side_effect=AssertionError('extracted twice')):
+            self.process()
+        expense.refresh_from_db()
+        self.assertEqual(expense.amount, Decimal('189.00'))
+
+    def test_edits_made_while_reading_are_kept(self):
+        expense = self.upload(self.receipt)
+        scans = claim_scans(10)
+        # The employee fills the expense in and submits it before the OCR result lands
+        Expense.objects.filter(pk=expense.pk).update(description='Client coffee', amount=150, status='Pending')
+        process_scans(scans)
+        expense.refresh_from_db()
+        self.assertEqual((expense.description, expense.amount, expense.status),
+                         ('Client coffee', Decimal('150.00'), 'Pending'))
+        self.assertEqual(expense.scan.status, 'Done')
+
+    def test_unreadable_receipt_fails(self):
+        expense = self.upload(b'not a pdf')
+        self.assertIn('0 read successfully', self.process())
+        expense.refresh_from_db()
+        self.assertEqual(expense.scan.status, 'Failed')
+        self.assertTrue(expense.scan.error)
+        self.assertEqual(expense.amount, 0)
+
+
+class ReceiptBlobTests(TempMediaMixin, ExpenseFixtureTestCase):
+
+    def test_duplicate_uploads_share_a_blob(self):
+        first = self.upload(b'%PDF-1.4 same receipt', 'a.pdf')
+        second = self.upload(b'%PDF-1.4 same receipt', 'b.pdf')
+        blob = ReceiptBlob.objects.get()
+        self.assertEqual(blob.digest, hashlib.sha256(b'%PDF-1.4 same receipt').hexdigest())
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual({first.receipt.name, second.receipt.name}, {blob.file.name})
+        self.assertTrue(os.path.exists(blob.file.path))
+
+        first.delete()
+        Expense.objects.filter(pk=second.pk).delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 0)
+
+        call_command('gc_receipt_blobs', grace_hours=0, stdout=StringIO())
+        self.assertFalse(ReceiptBlob.objects.exists())
+        self.assertFalse(os.path.exists(blob.file.path))
+
+    def test_backfill_legacy_receipts(self):
+        for i in range(2):
+            expense = Expense.objects.create(employee=self.employee, description=f'Legacy {i}',
+                                             date=date(2025, 1, 1), amount=10)
+            expense.receipt.save(f'legacy_{i}.png', ContentFile(b'same scan'))
+        paths = [expense.receipt.path for expense in Expense.objects.exclude(receipt='')]
+
+        out = StringIO()
+        call_command('backfill_receipt_blobs', stdout=out)
+        self.assertIn('Moved 2 receipts', out.getvalue())
+        blob = ReceiptBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(sum(os.path.exists(path) for path in paths), 1)
+        self.assertEqual(set(Expense.objects.exclude(receipt='').values_list('receipt', flat=True)), {blob.file.name})
+
+
+class ReceiptNormalizationTests(TempMediaMixin, ExpenseFixtureTestCase):
+
+    def phone_photo(self):
+        """A 4000x3000 landscape JPEG with an EXIF flag saying it was shot in portrait"""
+        image = Image.effect_noise((4000, 3000), 40).convert('RGB')
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 CW to display
+        exif[0x010F] = 'PhoneMaker'
+        photo = BytesIO()
+        image.save(photo, 'JPEG', quality=95, exif=exif)
+        return photo.getvalue()
+
+    def test_photo_is_upright_small_and_without_metadata(self):
+        content = self.phone_photo()
+        expense = self.upload(content, 'IMG_0001.JPG')
+        blob = expense.receipt_blob
+        self.assertTrue(blob.file.name.endswith('.jpg'))
+        self.assertLess(blob.size, len(content) / 5)
+        self.assertFalse(blob.original)
+
+        with blob.file.open('rb') as stored:
+            image = Image.open(stored)
+            self.assertEqual(image.size, (settings.RECEIPT_MAX_SIDE * 3 // 4, settings.RECEIPT_MAX_SIDE))
+            self.assertFalse(image.getexif())
+
+        # The same photo again is the same blob
+        self.assertEqual(self.upload(content, 'IMG_0002.JPG').receipt_blob_id, blob.digest)
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 2)
+
+    @override_settings(RECEIPT_KEEP_ORIGINALS=True)
+    def test_original_kept_when_configured(self):
+        content = self.phone_photo()
+        blob = self.upload(content, 'IMG_0003.jpg').receipt_blob
+        with blob.original.open('rb') as original:
+            self.assertEqual(original.read(), content)
+
+    def test_pdfs_and_small_clean_images_are_stored_as_sent(self):
+        pdf = text_pdf(['Cafe Aroma', 'Total 189.00'])
+        self.assertEqual(self.upload(pdf, 'bill.pdf').receipt_blob_id, hashlib.sha256(pdf).hexdigest())
+
+        photo = BytesIO()
+        Image.new('L', (300, 600), 255).save(photo, 'JPEG')
+        expense = self.upload(photo.getvalue(), 'small.jpg')
+        self.assertEqual(expense.receipt_blob_id, hashlib.sha256(photo.getvalue()).hexdigest())
+
+
+class ChunkedUploadTests(TempMediaMixin, ExpenseFixtureTestCase):
+    temp_settings = ('MEDIA_ROOT', 'CHUNKED_UPLOAD_DIR')
+    content = b'%PDF-1.4 ' + bytes(range(256)) * 40
+
+    def setUp(self):
+        self.client.force_login(self.employee.user)
+
+    def start(self, filename='scan.pdf', size=None):
+        return self.client.post(reverse('core:start_upload'), {'filename': filename, 'size': size or len(self.content)},
+                                content_type='application/json').json()
+
+    def send(self, upload_id, offset, chunk, checksum=None):
+        return self.client.post(
+            reverse('core:upload_chunk', args=[upload_id]), chunk, content_type='application/octet-stream',
+            HTTP_X_UPLOAD_OFFSET=str(offset),
+            HTTP_X_CHUNK_SHA256=checksum or hashlib.sha256(chunk).hexdigest(),
+        ).json()
+
+    def test_resumable_upload(self):
+        upload_id = self.start()['upload_id']
+        self.assertEqual(self.send(upload_id, 0, self.content[:4000])['offset'], 4000)
+
+        # A corrupted chunk is rejected and the offset stays put
+        rejected = self.send(upload_id, 4000, self.content[4000:8000], checksum='0' * 64)
+        self.assertEqual((rejected['success'], rejected['offset']), (False, 4000))
+        # So is a chunk sent for the wrong offset
+        self.assertFalse(self.send(upload_id, 6000, self.content[6000:8000])['success'])
+
+        status = self.client.get(reverse('core:upload_chunk', args=[upload_id])).json()
+        self.assertEqual(status['offset'], 4000)
+
+        done = self.send(upload_id, 4000, self.content[4000:])
+        self.assertTrue(done['complete'])
+        expense = Expense.objects.get(pk=done['expense_id'])
+        with expense.receipt.open('rb') as receipt:
+            self.assertEqual(receipt.read(), self.content)
+        self.assertEqual(expense.receipt_blob_id, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(expense.scan.status, 'Queued')
+        self.assertFalse(os.path.exists(os.path.join(settings.CHUNKED_UPLOAD_DIR, f'{upload_id}.part')))
+
+    def test_failed_finish_is_retried(self):
+        upload_id = self.start()['upload_id']
+        with mock.patch('core.user_views.emp_views.draft_expense', side_effect=OSError('disk full')):
+            failed = self.send(upload_id, 0, self.content)
+        self.assertEqual((failed['success'], failed['offset']), (False, len(self.content)))
+        self.assertEqual(UploadSession.objects.get(pk=upload_id).status, 'Open')
+
+        # An empty chunk at the end finishes the upload, once
+        done = self.send(upload_id, len(self.content), b'')
+        self.assertTrue(done['complete'])
+        self.assertEqual(self.send(upload_id, len(self.content), b'')['expense_id'], done['expense_id'])
+        with Expense.objects.get(pk=done['expense_id']).receipt.open('rb') as receipt:
+            self.assertEqual(receipt.read(), self.content)
+        self.assertEqual(os.listdir(settings.CHUNKED_UPLOAD_DIR), [])
+
+    def test_first_chunk_type_check(self):
+        self.assertFalse(self.start(filename='notes.txt')['success'])
+        upload_id = self.start(filename='photo.png')['upload_id']
+        response = self.send(upload_id, 0, self.content[:4000])
+        self.assertEqual(response['message'], 'The file content does not match its type')
+        self.assertEqual(response['offset'], 0)
+
+    def test_other_employees_session(self):
+        upload_id = self.start()['upload_id']
+        self.client.force_login(self.manager.user)
+        response = self.client.get(reverse('core:upload_chunk', args=[upload_id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ReceiptDerivativeTests(TempMediaMixin, ExpenseFixtureTestCase):
+
+    def fetch(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return Image.open(BytesIO(b''.join(response.streaming_content))), response
+
+    def test_image_thumbnail(self):
+        photo = BytesIO()
+        Image.new('RGB', (3000, 2000), 'white').save(photo, 'PNG')
+        expense_id = self.upload(photo.getvalue(), 'photo.png').id
+
+        details = self.client.get(reverse('core:expense_details', args=[expense_id])).json()['expense']
+        thumbnail, response = self.fetch(details['thumbnail_url'])
+        self.assertEqual(thumbnail.size, (240, 160))
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertTrue(default_storage.exists(
+            derivative_name(Expense.objects.get(pk=expense_id).receipt_blob_id, 'thumbnail')
+        ))
+
+        # Only people who can see the expense can see its receipt
+        self.client.force_login(self.manager.user)
+        self.assertEqual(self.client.get(details['thumbnail_url']).status_code, 404)
+        self.client.force_login(self.admin.user)
+        self.fetch(details['preview_url'])
+
+    def test_pdf_preview(self):
+        expense_id = self.upload(text_pdf(['Cafe Aroma', 'Total 189.00']), 'bill.pdf').id
+        preview, _ = self.fetch(reverse('core:receipt_derivative', args=[expense_id, 'preview']))
+        self.assertEqual(max(preview.size), DERIVATIVE_SIZES['preview'])
+
+
+class ReceiptDownloadTests(TempMediaMixin, QueryPlanTestCase):
+    content = b'%PDF-1.4 ' + bytes(range(256)) * 64
+
+    def setUp(self):
+        self.expense = self.upload(self.content, 'bill.pdf')
+        self.url = reverse('core:receipt', args=[self.expense.id])
+
+    def test_download_with_ranges_and_validators(self):
+        response = self.assertViewUsesIndexes(self.employee, self.url)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['ETag'], f'"{self.expense.receipt_blob_id}"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        response = self.client.get(self.url, headers={'Range': 'bytes=100-199'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+
+        response = self.client.get(self.url, headers={'Range': 'bytes=-10'})
+        self.assertEqual(b''.join(response.streaming_content), self.content[-10:])
+        response = self.client.get(self.url, headers={'Range': f'bytes={len(self.content)}-'})
+        self.assertEqual(response.status_code, 416)
+
+        # A stale If-Range gets the whole file, a current ETag gets nothing
+        response = self.client.get(self.url, headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, headers={'If-None-Match': f'"{self.expense.receipt_blob_id}"'})
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(SENDFILE_BACKEND='x-accel')
+    def test_transfer_is_offloaded(self):
+        self.client.force_login(self.admin.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['X-Accel-Redirect'], settings.SENDFILE_URL + self.expense.receipt.name)
+
+        with override_settings(SENDFILE_BACKEND='x-sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], self.expense.receipt.path)
+
+    def test_only_people_on_the_expense(self):
+        self.client.force_login(self.manager.user)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+        ExpenseApproval.objects.create(expense=self.expense, approver=self.manager)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        details = self.client.get(reverse('core:expense_approval', args=[self.expense.id])).json()['expense']
+        self.assertEqual(details['receipt_url'], self.url)
+
+
+def receipt_photo(seed):
+    """A receipt-like image: text lines as black bars laid out by ``seed``"""
+    rng = random.Random(seed)
+    image = Image.new('RGB', (900, 1600), 'white')
+    draw = ImageDraw.Draw(image)
+    top = 120
+    while top < 1450:
+        left = 100 + rng.randrange(0, 200)
+        draw.rectangle((left, top, left + rng.randrange(150, 650), top + 24), fill='black')
+        top += rng.randrange(40, 110)
+    return image
+
+
+def jpeg(image, quality=90):
+    output = BytesIO()
+    image.save(output, 'JPEG', quality=quality)
+    return output.getvalue()
+
+
+class ReceiptSimilarityTests(TempMediaMixin, QueryPlanTestCase):
+    receipt_name = 'receipt.jpg'
+
+    def setUp(self):
+        # Ids are reused once each test's transaction rolls back
+        similarity._indexes.clear()
+
+    def test_rephotographed_receipt_is_flagged(self):
+        original = self.upload(jpeg(receipt_photo(1)))
+        # Cropped, slightly rotated, scaled and re-compressed
+        photo = receipt_photo(1).rotate(1.5, fillcolor='white').crop((30, 40, 880, 1570)).resize((700, 1240))
+        resubmitted = self.upload(jpeg(photo, quality=60))
+        other = self.upload(jpeg(receipt_photo(2)))
+
+        self.assertNotEqual(original.receipt_blob_id, resubmitted.receipt_blob_id)
+        self.assertEqual(resubmitted.similar_receipt_id, original.id)
+        self.assertIsNone(Expense.objects.get(pk=original.pk).similar_receipt_id)
+        self.assertIsNone(other.similar_receipt_id)
+
+        ExpenseApproval.objects.create(expense=resubmitted, approver=self.manager)
+        response = self.assertViewUsesIndexes(self.manager, reverse('core:expense_approval', args=[resubmitted.id]))
+        self.assertEqual(response.json()['expense']['similar_receipt']['id'], original.id)
+
+    def test_bk_tree_matches_brute_force(self):
+        rng = random.Random(7)
+        hashes = [f'{rng.getrandbits(64):016x}' for _ in range(500)]
+        tree = similarity.BKTree()
+        for value, phash in enumerate(hashes):
+            tree.add(phash, value)
+        for query in hashes[:20]:
+            expected = {(similarity.distance(query, phash), value)
+                        for value, phash in enumerate(hashes) if similarity.distance(query, phash) <= 20}
+            self.assertEqual(set(tree.search(query, 20)), expected)
+
+    def test_hash_receipts_flags_existing_expenses(self):
+        first = self.upload(jpeg(receipt_photo(3)))
+        second = self.upload(jpeg(receipt_photo(3), quality=50))
+        Expense.objects.update(similar_receipt=None)
+        ReceiptBlob.objects.update(phash='')
+        similarity._indexes.clear()
+
+        out = StringIO()
+        call_command('hash_receipts', stdout=out)
+        self.assertIn('Hashed 2 receipts, flagged 1 expenses', out.getvalue())
+        self.assertEqual(Expense.objects.get(pk=second.pk).similar_receipt_id, first.id)
+
+
+class BatchUploadTests(TempMediaMixin, ExpenseFixtureTestCase):
+
+    def setUp(self):
+        similarity._indexes.clear()
+        self.client.force_login(self.employee.user)
+
+    def test_zip_archive(self):
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, 'w') as bundle:
+            bundle.writestr('trip/taxi.jpg', jpeg(receipt_photo(4)))
+            bundle.writestr('trip/taxi-again.jpg', jpeg(receipt_photo(4)))
+            bundle.writestr('trip/hotel.pdf', text_pdf(['Hotel Lux', 'Total 5400.00']))
+            bundle.writestr('trip/notes.txt', b'not a receipt')
+            bundle.writestr('trip/fake.png', b'not a png either')
+            bundle.writestr('__MACOSX/trip/._taxi.jpg', b'resource fork')
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(reverse('core:upload_receipt_batch'),
+                                        {'archive': SimpleUploadedFile('trip.zip', archive.getvalue())})
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual([result['filename'] for result in data['results']],
+                         ['taxi.jpg', 'taxi-again.jpg', 'hotel.pdf', 'notes.txt', 'fake.png'])
+        self.assertEqual([result['success'] for result in data['results']], [True, True, True, False, False])
+
+        # One INSERT for all the expenses
+        inserts = [query for query in captured.captured_queries if query['sql'].startswith('INSERT INTO "core_expense"')]
+        self.assertEqual(len(inserts), 1)
+
+        taxi, again, hotel = (Expense.objects.get(pk=result['expense_id']) for result in data['results'][:3])
+        self.assertEqual(taxi.receipt_blob_id, again.receipt_blob_id)
+        self.assertEqual(ReceiptBlob.objects.get(pk=taxi.receipt_blob_id).ref_count, 2)
+        self.assertEqual(again.similar_receipt_id, taxi.id)
+        self.assertEqual(taxi.company_id, self.company.id)
+        self.assertEqual(hotel.description, 'Uploaded receipt: hotel.pdf')
+        self.assertEqual(ReceiptScan.objects.filter(expense__in=[taxi, again, hotel], status='Queued').count(), 3)
+        self.assertEqual([expense.id for expense in search_expenses('hotel')], [hotel.id])
+
+    def test_several_files(self):
+        response = self.client.post(reverse('core:upload_receipt_batch'), {'receipt_files': [
+            SimpleUploadedFile('a.jpg', jpeg(receipt_photo(5))),
+            SimpleUploadedFile('b.pdf', text_pdf(['Cafe', 'Total 80.00'])),
+        ]})
+        data = response.json()
+        self.assertEqual([result['success'] for result in data['results']], [True, True])
+
+        bad = self.client.post(reverse('core:upload_receipt_batch'),
+                               {'archive': SimpleUploadedFile('trip.zip', b'PK not really')}).json()
+        self.assertFalse(bad['success'])
+
+    @override_settings(RECEIPT_KEEP_ORIGINALS=True)
+    def test_original_kept_when_configured(self):
+        photo = BytesIO()
+        exif = Image.Exif()
+        exif[0x010F] = 'PhoneMaker'
+        receipt_photo(6).save(photo, 'JPEG', exif=exif)
+        data = self.client.post(reverse('core:upload_receipt_batch'),
+                                {'receipt_files': [SimpleUploadedFile('photo.jpg', photo.getvalue())]}).json()
+        blob = Expense.objects.get(pk=data['results'][0]['expense_id']).receipt_blob
+        self.assertNotEqual(blob.digest, hashlib.sha256(photo.getvalue()).hexdigest())
+        with blob.original.open('rb') as original:
+            self.assertEqual(original.read(), photo.getvalue())
+
+    def test_storage_errors_are_reported(self):
+        with mock.patch('core.batch.store_receipt', side_effect=OSError('disk full')):
+            response = self.client.post(reverse('core:upload_receipt_batch'), {
+                'receipt_files': [SimpleUploadedFile('b.pdf', text_pdf(['Cafe', 'Total 80.00']))]
+            })
+        self.assertEqual(response.json(), {'success': False, 'message': 'Error: disk full'})
+
+
+class ExchangeRateTests(QueryPlanTestCase):
+    def setUp(self):
+        currency.rate_cache.clear()
+        self.files = tempfile.mkdtemp(prefix='rates-')
+        self.addCleanup(shutil.rmtree, self.files, ignore_errors=True)
+
+    def rate_file(self, name, content):
+        path = os.path.join(self.files, name)
+        with open(path, 'w') as output:
+            output.write(content)
+        return path
+
+    def load(self):
+        call_command('load_exchange_rates', self.rate_file('rates.csv', (
+            'date,base,quote,rate\n'
+            '2025-10-01,usd,INR,83.0\n'
+            '2025-10-03,USD,INR,84.0\n'
+        )), stdout=StringIO())
+        call_command('load_exchange_rates', self.rate_file('rates.json', json.dumps([
+            {'date': '2025-10-01', 'base': 'INR', 'quote': 'EUR', 'rate': '0.0100'},
+            {'date': '2025-10-03', 'base': 'USD', 'quote': 'INR', 'rate': '84.5'},
+        ])), stdout=StringIO(), batch_size=1)
+
+    def test_load_upserts(self):
+        self.load()
+        self.assertEqual(ExchangeRate.objects.count(), 3)
+        self.assertEqual(ExchangeRate.objects.get(base='USD', date=date(2025, 10, 3)).rate, Decimal('84.5'))
+        with self.assertRaisesMessage(CommandError, 'record 1'):
+            call_command('load_exchange_rates', self.rate_file('bad.csv', 'date,base,quote,rate\n2025-10-01,USD,INR,-1\n'))
+        with self.assertRaisesMessage(CommandError, 'header'):
+            call_command('load_exchange_rates', self.rate_file('bad2.csv', 'day,from,to\n'))
+
+    def test_get_rate(self):
+        self.load()
+        self.assertEqual(get_rate('USD', 'INR', date(2025, 10, 2)), Decimal('83'))
+        self.assertEqual(get_rate('usd', 'inr', date(2025, 10, 9)), Decimal('84.5'))
+        self.assertEqual(get_rate('EUR', 'INR', date(2025, 10, 9)), Decimal(100))
+        self.assertIsNone(get_rate('USD', 'INR', date(2025, 9, 30)))
+        self.assertEqual(convert(Decimal('10.00'), 'USD', 'INR', date(2025, 10, 3)), Decimal('845.00'))
+
+        # Known rates are served from the cache, missing ones looked up again
+        with self.assertNumQueries(0):
+            get_rate('USD', 'INR', date(2025, 10, 2))
+        with self.assertNumQueries(2):
+            get_rate('USD', 'INR', date(2025, 9, 30))
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = currency.RateCache(size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+
+    def test_cache_entries_expire(self):
+        cache = currency.RateCache(ttl=60)
+        cache.set('a', 1)
+        with mock.patch('core.currency.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.rates, {})
+
+    def test_pending_queue_shows_company_amounts(self):
+        self.load()
+        Expense.objects.filter(description='Expense 1').update(currency='USD', date=date(2025, 10, 3))
+        response = self.assertViewUsesIndexes(self.manager, reverse('core:manager_dashboard'))
+        self.assertContains(response, '&asymp; INR 8534.50')
+
+    def test_totals_are_converted_in_the_query(self):
+        self.load()
+        for amount, code, day in (('10.00', 'usd', 2), ('5.00', 'EUR', 3), ('7.00', 'GBP', 3)):
+            Expense.objects.create(employee=self.employee, description=f'{code} expense', category='Meals',
+                                   date=date(2025, 10, day), amount=Decimal(amount), currency=code)
+        expenses = Expense.objects.filter(company=self.company).annotate(converted=converted_amount('INR'))
+        totals = dict(expenses.filter(category='Meals').values_list('currency', 'converted'))
+        self.assertEqual(totals['usd'], Decimal('830.00'))
+        self.assertEqual(totals['EUR'], Decimal('500.00'))
+        self.assertIsNone(totals['GBP'])
+
+        by_category = Expense.objects.filter(company=self.company).values('category').annotate(
+            total=Sum(converted_amount('INR'))
+        ).order_by('category')
+        self.assertQuerysetUsesIndexes(by_category)
+        self.assertEqual({row['category']: row['total'] for row in by_category},
+                         {'Meals': Decimal('1330.00'), 'Travel': Decimal('510.00')})
+
+
+    def test_whole_number_inverse_rate(self):
+        load_rates([(date(2025, 10, 1), 'USD', 'INR', 2), (date(2025, 10, 1), 'GBP', 'INR', 3)])
+        for amount in ('12324.00', '100.00'):
+            Expense.objects.create(employee=self.employee, description=f'Hotel {amount}', date=date(2025, 10, 6),
+                                   amount=Decimal(amount))
+        for code in ('USD', 'GBP'):
+            expenses = Expense.objects.filter(description__startswith='Hotel').annotate(
+                converted=converted_amount(code)
+            )
+            for expense in expenses:
+                self.assertEqual(expense.converted, convert(expense.amount, expense.currency, code, expense.date))
+        self.assertEqual(convert(Decimal('12324.00'), 'INR', 'USD', date(2025, 10, 6)), Decimal('6162.00'))
+
+class CurrencyCatalogueTests(QueryPlanTestCase):
+    def test_anonymous_catalogue(self):
+        response = self.client.get(reverse('core:currencies'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        data = response.json()
+        self.assertEqual(data['preferred'], [])
+        self.assertEqual(data['currencies'][0]['code'], 'AED')
+        self.assertIn({'code': 'IN', 'name': 'India', 'currency': 'INR'}, data['countries'])
+
+        not_modified = self.client.get(reverse('core:currencies'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+    def test_company_currencies_first(self):
+        for code in ('usd', 'EUR', 'USD', 'XXX'):
+            Expense.objects.create(employee=self.employee, description=f'{code} expense', category='Meals',
+                                   date=date(2025, 10, 9), amount=10, currency=code)
+        response = self.assertViewUsesIndexes(self.employee, reverse('core:currencies'))
+        self.assertIn('private', response['Cache-Control'])
+        data = response.json()
+        self.assertEqual(data['preferred'], ['INR', 'USD', 'EUR'])
+        self.assertEqual([currency['code'] for currency in data['currencies'][:4]], ['INR', 'USD', 'EUR', 'AED'])
+        self.assertIn('India', data['currencies'][0]['countries'])
+
+        # A new currency in use changes the ETag
+        etag = response['ETag']
+        self.assertEqual(self.client.get(reverse('core:currencies'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Expense.objects.create(employee=self.employee, description='GBP expense', category='Meals',
+                               date=date(2025, 10, 9), amount=10, currency='GBP')
+        self.assertEqual(self.client.get(reverse('core:currencies'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ExpenseRollupTests(ExpenseFixtureTestCase):
+
+    def rollups(self):
+        return set(ExpenseRollup.objects.values_list(
+            'company_id', 'day', 'employee_id', 'category', 'status', 'currency', 'expense_count', 'amount'
+        ))
+
+    def recounted(self):
+        expected = {}
+        for expense in Expense.objects.all():
+            key = (expense.company_id, expense.date, expense.employee_id, expense.category, expense.status,
+                   expense.currency.upper())
+            count, amount = expected.get(key, (0, Decimal(0)))
+            expected[key] = (count + 1, amount + expense.amount)
+        return {(*key, count, amount) for key, (count, amount) in expected.items()}
+
+    def test_triggers_keep_rollups_in_sync(self):
+        self.assertEqual(self.rollups(), self.recounted())
+        lunch = Expense.objects.create(employee=self.employee, description='Lunch', date=date(2025, 10, 1),
+                                       category='Travel', amount=Decimal('20.25'), currency='usd', status='Pending')
+        Expense.objects.bulk_create([
+            Expense(employee=self.employee, company=self.company, description='Hotel', date=date(2025, 10, 1),
+                    category='Travel', amount=Decimal('100.00'), status='Pending'),
+        ])
+        self.assertEqual(self.rollups(), self.recounted())
+
+        # Queryset updates from the approval engine move expenses between buckets
+        Expense.objects.filter(company=self.company, date=date(2025, 10, 1)).update(status='Approved')
+        lunch.refresh_from_db()
+        lunch.amount = Decimal('22.50')
+        lunch.save()
+        self.assertEqual(self.rollups(), self.recounted())
+
+        lunch.delete()
+        Expense.objects.filter(description='Hotel').delete()
+        self.assertEqual(self.rollups(), self.recounted())
+        self.assertFalse(ExpenseRollup.objects.filter(status='Approved', currency='USD').exists())
+
+    def test_rebuild_command(self):
+        expected = self.rollups()
+        ExpenseRollup.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_expense_rollups', '--chunk-size', '2', stdout=out)
+        self.assertIn(f'Rolled up {Expense.objects.count()} expenses', out.getvalue())
+        self.assertEqual(self.rollups(), expected)
+        self.assertEqual(rebuild_rollups(), Expense.objects.count())
+
+    def test_report_api(self):
+        ExchangeRate.objects.create(date=date(2025, 1, 1), base='USD', quote='INR', rate=Decimal('80'))
+        Expense.objects.create(employee=self.manager, description='Flight', date=date(2025, 11, 3),
+                               category='Travel', amount=Decimal('50.00'), currency='USD', status='Approved')
+        Expense.objects.create(employee=self.manager, description='Dinner', date=date(2025, 12, 5),
+                               category='Food', amount=Decimal('10.00'), currency='GBP', status='Pending')
+        Expense.objects.create(employee=self.employee, description='Draft', date=date(2025, 12, 5),
+                               category='Food', amount=Decimal('999.00'), status='Draft')
+
+        self.client.force_login(self.admin.user)
+        with CaptureQueriesContext(connection) as captured:
+            data = self.client.get(reverse('core:admin_expense_report')).json()
+        self.assertTrue(data['success'], data)
+        # Reports never touch the expense table itself
+        self.assertFalse([query for query in captured.captured_queries if '"core_expense"' in query['sql']])
+
+        self.assertEqual(data['totals'], {'count': 7, 'total': 4510.0, 'unconverted': 1})
+        self.assertEqual([(row['period'], row['count'], row['total']) for row in data['trends']],
+                         [('2025-10-01', 5, 510.0), ('2025-11-01', 1, 4000.0), ('2025-12-01', 1, 0.0)])
+        self.assertEqual([(row['employee'], row['total']) for row in data['top_spenders']],
+                         [(self.manager.name, 4000.0), (self.employee.name, 510.0)])
+        self.assertEqual([(row['category'], row['share']) for row in data['category_mix']],
+                         [('Travel', 100.0), ('Food', 0.0)])
+
+        quarters = self.client.get(reverse('core:admin_expense_report'),
+                                   {'period': 'quarter', 'status': 'Approved'}).json()
+        self.assertEqual([(row['period'], row['count']) for row in quarters['trends']], [('2025-10-01', 4)])
+        self.assertFalse(self.client.get(reverse('core:admin_expense_report'), {'period': 'week'}).json()['success'])
+        self.assertEqual(len(self.client.get(reverse('core:admin_expense_report'),
+                                             {'limit': '-5'}).json()['top_spenders']), 1)
+        self.assertEqual(self.client.get(reverse('core:admin_expense_report'),
+                                         {'date_from': '2025-11-01'}).json()['totals']['count'], 2)
+
+
+    def test_report_page_matches_api(self):
+        # Whole-number rate, quoted from the company currency: converted by its inverse
+        ExchangeRate.objects.create(date=date(2025, 1, 1), base='INR', quote='JPY', rate=Decimal('2'))
+        Expense.objects.create(employee=self.employee, description='Sushi', date=date(2025, 10, 8),
+                               category='Food', amount=Decimal('12324.00'), currency='JPY', status='Approved')
+        Expense.objects.create(employee=self.employee, description='Draft', date=date(2025, 10, 8),
+                               category='Food', amount=Decimal('999.00'), status='Draft')
+
+        self.client.force_login(self.admin.user)
+        data = self.client.get(reverse('core:admin_expense_report')).json()
+        self.assertEqual(data['totals'], {'count': 6, 'total': 6672.0, 'unconverted': 0})
+        self.assertEqual([(row['category'], row['total']) for row in data['category_mix']],
+                         [('Food', 6162.0), ('Travel', 510.0)])
+
+        with mock.patch('Frontend.admin_views.render', return_value=HttpResponse()) as render:
+            self.client.get(reverse('admin_reports'))
+        context = render.call_args.args[2]
+        self.assertEqual(context['total_amount'], Decimal('6672.00'))
+        self.assertEqual({row['status'] for row in context['expenses_by_status']}, {'Approved', 'Pending'})
+
+class ExpenseExportTests(QueryPlanTestCase):
+
+    def export(self, user_data, url, **params):
+        self.client.force_login(user_data.user)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, params)
+            self.assertTrue(response.streaming)
+            content = b''.join(response.streaming_content)
+        for sql in self.watched_queries(captured):
+            self.assertIndexedPlan(sql)
+        return response, content
+
+    def test_csv_export(self):
+        Expense.objects.create(employee=self.employee, description='=HYPERLINK("http://x")', category='Food',
+                               date=date(2025, 10, 9), amount=Decimal('12.50'), status='Draft')
+        response, content = self.export(self.admin, reverse('core:admin_expense_export'))
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="expenses-', response['Content-Disposition'])
+        rows = list(csv.reader(StringIO(content.decode('utf-8-sig'))))
+        self.assertEqual(rows[0][:3], ['ID', 'Date', 'Employee'])
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[1][4], '\'=HYPERLINK("http://x")')
+        self.assertTrue(all(row[10].startswith(f'{self.manager.name}: ') for row in rows[2:]))
+
+        # Same filters as the query endpoints
+        _, content = self.export(self.employee, reverse('core:employee_expense_export'),
+                                 status='Pending', date_from='2025-10-02')
+        rows = list(csv.reader(StringIO(content.decode('utf-8-sig'))))
+        self.assertEqual([row[7] for row in rows[1:]], ['Pending', 'Pending'])
+        self.assertFalse(self.client.get(reverse('core:employee_expense_export'), {'format': 'pdf'}).json()['success'])
+
+    def test_export_for_one_employee(self):
+        Expense.objects.create(employee=self.manager, description='Dinner', date=date(2025, 10, 3), amount=80)
+        _, content = self.export(self.admin, reverse('core:admin_expense_export'), employee=self.manager.id)
+        rows = list(csv.reader(StringIO(content.decode('utf-8-sig'))))
+        self.assertEqual([row[4] for row in rows[1:]], ['Dinner'])
+        self.assertFalse(self.client.get(reverse('core:admin_expense_export'), {'employee': 'x'}).json()['success'])
+
+    def test_xlsx_export(self):
+        response, content = self.export(self.admin, reverse('core:admin_expense_export'),
+                                        format='xlsx', category='Travel')
+        self.assertTrue(response['Content-Disposition'].endswith('.xlsx"'))
+        with zipfile.ZipFile(BytesIO(content)) as workbook:
+            self.assertIsNone(workbook.testzip())
+            sheet = ElementTree.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+        namespace = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        rows = sheet.findall('s:sheetData/s:row', namespace)
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0].find('s:c/s:is/s:t', namespace).text, 'ID')
+        self.assertEqual(rows[1].find('s:c/s:v', namespace).text, str(Expense.objects.order_by('-created_at', '-id')[0].id))
+
+    def test_rows_are_read_in_chunks(self):
+        rows = export_rows(Expense.objects.filter(company=self.company), chunk_size=2)
+        self.assertEqual(next(rows), HEADER)
+        # One query per chunk for the expenses and one for their approvals
+        with self.assertNumQueries(4):
+            self.assertEqual(len(list(rows)), 5)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UserImportTests(ExpenseFixtureTestCase):
+    users_csv = (
+        'username,email,role,manager\n'
+        'lead,lead@acme.test,manager,manager\n'
+        'asha,asha@acme.test,Employee,lead@acme.test\n'
+        'ravi,ravi@acme.test,employee,manager\n'
+        'kim,kim@acme.test,Admin,\n'
+    )
+
+    def upload(self, content, name='users.csv'):
+        self.client.force_login(self.admin.user)
+        return self.client.post(reverse('core:admin_import_users'),
+                                {'file': SimpleUploadedFile(name, content.encode())}).json()
+
+    def test_import_and_queue_welcome_emails(self):
+        # The view hashes in the web worker, never on a forked pool
+        with mock.patch('core.onboarding.ProcessPoolExecutor') as pool:
+            response = self.upload(self.users_csv)
+        pool.assert_not_called()
+        self.assertTrue(response['success'], response)
+        profiles = {profile.name: profile for profile in UserData.objects.filter(pk__in=response['user_ids'])}
+        self.assertEqual(set(profiles), {'lead', 'asha', 'ravi', 'kim'})
+        self.assertEqual(profiles['lead'].manager, self.manager)
+        self.assertEqual(profiles['asha'].manager, profiles['lead'])
+        self.assertEqual(profiles['asha'].email, 'asha@acme.test')
+        self.assertEqual(profiles['kim'].role, 'Admin')
+        self.assertTrue(profiles['asha'].user.has_usable_password())
+        rules = ApprovalRules.objects.filter(employee__in=profiles.values())
+        self.assertEqual({(rule.employee.name, rule.manager.name, rule.manager_approval) for rule in rules},
+                         {('lead', 'manager', False), ('asha', 'lead', True), ('ravi', 'manager', True)})
+
+        # Nothing is sent on the request, the queue is worked off separately
+        self.assertEqual(len(mail.outbox), 0)
+        out = StringIO()
+        call_command('send_queued_emails', stdout=out)
+        self.assertIn('Sent 4 emails', out.getvalue())
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['asha@acme.test', 'kim@acme.test', 'lead@acme.test', 'ravi@acme.test'])
+        self.assertIn('Username: asha', next(m.body for m in mail.outbox if m.to == ['asha@acme.test']))
+        self.assertFalse(QueuedEmail.objects.exclude(status='Sent', body='').exists())
+
+    def test_failed_emails_back_off(self):
+        first, second = queue_emails([('a@acme.test', 'Hi', 'Password: one'), ('b@acme.test', 'Hi', 'Password: two')])
+        # Claimed by a sender that is still at it
+        QueuedEmail.objects.filter(pk=second.pk).update(status='Sending', claim=uuid.uuid4())
+
+        with mock.patch('core.mailqueue.EmailMessage.send', side_effect=OSError('connection refused')):
+            self.assertEqual(send_queued_emails(), (0, 1))
+            # Not due again yet
+            self.assertEqual(send_queued_emails(), (0, 0))
+            for attempt in range(2):
+                QueuedEmail.objects.filter(pk=first.pk).update(next_attempt_at=timezone.now())
+                send_queued_emails()
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.attempts, first.body), ('Failed', 3, ''))
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_every_row_is_validated_first(self):
+        rows = read_user_rows((
+            'username,email,role,manager\n'
+            'employee,new@acme.test,Employee,\n'
+            'neo,neo@acme.test,Employee,nobody\n'
+            'trin,neo@acme.test,Boss,\n'
+            'zed,zed@acme.test,Admin,employee\n'
+            'self,self@acme.test,Employee,self\n'
+            'fine,fine@acme.test,Employee,neo\n'
+            'Admin,Employee@Acme.test,Employee,MANAGER\n'
+        ), 'users.csv')
+        count = User.objects.count()
+        # One query for taken usernames and emails, one for the managers named
+        with self.assertNumQueries(2), self.assertRaises(OnboardingError) as raised:
+            validate_rows(self.company, rows)
+        self.assertEqual({error['row']: error['errors'] for error in raised.exception.errors}, {
+            1: ['Username already exists'],
+            2: ['Manager nobody not found'],
+            3: ['Email appears more than once in the file', 'Role must be Admin, Manager or Employee'],
+            4: ['Only admins can manage admins'],
+            5: ['A user cannot be their own manager'],
+            7: ['Username already exists', 'Email already exists'],
+        })
+        self.assertEqual(User.objects.count(), count)
+
+        response = self.upload('[{"username": "x"}]', 'users.json')
+        self.assertFalse(response['success'])
+        self.assertEqual(response['errors'][0]['errors'], ['A valid email is required',
+                                                            'Role must be Admin, Manager or Employee'])
+
+    def test_command_hashes_on_a_process_pool(self):
+        path = os.path.join(tempfile.mkdtemp(prefix='users-'), 'users.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), ignore_errors=True)
+        with open(path, 'w') as output:
+            json.dump([{'username': f'user{i}', 'email': f'user{i}@acme.test', 'role': 'Employee',
+                        'manager': 'manager'} for i in range(6)], output)
+        out = StringIO()
+        call_command('import_users', str(self.company.id), path, '--workers', '2', stdout=out)
+        self.assertIn('Created 6 users', out.getvalue())
+        users = User.objects.filter(username__startswith='user')
+        self.assertEqual(len({user.password for user in users}), 6)
+        self.assertTrue(all(user.password.startswith('md5$') for user in users))
+        self.assertEqual(QueuedEmail.objects.filter(status='Queued').count(), 6)
+
+
+class ExpenseIngestTests(QueryPlanTestCase):
+    item = {'description': 'Card: Uber', 'date': '2025-10-20', 'category': 'Travel', 'amount': '23.40',
+            'currency': 'inr'}
+
+    def sync(self, items, **options):
+        return self.assertViewUsesIndexes(
+            self.employee, reverse('core:add_expenses_batch'), method='post',
+            data=json.dumps({'expenses': items, **options}), content_type='application/json'
+        ).json()
+
+    def test_retried_sync_files_nothing_twice(self):
+        items = [{**self.item, 'idempotency_key': f'card-{i}', 'amount': f'{10 + i}.50'} for i in range(3)]
+        with CaptureQueriesContext(connection) as captured:
+            first = self.sync(items)
+        self.assertEqual(first['counts'], {'created': 3, 'existing': 0, 'rejected': 0})
+        self.assertEqual(len([query for query in captured.captured_queries
+                              if query['sql'].startswith('INSERT INTO "core_expense"')]), 1)
+        created = [result['expense_id'] for result in first['results']]
+        self.assertEqual(Expense.objects.get(pk=created[1]).amount, Decimal('11.50'))
+        self.assertEqual(Expense.objects.get(pk=created[1]).currency, 'INR')
+
+        # The retry reports the expenses filed the first time
+        items.append({**self.item, 'idempotency_key': 'card-3'})
+        second = self.sync(items)
+        self.assertEqual(second['counts'], {'created': 1, 'existing': 3, 'rejected': 0})
+        self.assertEqual([result['expense_id'] for result in second['results'][:3]], created)
+        self.assertEqual(Expense.objects.filter(idempotency_key__startswith='card-').count(), 4)
+
+        # Keys belong to the employee who used them
+        Expense.objects.create(employee=self.manager, description='Other', date=date(2025, 10, 1),
+                               amount=5, idempotency_key='card-9')
+        self.assertEqual(self.sync([{**self.item, 'idempotency_key': 'card-9'}])['counts']['created'], 1)
+
+    def test_items_are_validated_one_by_one(self):
+        results = self.sync([
+            {**self.item, 'idempotency_key': 'a'},
+            {**self.item, 'idempotency_key': 'a', 'amount': '1.00'},
+            {**self.item, 'amount': '-3'},
+            {**self.item, 'idempotency_key': 'b', 'date': 'yesterday', 'category': 'Toys', 'amount': '1.234'},
+            'not an expense',
+        ])['results']
+        self.assertEqual([result['status'] for result in results],
+                         ['created', 'rejected', 'rejected', 'rejected', 'rejected'])
+        self.assertEqual(results[1]['errors'], ['The idempotency_key is repeated in this batch'])
+        self.assertEqual(len(results[2]['errors']), 2)
+        self.assertEqual(len(results[3]['errors']), 3)
+        self.assertFalse(self.client.post(reverse('core:add_expenses_batch'), data='{"expenses": []}',
+                                          content_type='application/json').json()['success'])
+
+    def test_duplicates_and_submission(self):
+        first = self.sync([{**self.item, 'idempotency_key': 'x-1'}])['results'][0]
+        again = self.sync([{**self.item, 'idempotency_key': 'x-2'}], submit=True)['results'][0]
+        self.assertEqual((again['status'], again['duplicate_ids']), ('created', [first['expense_id']]))
+        self.assertNotIn('submit_error', again)
+        self.assertEqual(Expense.objects.get(pk=again['expense_id']).status, 'Pending')
+        self.assertEqual(Expense.objects.get(pk=first['expense_id']).status, 'Draft')
+
+        CompanyData.objects.filter(pk=self.company.pk).update(duplicate_policy='block')
+        blocked = self.sync([{**self.item, 'idempotency_key': 'x-3'}])['results'][0]
+        self.assertEqual(blocked['status'], 'rejected')
+        self.assertEqual(blocked['duplicate_ids'], [first['expense_id'], again['expense_id']])
+
+        # Within the batch, too
+        twins = [{**self.item, 'amount': '7.00', 'idempotency_key': f'y-{i}'} for i in range(2)]
+        results = self.sync(twins)['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'rejected'])
+        CompanyData.objects.filter(pk=self.company.pk).update(duplicate_policy='warn')
+        twins = [{**self.item, 'amount': '8.00', 'idempotency_key': f'z-{i}'} for i in range(2)]
+        results = self.sync(twins)['results']
+        self.assertEqual(results[1]['duplicate_ids'], [results[0]['expense_id']])
+
+    def test_concurrent_retry_is_reported_as_existing(self):
+        racer = Expense.objects.create(employee=self.employee, description='Racer', date=date(2025, 10, 20),
+                                       amount=1, idempotency_key='race')
+        # The first lookup ran before another request filed the same key
+        with mock.patch('core.ingest.used_keys', side_effect=[{}, {'race': racer.id}]):
+            result = ingest_expenses(self.employee, [{**self.item, 'idempotency_key': 'race'}])[0]
+        self.assertEqual((result['status'], result['expense_id']), ('existing', racer.id))
+        self.assertEqual(Expense.objects.filter(idempotency_key='race').count(), 1)
+
+        with mock.patch('core.ingest.used_keys', return_value={}), self.assertRaises(IngestError):
+            ingest_expenses(self.employee, [{**self.item, 'idempotency_key': 'race'}])
+        self.client.force_login(self.employee.user)
+        response = self.client.post(reverse('core:add_expenses_batch'), data='[]', content_type='application/json')
+        self.assertEqual(response.json()['message'], 'Invalid batch: expected a JSON object')
@@ -0,0 +1,165 @@
+"""Chunked, resumable receipt uploads.
+
+The client opens an UploadSession with the file's name and size, then
+sends the bytes in order as raw request bodies. Each chunk carries its
+starting offset (``X-Upload-Offset``) and its SHA-256 (``X-Chunk-SHA256``).
+Chunks are streamed onto a part file in ``settings.CHUNKED_UPLOAD_DIR``,
+so neither a chunk nor the file is ever held in memory. After a dropped
+connection the client asks for the session's offset and resumes there.
+
+The file type is checked on the first chunk. Once the last byte arrives,
+the part file becomes the receipt blob by a rename, not a copy. If that
+fails, an empty POST at the final offset retries it.
+"""
+import hashlib
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import UploadSession
+
+# Leading bytes every accepted file type starts with
+RECEIPT_SIGNATURES = {
+    '.pdf': b'%PDF-',
+    '.png': b'\x89PNG\r\n\x1a\n',
+    '.jpg': b'\xff\xd8\xff',
+    '.jpeg': b'\xff\xd8\xff',
+}
+MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 4 * CHUNK_SIZE
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Raised when a chunk or session is rejected."""
+
+
+class PartFile(File):
+    """An assembled part file. Exposing its path lets the storage move it
+    into place like a spooled upload instead of copying it."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def part_path(session):
+    return os.path.join(settings.CHUNKED_UPLOAD_DIR, f'{session.id}.part')
+
+
+def open_session(employee, filename, size):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in RECEIPT_SIGNATURES:
+        raise UploadError('Invalid file type. Please upload PDF, JPG, JPEG, or PNG files only.')
+    if not 0 < size <= MAX_UPLOAD_SIZE:
+        raise UploadError(f'Receipts must be between 1 byte and {MAX_UPLOAD_SIZE // (1024 * 1024)} MB')
+
+    session = UploadSession.objects.create(employee=employee, filename=os.path.basename(filename), size=size)
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    open(part_path(session), 'wb').close()
+    return session
+
+
+def append_chunk(session, offset, checksum, stream, length):
+    """Stream ``length`` bytes from ``stream`` onto the session's part file.
+
+    Returns the new offset. A chunk that does not start at the current
+    offset, fails its checksum or (as the first chunk) is not the type its
+    name claims is rejected and leaves the part file as it was.
+    """
+    if session.status != 'Open':
+        raise UploadError('This upload is no longer open')
+    if offset != session.received:
+        raise UploadError(f'Expected the chunk at offset {session.received}')
+    if not 0 < length <= MAX_CHUNK_SIZE or offset + length > session.size:
+        raise UploadError('Invalid chunk size')
+    if not checksum:
+        raise UploadError('Missing chunk checksum')
+
+    signature = RECEIPT_SIGNATURES[os.path.splitext(session.filename)[1].lower()]
+    if offset == 0 and length < min(len(signature), session.size):
+        raise UploadError('The first chunk is too short to identify the file')
+
+    digest = hashlib.sha256()
+    written = 0
+    with open(part_path(session), 'r+b') as part:
+        part.seek(offset)
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            if offset == 0 and written == 0 and not data.startswith(signature[:len(data)]):
+                part.truncate(offset)
+                raise UploadError('The file content does not match its type')
+            digest.update(data)
+            part.write(data)
+            written += len(data)
+
+        if written != length or digest.hexdigest() != checksum.lower():
+            part.truncate(offset)
+            raise UploadError('Chunk checksum mismatch, please resend it')
+
+    # Only the request that wrote at the current offset may move it
+    if not UploadSession.objects.filter(pk=session.pk, status='Open', received=offset).update(
+        received=F('received') + written, updated_at=timezone.now()
+    ):
+        raise UploadError('Another chunk was written at this offset')
+    session.received = offset + written
+    return session.received
+
+
+def assembled_file(session):
+    """The finished upload, hashed from disk, ready for store_receipt().
+
+    The file is a hard link to the part file, so the storage can move it
+    into place while the part file stays until the expense exists.
+    """
+    path = part_path(session)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for data in iter(lambda: part.read(READ_SIZE), b''):
+            digest.update(data)
+    link = f'{path}.{uuid.uuid4().hex}'
+    os.link(path, link)
+    file = PartFile(open(link, 'rb'), name=session.filename)
+    file.sha256 = digest.hexdigest()
+    return file
+
+
+def finish_upload(session, create_expense):
+    """Turn a fully received upload into the expense ``create_expense(file)`` returns.
+
+    Safe to retry after a failure, and a session another request finished
+    already is returned as it is.
+    """
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.status != 'Open' or session.received != session.size:
+            return session
+        file = assembled_file(session)
+        try:
+            session.expense = create_expense(file)
+        finally:
+            file.close()
+            # Still there unless the storage moved it into place
+            remove_file(file.temporary_file_path())
+        session.status = 'Complete'
+        session.save(update_fields=['expense', 'status', 'updated_at'])
+    discard_part(session)
+    return session
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def discard_part(session):
+    remove_file(part_path(session))
@@ -6,26 +6,44 @@ app_name = "core"
 
 urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('receipt/<int:expense_id>/', views.receipt_download, name='receipt'),
+    path('receipt/<int:expense_id>/<str:size>/', views.receipt_derivative, name='receipt_derivative'),
+    path('currencies/', views.currency_catalogue, name='currencies'),
     
     # Employee URLs
     path('employee/dashboard/', emp_views.employee_dashboard, name='employee_dashboard'),
+    path('employee/expenses/', emp_views.employee_expenses_page, name='employee_expenses_page'),
+    path('employee/expenses/query/', emp_views.employee_expense_query, name='employee_expense_query'),
+    path('employee/expenses/export/', emp_views.employee_expense_export, name='employee_expense_export'),
     path('employee/add-expense/', emp_views.add_expense, name='add_expense'),
+    path('employee/add-expenses/', emp_views.add_expenses_batch, name='add_expenses_batch'),
     path('employee/upload-expense/', emp_views.upload_expense, name='upload_expense'),
+    path('employee/upload-batch/', emp_views.upload_receipt_batch, name='upload_receipt_batch'),
+    path('employee/uploads/', emp_views.start_upload, name='start_upload'),
+    path('employee/uploads/<uuid:upload_id>/', emp_views.upload_chunk, name='upload_chunk'),
     path('employee/expense/<int:expense_id>/', emp_views.get_expense_details, name='expense_details'),
+    path('employee/submit-expense/<int:expense_id>/', emp_views.submit_expense, name='submit_expense'),
     
     # Manager URLs
     path('manager/dashboard/', mang_views.manager_dashboard, name='manager_dashboard'),
     path('manager/history/', mang_views.manager_expense_history, name='manager_history'),
+    path('manager/history/page/', mang_views.manager_history_page, name='manager_history_page'),
+    path('manager/pending/', mang_views.manager_pending_page, name='manager_pending_page'),
     path('manager/approve/<int:expense_id>/', mang_views.approve_expense, name='approve_expense'),
+    path('manager/bulk-approve/', mang_views.bulk_approve_expenses, name='bulk_approve_expenses'),
     path('manager/expense/<int:expense_id>/', mang_views.get_expense_for_approval, name='expense_approval'),
     
     # Admin URLs
     path('admin/dashboard/', admin_views.admin_dashboard, name='admin_dashboard'),
     path('admin/users/', admin_views.admin_users, name='admin_users'),
     path('admin/approval-rules/', admin_views.admin_approval_rules, name='admin_approval_rules'),
+    path('admin/expenses/query/', admin_views.admin_expense_query, name='admin_expense_query'),
+    path('admin/expenses/export/', admin_views.admin_expense_export, name='admin_expense_export'),
+    path('admin/reports/', admin_views.admin_expense_report, name='admin_expense_report'),
     
     # Admin API endpoints
     path('admin/add-user/', admin_views.add_user, name='admin_add_user'),
+    path('admin/import-users/', admin_views.import_users_view, name='admin_import_users'),
     path('admin/send-password/<int:user_id>/', admin_views.send_password_reset, name='admin_send_password'),
     path('admin/delete-user/<int:user_id>/', admin_views.delete_user, name='admin_delete_user'),
     path('admin/save-approval-rules/', admin_views.save_approval_rules, name='admin_save_approval_rules'),
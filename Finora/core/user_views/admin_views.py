@@ -10,11 +10,15 @@ from django.views.decorators.http import require_http_methods
 from django.db.models import Q, Count
 from user_app.models import UserData, CompanyData, PasswordResetToken
 from core.models import Expense, ExpenseApproval, ApprovalRules
+from core.onboarding import OnboardingError, import_users, read_user_rows, validate_rows, welcome_email
+from core.passwords import generate_password
+from core.exports import EXPORT_FORMATS, export_response
+from core.filters import expense_summary, filter_employee, filter_expenses, filtered_expenses
+from core.pagination import keyset_page
+from core.reports import expense_report
 from django.utils import timezone
 import json
 import uuid
-import secrets
-import string
 
 
 @login_required
@@ -34,9 +38,9 @@ def admin_dashboard(request):
     # Get statistics
     total_employees = UserData.objects.filter(company=company).count()
     total_managers = UserData.objects.filter(company=company, role='Manager').count()
-    total_expenses = Expense.objects.filter(employee__company=company).count()
+    total_expenses = Expense.objects.filter(company=company).count()
     pending_approvals = ExpenseApproval.objects.filter(
-        expense__employee__company=company,
+        company=company,
         status='Pending'
     ).count()
     
@@ -45,7 +49,7 @@ def admin_dashboard(request):
     
     # Get recent expenses (last 10)
     recent_expenses = Expense.objects.filter(
-        employee__company=company
+        company=company
     ).order_by('-created_at')[:10]
     
     # Get approval rules count
@@ -140,11 +144,63 @@ def admin_approval_rules(request):
     return render(request, 'core/admin_approval_rules.html', context)
 
 
-def generate_password(length=12):
-    """Generate a secure random password"""
-    characters = string.ascii_letters + string.digits + "!@#$%^&*"
-    password = ''.join(secrets.choice(characters) for _ in range(length))
-    return password
+@login_required
+def admin_expense_query(request):
+    """Filtered, paginated company expenses with status/category facet counts"""
+    try:
+        user_data = UserData.objects.get(user=request.user)
+        if user_data.role != 'Admin':
+            return JsonResponse({'success': False, 'error': 'Access denied'})
+        
+        # Narrowed to one employee before counting, so the facets match the rows
+        expenses = filter_employee(Expense.objects.filter(company=user_data.company), request.GET)
+        expenses, facets, total = filter_expenses(expenses.select_related('employee'), request.GET)
+        rows, next_cursor = keyset_page(expenses, request.GET.get('cursor'))
+        
+        return JsonResponse({
+            'success': True,
+            'expenses': [expense_summary(expense) for expense in rows],
+            'next_cursor': next_cursor,
+            'total': total,
+            'facets': facets,
+        })
+        
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+
+@login_required
+def admin_expense_export(request):
+    """Company expenses matching the query filters, with their approval trail, streamed as CSV or XLSX"""
+    try:
+        user_data = UserData.objects.get(user=request.user)
+        if user_data.role != 'Admin':
+            return JsonResponse({'success': False, 'error': 'Access denied'})
+        
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return JsonResponse({'success': False, 'error': 'Invalid format, expected csv or xlsx'})
+        expenses = filter_employee(Expense.objects.filter(company=user_data.company), request.GET)
+        expenses = filtered_expenses(expenses, request.GET)
+        
+        return export_response(expenses, export_format, f'expenses-{timezone.localdate():%Y-%m-%d}')
+        
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+
+@login_required
+def admin_expense_report(request):
+    """Monthly or quarterly trends, top spenders and category mix, from the daily rollups"""
+    try:
+        user_data = UserData.objects.select_related('company').get(user=request.user)
+        if user_data.role != 'Admin':
+            return JsonResponse({'success': False, 'error': 'Access denied'})
+        
+        return JsonResponse({'success': True, **expense_report(user_data.company, request.GET)})
+        
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
 
 
 @login_required
@@ -227,6 +283,35 @@ def add_user(request):
         return JsonResponse({'success': False, 'error': str(e)})
 
 
+@login_required
+@require_http_methods(["POST"])
+def import_users_view(request):
+    """Create many users at once from an uploaded CSV or JSON file.
+    Nothing is created unless every row is valid."""
+    try:
+        user_data = UserData.objects.get(user=request.user)
+        if user_data.role != 'Admin':
+            return JsonResponse({'success': False, 'error': 'Access denied'})
+        
+        upload = request.FILES.get('file')
+        if not upload:
+            return JsonResponse({'success': False, 'error': 'No file uploaded'})
+        
+        rows = validate_rows(user_data.company, read_user_rows(upload.read(), upload.name))
+        profiles = import_users(user_data.company, rows, request.build_absolute_uri('/user/login/'))
+        
+        return JsonResponse({
+            'success': True,
+            'message': f'{len(profiles)} users created. Their credentials will be emailed to them shortly.',
+            'user_ids': [profile.id for profile in profiles],
+        })
+        
+    except OnboardingError as e:
+        return JsonResponse({'success': False, 'error': str(e), 'errors': e.errors})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+
 @login_required
 @require_http_methods(["POST"])
 def send_password_reset(request, user_id):
@@ -331,20 +416,17 @@ def save_approval_rules(request):
             rules.min_approval_percentage = min_approval_percentage
             rules.save()
         
-        # Handle approvers
-        approver_ids = request.POST.getlist('approver_ids[]')
-        
-        # Clear existing approvers
+        # Handle approvers: one lookup, stored in the order submitted (the approval sequence)
+        approver_ids = list(dict.fromkeys(int(i) for i in request.POST.getlist('approver_ids[]') if i))
+        approvers = UserData.objects.filter(company=user_data.company).in_bulk(approver_ids)
         rules.approvers.clear()
-        
-        # Add new approvers
-        for approver_id in approver_ids:
-            if approver_id:
-                try:
-                    approver = UserData.objects.get(id=approver_id, company=user_data.company)
-                    rules.approvers.add(approver)
-                except UserData.DoesNotExist:
-                    pass
+        ApprovalRules.approvers.through.objects.bulk_create([
+            ApprovalRules.approvers.through(approvalrules=rules, userdata=approvers[approver_id])
+            for approver_id in approver_ids if approver_id in approvers
+        ])
+
+        # Invalidate cached approval plans built from the previous approvers
+        rules.save(update_fields=['version'])
         
         return JsonResponse({'success': True, 'message': 'Approval rules saved successfully'})
         
@@ -407,23 +489,11 @@ def send_welcome_email(user, password, request):
     """Send welcome email with credentials"""
     try:
         reset_url = f"{request.scheme}://{request.get_host()}/user/login/"
+        subject, message = welcome_email(user.username, password, reset_url)
         
         send_mail(
-            subject='Welcome to Finora Expense Management',
-            message=f'''
-            Welcome to Finora Expense Management System!
-            
-            Your account has been created with the following credentials:
-            
-            Username: {user.username}
-            Password: {password}
-            Login URL: {reset_url}
-            
-            Please change your password after your first login.
-            
-            Best regards,
-            Finora Team
-            ''',
+            subject=subject,
+            message=message,
             from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@finora.com'),
             recipient_list=[user.email],
             fail_silently=False,
@@ -2,14 +2,35 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
+from django.urls import reverse
 from django.utils import timezone
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Count, Q
 import json
 import os
 
-from ..models import Expense
+from ..batch import BatchError, create_batch_expenses, prepare_batch
+from ..blobs import HashingUploadHandler, store_receipt
+from ..conditional import expense_condition, own_expenses
+from ..derivatives import derivative_url
+from ..duplicates import DuplicateExpenseError, check_duplicates, duplicate_warning
+from ..exports import EXPORT_FORMATS, export_response
+from ..filters import FilterError, expense_summary, filter_expenses, filtered_expenses
+from ..ingest import IngestError, ingest_expenses
+from ..models import Expense, UploadSession
+from ..pagination import InvalidCursor, keyset_page, page_response
+from ..routing import RoutingError, submit_expense as route_expense
+from ..scans import draft_expense, enqueue_scan
+from ..search import search_expenses
+from ..similarity import flag_similar_receipt
+from ..uploads import (
+    CHUNK_SIZE, UploadError, append_chunk, finish_upload, open_session
+)
 from user_app.models import UserData
 
 
@@ -24,16 +45,32 @@ def employee_dashboard(request):
             messages.error(request, 'Access denied. This page is for employees only.')
             return redirect('core:dashboard')
         
-        # Get all expenses for this employee
-        expenses = Expense.objects.filter(employee=user_data).order_by('-created_at')
+        # First page of this employee's expenses; the rest load on demand.
+        # A search shows the best matches instead, without paging.
+        expenses = Expense.objects.filter(employee=user_data)
+        query = request.GET.get('q', '').strip()
+        if query:
+            rows, next_cursor = search_expenses(query, employee_id=user_data.id), None
+        else:
+            rows, next_cursor = keyset_page(expenses)
+        
+        # All stats in one aggregate query
+        stats = expenses.aggregate(
+            total=Count('id'),
+            pending=Count('id', filter=Q(status='Pending')),
+            approved=Count('id', filter=Q(status='Approved')),
+            rejected=Count('id', filter=Q(status='Rejected')),
+        )
         
         context = {
             'user_data': user_data,
-            'expenses': expenses,
-            'total_expenses': expenses.count(),
-            'pending_expenses': expenses.filter(status='Pending').count(),
-            'approved_expenses': expenses.filter(status='Approved').count(),
-            'rejected_expenses': expenses.filter(status='Rejected').count(),
+            'expenses': rows,
+            'next_cursor': next_cursor,
+            'query': query,
+            'total_expenses': stats['total'],
+            'pending_expenses': stats['pending'],
+            'approved_expenses': stats['approved'],
+            'rejected_expenses': stats['rejected'],
         }
         
         return render(request, 'core/employee_dashboard.html', context)
@@ -43,6 +80,77 @@ def employee_dashboard(request):
         return redirect('user_app:login')
 
 
+@login_required
+def employee_expenses_page(request):
+    """Next page of the employee's expenses for the dashboard's load-more button"""
+    try:
+        user_data = UserData.objects.get(user=request.user)
+        
+        # Check if user is an employee
+        if user_data.role != 'Employee':
+            return JsonResponse({'success': False, 'message': 'Access denied'})
+        
+        rows, next_cursor = keyset_page(Expense.objects.filter(employee=user_data), request.GET.get('cursor'))
+        return page_response(request, 'core/partials/employee_expense_rows.html', rows, next_cursor)
+        
+    except UserData.DoesNotExist:
+        return JsonResponse({'success': False, 'message': 'User profile not found'})
+    except InvalidCursor as e:
+        return JsonResponse({'success': False, 'message': str(e)})
+
+
+@login_required
+def employee_expense_query(request):
+    """Filtered, paginated expenses of the employee with status/category facet counts"""
+    try:
+        user_data = UserData.objects.get(user=request.user)
+        
+        # Check if user is an employee
+        if user_data.role != 'Employee':
+            return JsonResponse({'success': False, 'message': 'Access denied'})
+        
+        expenses, facets, total = filter_expenses(
+            Expense.objects.filter(employee=user_data).select_related('employee'), request.GET
+        )
+        rows, next_cursor = keyset_page(expenses, request.GET.get('cursor'))
+        
+        return JsonResponse({
+            'success': True,
+            'expenses': [expense_summary(expense) for expense in rows],
+            'next_cursor': next_cursor,
+            'total': total,
+            'facets': facets,
+        })
+        
+    except UserData.DoesNotExist:
+        return JsonResponse({'success': False, 'message': 'User profile not found'})
+    except (FilterError, InvalidCursor) as e:
+        return JsonResponse({'success': False, 'message': str(e)})
+
+
+@login_required
+def employee_expense_export(request):
+    """The employee's expenses matching the query filters, streamed as CSV or XLSX"""
+    try:
+        user_data = UserData.objects.get(user=request.user)
+        
+        # Check if user is an employee
+        if user_data.role != 'Employee':
+            return JsonResponse({'success': False, 'message': 'Access denied'})
+        
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return JsonResponse({'success': False, 'message': 'Invalid format, expected csv or xlsx'})
+        expenses = filtered_expenses(Expense.objects.filter(employee=user_data), request.GET)
+        
+        return export_response(expenses, export_format, f'my-expenses-{timezone.localdate():%Y-%m-%d}')
+        
+    except UserData.DoesNotExist:
+        return JsonResponse({'success': False, 'message': 'User profile not found'})
+    except FilterError as e:
+        return JsonResponse({'success': False, 'message': str(e)})
+
+
 @login_required
 @csrf_exempt
 def add_expense(request):
@@ -60,9 +168,10 @@ def add_expense(request):
         # Get form data
         data = json.loads(request.body)
         
-        # Create new expense
-        expense = Expense.objects.create(
+        # Create new expense, unless the company refuses duplicates of one on file
+        expense = Expense(
             employee=user_data,
+            company_id=user_data.company_id,
             description=data.get('description', ''),
             date=data.get('date', timezone.now().date()),
             category=data.get('category', 'Other'),
@@ -71,15 +180,130 @@ def add_expense(request):
             remarks=data.get('remarks', ''),
             status='Draft'
         )
+        duplicates = check_duplicates(expense)
+        expense.save()
+        warning = f' {duplicate_warning(duplicates)}' if duplicates else ''
+
+        # Optionally send it straight to the approvers
+        if data.get('submit'):
+            try:
+                route_expense(expense)
+            except RoutingError as e:
+                return JsonResponse({
+                    'success': True,
+                    'message': f'Expense saved as draft. {e}.{warning}',
+                    'expense_id': expense.id,
+                    'duplicate_ids': duplicates
+                })
+            return JsonResponse({
+                'success': True,
+                'message': f'Expense submitted for approval!{warning}',
+                'expense_id': expense.id,
+                'duplicate_ids': duplicates
+            })
         
         return JsonResponse({
             'success': True, 
-            'message': 'Expense added successfully!',
-            'expense_id': expense.id
+            'message': f'Expense added successfully!{warning}',
+            'expense_id': expense.id,
+            'duplicate_ids': duplicates
         })
         
     except UserData.DoesNotExist:
         return JsonResponse({'success': False, 'message': 'User profile not found'})
+    except DuplicateExpenseError as e:
+        return JsonResponse({'success': False, 'message': str(e), 'duplicate_ids': e.duplicate_ids})
+    except Exception as e:
+        return JsonResponse({'success': False, 'message': f'Error: {str(e)}'})
+
+
+@login_required
+@csrf_exempt
+def add_expenses_batch(request):
+    """File a batch of expenses from a card feed or an offline client.
+
+    Expects ``{"expenses": [...], "submit": false}`` where every expense
+    carries an ``idempotency_key``; keys already used are reported with
+    the expense they created instead of filing it again.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request method'})
+    
+    try:
+        user_data = UserData.objects.select_related('company').get(user=request.user)
+        
+        # Check if user is an employee
+        if user_data.role != 'Employee':
+            return JsonResponse({'success': False, 'message': 'Access denied'})
+        
+        data = json.loads(request.body)
+        if not isinstance(data, dict):
+            return JsonResponse({'success': False, 'message': 'Invalid batch: expected a JSON object'})
+        results = ingest_expenses(user_data, data.get('expenses'), submit=bool(data.get('submit')))
+        counts = {status: sum(result['status'] == status for result in results)
+                  for status in ('created', 'existing', 'rejected')}
+        
+        return JsonResponse({
+            'success': True,
+            'message': f"{counts['created']} expenses added, {counts['existing']} already on file, "
+                       f"{counts['rejected']} rejected",
+            'counts': counts,
+            'results': results,
+        })
+        
+    except UserData.DoesNotExist:
+        return JsonResponse({'success': False, 'message': 'User profile not found'})
+    except (IngestError, ValueError) as e:
+        return JsonResponse({'success': False, 'message': f'Invalid batch: {e}'})
+
+
+def create_receipt_expense(user_data, file):
+    """Store an uploaded receipt and create the draft expense the OCR workers
+    fill in, flagging it when the receipt looks like one already filed"""
+    with transaction.atomic():
+        expense = draft_expense(user_data, file.name, store_receipt(file))
+        expense.save()
+        enqueue_scan(expense)
+    flag_similar_receipt(expense)
+    return expense
+
+
+@login_required
+@csrf_exempt
+def upload_receipt_batch(request):
+    """Create a draft expense for every receipt in a ZIP archive and/or
+    several uploaded files, reporting back on each file"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request method'})
+    
+    # Spool the archive to disk so it can be read member by member
+    request.upload_handlers = [HashingUploadHandler(request)]
+    
+    try:
+        user_data = UserData.objects.get(user=request.user)
+        
+        # Check if user is an employee
+        if user_data.role != 'Employee':
+            return JsonResponse({'success': False, 'message': 'Access denied'})
+        
+        archive = request.FILES.get('archive')
+        if archive is not None and os.path.splitext(archive.name)[1].lower() != '.zip':
+            return JsonResponse({'success': False, 'message': 'Archives must be ZIP files'})
+        
+        prepared = prepare_batch(archive, request.FILES.getlist('receipt_files'))
+        results = create_batch_expenses(user_data, prepared)
+        created = sum(result['success'] for result in results)
+        
+        return JsonResponse({
+            'success': created > 0,
+            'message': f'{created} of {len(results)} receipts uploaded. They will be processed soon.',
+            'results': results
+        })
+        
+    except UserData.DoesNotExist:
+        return JsonResponse({'success': False, 'message': 'User profile not found'})
+    except BatchError as e:
+        return JsonResponse({'success': False, 'message': str(e)})
     except Exception as e:
         return JsonResponse({'success': False, 'message': f'Error: {str(e)}'})
 
@@ -91,6 +315,9 @@ def upload_expense(request):
     if request.method != 'POST':
         return JsonResponse({'success': False, 'message': 'Invalid request method'})
     
+    # Hash the receipt while it is spooled to disk
+    request.upload_handlers = [HashingUploadHandler(request)]
+    
     try:
         user_data = UserData.objects.get(user=request.user)
         
@@ -114,18 +341,7 @@ def upload_expense(request):
                 'message': 'Invalid file type. Please upload PDF, JPG, JPEG, or PNG files only.'
             })
         
-        # Create a temporary expense record for the uploaded file
-        expense = Expense.objects.create(
-            employee=user_data,
-            description=f"Uploaded receipt: {file.name}",
-            date=timezone.now().date(),
-            category='Other',
-            amount=0,  # Will be processed later
-            currency='INR',
-            remarks='Receipt uploaded for processing',
-            status='Draft',
-            receipt=file
-        )
+        expense = create_receipt_expense(user_data, file)
         
         return JsonResponse({
             'success': True, 
@@ -141,6 +357,125 @@ def upload_expense(request):
 
 
 @login_required
+@csrf_exempt
+def start_upload(request):
+    """Open a chunked upload session for a receipt"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request method'})
+    
+    try:
+        user_data = UserData.objects.get(user=request.user)
+        
+        # Check if user is an employee
+        if user_data.role != 'Employee':
+            return JsonResponse({'success': False, 'message': 'Access denied'})
+        
+        data = json.loads(request.body)
+        session = open_session(user_data, data.get('filename', ''), int(data.get('size', 0)))
+        
+        return JsonResponse({
+            'success': True,
+            'upload_id': str(session.id),
+            'offset': session.received,
+            'chunk_size': CHUNK_SIZE
+        })
+        
+    except UserData.DoesNotExist:
+        return JsonResponse({'success': False, 'message': 'User profile not found'})
+    except (UploadError, ValueError) as e:
+        return JsonResponse({'success': False, 'message': str(e)})
+
+
+@login_required
+@csrf_exempt
+def upload_chunk(request, upload_id):
+    """Report an upload's offset (GET) or append the next chunk to it (POST).
+    
+    The chunk is the raw request body; the last one turns the upload into
+    a draft expense. An empty POST at the final offset retries that step.
+    """
+    if request.method not in ('GET', 'POST'):
+        return JsonResponse({'success': False, 'message': 'Invalid request method'})
+    
+    try:
+        user_data = UserData.objects.get(user=request.user)
+        session = get_object_or_404(UploadSession, id=upload_id, employee=user_data)
+        
+        if request.method == 'POST':
+            try:
+                offset = int(request.headers.get('X-Upload-Offset', -1))
+                length = int(request.META.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                return JsonResponse({'success': False, 'message': 'Invalid upload offset'})
+            
+            finishing = not length and session.received == session.size and session.status != 'Aborted'
+            if not finishing:
+                append_chunk(session, offset, request.headers.get('X-Chunk-SHA256', ''), request, length)
+            if session.received == session.size:
+                try:
+                    session = finish_upload(session, lambda file: create_receipt_expense(user_data, file))
+                except Exception as e:
+                    # Every byte is kept; the client retries with an empty chunk
+                    return JsonResponse({
+                        'success': False,
+                        'message': f'Error storing receipt: {str(e)}',
+                        'offset': session.received
+                    })
+        
+        return JsonResponse({
+            'success': True,
+            'offset': session.received,
+            'size': session.size,
+            'complete': session.status == 'Complete',
+            'expense_id': session.expense_id
+        })
+        
+    except UserData.DoesNotExist:
+        return JsonResponse({'success': False, 'message': 'User profile not found'})
+    except UploadError as e:
+        return JsonResponse({'success': False, 'message': str(e), 'offset': session.received})
+
+
+@login_required
+@csrf_exempt
+def submit_expense(request, expense_id):
+    """Submit a draft expense to the approvers from the employee's approval rule"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request method'})
+    
+    try:
+        user_data = UserData.objects.get(user=request.user)
+        
+        # Check if user is an employee
+        if user_data.role != 'Employee':
+            return JsonResponse({'success': False, 'message': 'Access denied'})
+        
+        expense = get_object_or_404(Expense, id=expense_id, employee=user_data)
+        # Uploaded receipts only get their amount and date once read, so check again here
+        duplicates = check_duplicates(expense)
+        route_expense(expense)
+        
+        return JsonResponse({
+            'success': True,
+            'message': 'Expense submitted for approval!' + (f' {duplicate_warning(duplicates)}' if duplicates else ''),
+            'expense_id': expense.id,
+            'duplicate_ids': duplicates
+        })
+        
+    except UserData.DoesNotExist:
+        return JsonResponse({'success': False, 'message': 'User profile not found'})
+    except RoutingError as e:
+        return JsonResponse({'success': False, 'message': str(e)})
+    except DuplicateExpenseError as e:
+        return JsonResponse({'success': False, 'message': str(e), 'duplicate_ids': e.duplicate_ids})
+    except Exception as e:
+        return JsonResponse({'success': False, 'message': f'Error: {str(e)}'})
+
+
+@login_required
+@gzip_page
+@cache_control(private=True, no_cache=True)
+@expense_condition(own_expenses)
 def get_expense_details(request, expense_id):
     """Get expense details for modal display"""
     try:
@@ -159,7 +494,9 @@ def get_expense_details(request, expense_id):
             'created_at': expense.created_at.strftime('%Y-%m-%d %H:%M'),
             'updated_at': expense.updated_at.strftime('%Y-%m-%d %H:%M'),
             'has_receipt': bool(expense.receipt),
-            'receipt_url': expense.receipt.url if expense.receipt else None,
+            'receipt_url': reverse('core:receipt', args=[expense.id]) if expense.receipt else None,
+            'thumbnail_url': derivative_url(expense, 'thumbnail'),
+            'preview_url': derivative_url(expense, 'preview'),
         }
         
         return JsonResponse({'success': True, 'expense': expense_data})
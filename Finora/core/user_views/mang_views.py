@@ -2,19 +2,59 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
+from django.db import transaction
+from django.db.models import Case, Count, Q, TextField, Value, When
+from django.db.models.functions import Concat
+from django.urls import reverse
 from django.utils import timezone
 import json
 
+from ..conditional import expense_condition, expenses_to_approve
+from ..currency import convert
+from ..derivatives import derivative_url
 from ..models import Expense, ExpenseApproval
+from ..pagination import InvalidCursor, keyset_page, page_response
 from user_app.models import UserData
 
 
+def pending_queue(user_data):
+    """Approvals waiting on this manager"""
+    return ExpenseApproval.objects.filter(
+        approver=user_data,
+        status='Pending'
+    ).select_related('expense', 'expense__employee')
+
+
+def with_company_amounts(approvals, company):
+    """Set ``company_amount`` on each approval's expense: its amount in the
+    company currency, or None without a rate"""
+    for approval in approvals:
+        expense = approval.expense
+        expense.company_amount = convert(expense.amount, expense.currency, company.currency, expense.date)
+    return approvals
+
+
+def processed_approvals_for(user_data):
+    """Approvals this manager has decided (queued chain steps are Draft)"""
+    return ExpenseApproval.objects.filter(
+        approver=user_data,
+        status__in=['Approved', 'Rejected']
+    ).select_related('expense', 'expense__employee')
+
+
+def manager_note(remarks):
+    """The line a decision with ``remarks`` appends to the expense remarks"""
+    return f"Manager Note: {remarks}".rstrip()
+
+
 @login_required
 def manager_dashboard(request):
     """Manager dashboard showing expenses awaiting their approval"""
     try:
-        user_data = UserData.objects.get(user=request.user)
+        user_data = UserData.objects.select_related('company').get(user=request.user)
         
         # Check if user is a manager
         if user_data.role != 'Manager':
@@ -24,31 +64,33 @@ def manager_dashboard(request):
         # Get expenses that need this manager's approval
         # We'll find expenses where:
         # 1. The manager has approval records for expenses
-        # 2. The approval status is Pending
-        pending_approvals = ExpenseApproval.objects.filter(
-            approver=user_data,
-            status='Pending'
-        ).select_related('expense', 'expense__employee').order_by('-created_at')
+        # 2. The approval status is Pending (later steps of a sequential
+        #    chain stay Draft until the step before them is decided)
+        # First page only; the rest load on demand
+        pending_approvals, next_cursor = keyset_page(pending_queue(user_data))
+        with_company_amounts(pending_approvals, user_data.company)
         
-        # Get total approvals for this manager (for stats)
-        total_approvals = ExpenseApproval.objects.filter(approver=user_data).count()
-        approved_count = ExpenseApproval.objects.filter(approver=user_data, status='Approved').count()
-        rejected_count = ExpenseApproval.objects.filter(approver=user_data, status='Rejected').count()
-        pending_count = pending_approvals.count()
+        # Get approval stats for this manager in one aggregate query
+        stats = ExpenseApproval.objects.filter(approver=user_data).aggregate(
+            total=Count('id'),
+            approved=Count('id', filter=Q(status='Approved')),
+            rejected=Count('id', filter=Q(status='Rejected')),
+            pending=Count('id', filter=Q(status='Pending')),
+        )
         
         # Get recent expenses awaiting approval (for quick view)
-        recent_expenses = []
-        for approval in pending_approvals[:10]:  # Limit to 10 most recent
-            recent_expenses.append(approval.expense)
+        recent_expenses = [approval.expense for approval in pending_approvals[:10]]
         
         context = {
             'user_data': user_data,
             'pending_approvals': pending_approvals,
+            'company_currency': user_data.company.currency,
+            'next_cursor': next_cursor,
             'recent_expenses': recent_expenses,
-            'total_approvals': total_approvals,
-            'approved_count': approved_count,
-            'rejected_count': rejected_count,
-            'pending_count': pending_count,
+            'total_approvals': stats['total'],
+            'approved_count': stats['approved'],
+            'rejected_count': stats['rejected'],
+            'pending_count': stats['pending'],
         }
         
         return render(request, 'core/manager_dashboard.html', context)
@@ -93,13 +135,16 @@ def approve_expense(request, expense_id):
         new_status = 'Approved' if action == 'approve' else 'Rejected'
         approval.status = new_status
         if remarks:
-            approval.expense.remarks = f"{approval.expense.remarks}\nManager Note: {remarks}".strip()
-            approval.expense.save()
+            note = manager_note(remarks)
+            # NULL or blank remarks take the note alone, as in bulk_approve_expenses
+            if approval.expense.remarks:
+                note = f"{approval.expense.remarks}\n{note}"
+            approval.expense.remarks = note
+            approval.expense.save(update_fields=['remarks', 'updated_at'])
+
+        # Saving the approval updates the expense counters and status
         approval.save()
-        
-        # Update the main expense status based on all approvals
-        expense.update_status_from_approvals()
-        
+
         action_text = 'approved' if action == 'approve' else 'rejected'
         return JsonResponse({
             'success': True, 
@@ -115,6 +160,105 @@ def approve_expense(request, expense_id):
 
 
 @login_required
+@csrf_exempt
+def bulk_approve_expenses(request):
+    """Approve or reject many expenses in one request via AJAX"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request method'})
+    
+    try:
+        user_data = UserData.objects.get(user=request.user)
+        
+        # Check if user is a manager
+        if user_data.role != 'Manager':
+            return JsonResponse({'success': False, 'message': 'Access denied'})
+        
+        data = json.loads(request.body)
+        action = data.get('action')  # 'approve' or 'reject'
+        remarks = data.get('remarks', '')
+        expense_ids = [int(expense_id) for expense_id in data.get('expense_ids', [])]
+        
+        if action not in ['approve', 'reject']:
+            return JsonResponse({'success': False, 'message': 'Invalid action'})
+        if not expense_ids:
+            return JsonResponse({'success': False, 'message': 'No expenses selected'})
+        
+        new_status = 'Approved' if action == 'approve' else 'Rejected'
+        now = timezone.now()
+        
+        with transaction.atomic():
+            # Lock this manager's pending approvals for the selected expenses
+            approvals = list(ExpenseApproval.objects.select_for_update().filter(
+                approver=user_data,
+                status='Pending',
+                expense_id__in=expense_ids
+            ))
+            for approval in approvals:
+                approval.status = new_status
+                approval.updated_at = now
+            ExpenseApproval.objects.bulk_update(approvals, ['status', 'updated_at'])
+            
+            decided_ids = {approval.expense_id for approval in approvals}
+            expenses = Expense.objects.filter(pk__in=decided_ids)
+            if remarks:
+                # The same text approve_expense stores for a single decision
+                note = manager_note(remarks)
+                expenses.update(remarks=Case(
+                    When(Q(remarks__isnull=True) | Q(remarks=''), then=Value(note)),
+                    default=Concat('remarks', Value(f"\n{note}")),
+                    output_field=TextField(),
+                ))
+            
+            # bulk_update skips ExpenseApproval.save(), so rebuild the counters here
+            expenses.recompute_approval_counters(updated_at=now)
+            ExpenseApproval.objects.advance_chains(
+                (approval.expense_id, approval.step) for approval in approvals
+            )
+            statuses = dict(expenses.values_list('id', 'status'))
+        
+        results = [
+            {
+                'expense_id': expense_id,
+                'success': expense_id in decided_ids,
+                'status': statuses.get(expense_id),
+                'message': None if expense_id in decided_ids else 'No pending approval for this expense',
+            }
+            for expense_id in expense_ids
+        ]
+        
+        action_text = 'approved' if action == 'approve' else 'rejected'
+        return JsonResponse({
+            'success': True,
+            'message': f'{len(decided_ids)} of {len(expense_ids)} expenses {action_text}.',
+            'results': results
+        })
+        
+    except UserData.DoesNotExist:
+        return JsonResponse({'success': False, 'message': 'User profile not found'})
+    except Exception as e:
+        return JsonResponse({'success': False, 'message': f'Error: {str(e)}'})
+
+
+def similar_receipt_summary(expense):
+    """The earlier expense whose receipt this one's resembles, for the approver to compare"""
+    similar = Expense.objects.select_related('employee').filter(pk=expense.similar_receipt_id).first()
+    if similar is None:
+        return None
+    return {
+        'id': similar.id,
+        'description': similar.description,
+        'date': similar.date.strftime('%Y-%m-%d'),
+        'amount': float(similar.amount),
+        'currency': similar.currency,
+        'status': similar.status,
+        'employee': similar.employee.name,
+    }
+
+
+@login_required
+@gzip_page
+@cache_control(private=True, no_cache=True)
+@expense_condition(expenses_to_approve)
 def get_expense_for_approval(request, expense_id):
     """Get expense details for approval modal"""
     try:
@@ -129,7 +273,7 @@ def get_expense_for_approval(request, expense_id):
         )
         
         # Get all approvals for this expense to show approval chain
-        all_approvals = ExpenseApproval.objects.filter(expense=expense).select_related('approver')
+        all_approvals = ExpenseApproval.objects.filter(expense=expense).select_related('approver').order_by('step', 'id')
         
         expense_data = {
             'id': expense.id,
@@ -148,16 +292,21 @@ def get_expense_for_approval(request, expense_id):
             'created_at': expense.created_at.strftime('%Y-%m-%d %H:%M'),
             'updated_at': expense.updated_at.strftime('%Y-%m-%d %H:%M'),
             'has_receipt': bool(expense.receipt),
-            'receipt_url': expense.receipt.url if expense.receipt else None,
+            'receipt_url': reverse('core:receipt', args=[expense.id]) if expense.receipt else None,
+            'thumbnail_url': derivative_url(expense, 'thumbnail'),
+            'preview_url': derivative_url(expense, 'preview'),
+            'similar_receipt': similar_receipt_summary(expense),
             'approvals': [
                 {
                     'approver_name': approval.approver.name,
                     'approver_email': approval.approver.email,
                     'status': approval.status,
+                    'step': approval.step,
                     'created_at': approval.created_at.strftime('%Y-%m-%d %H:%M')
                 } for approval in all_approvals
             ],
-            'current_approval_id': approval.id
+            'current_approval_id': approval.id,
+            'current_step': expense.current_step
         }
         
         return JsonResponse({'success': True, 'expense': expense_data})
@@ -178,14 +327,13 @@ def manager_expense_history(request):
             messages.error(request, 'Access denied. This page is for managers only.')
             return redirect('core:dashboard')
         
-        # Get all approvals processed by this manager
-        processed_approvals = ExpenseApproval.objects.filter(
-            approver=user_data
-        ).exclude(status='Pending').select_related('expense', 'expense__employee').order_by('-updated_at')
+        # First page of the approvals processed by this manager
+        processed_approvals, next_cursor = keyset_page(processed_approvals_for(user_data), field='updated_at')
         
         context = {
             'user_data': user_data,
             'processed_approvals': processed_approvals,
+            'next_cursor': next_cursor,
         }
         
         return render(request, 'core/manager_history.html', context)
@@ -193,3 +341,43 @@ def manager_expense_history(request):
     except UserData.DoesNotExist:
         messages.error(request, 'User profile not found.')
         return redirect('user_app:login')
+
+
+@login_required
+def manager_pending_page(request):
+    """Next page of the pending queue for the dashboard's load-more button"""
+    try:
+        user_data = UserData.objects.select_related('company').get(user=request.user)
+        
+        if user_data.role != 'Manager':
+            return JsonResponse({'success': False, 'message': 'Access denied'})
+        
+        rows, next_cursor = keyset_page(pending_queue(user_data), request.GET.get('cursor'))
+        with_company_amounts(rows, user_data.company)
+        return page_response(request, 'core/partials/manager_pending_rows.html', rows, next_cursor,
+                             {'company_currency': user_data.company.currency})
+        
+    except UserData.DoesNotExist:
+        return JsonResponse({'success': False, 'message': 'User profile not found'})
+    except InvalidCursor as e:
+        return JsonResponse({'success': False, 'message': str(e)})
+
+
+@login_required
+def manager_history_page(request):
+    """Next page of the approval history for the load-more button"""
+    try:
+        user_data = UserData.objects.get(user=request.user)
+        
+        if user_data.role != 'Manager':
+            return JsonResponse({'success': False, 'message': 'Access denied'})
+        
+        rows, next_cursor = keyset_page(
+            processed_approvals_for(user_data), request.GET.get('cursor'), field='updated_at'
+        )
+        return page_response(request, 'core/partials/manager_history_rows.html', rows, next_cursor)
+        
+    except UserData.DoesNotExist:
+        return JsonResponse({'success': False, 'message': 'User profile not found'})
+    except InvalidCursor as e:
+        return JsonResponse({'success': False, 'message': str(e)})
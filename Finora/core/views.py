@@ -1,8 +1,20 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.http import Http404, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from PIL import Image
 from user_app.models import UserData
 
+from .catalogue import catalogue, catalogue_etag, preferred_currencies
+from .derivatives import DERIVATIVE_MAX_AGE, DERIVATIVE_SIZES, get_derivative
+from .ocr import ExtractionError
+from .permissions import viewable_expenses
+from .sendfile import send_file
+
+CATALOGUE_MAX_AGE = 60 * 60 * 24
+
 # Create your views here.
 
 @login_required
@@ -24,3 +36,69 @@ def dashboard(request):
     except UserData.DoesNotExist:
         messages.error(request, 'User profile not found.')
         return redirect('user_app:login')
+
+
+@login_required
+def receipt_download(request, expense_id):
+    """An expense's receipt, for the employee, its approvers and company admins"""
+    user_data = get_object_or_404(UserData, user=request.user)
+    expense = get_object_or_404(viewable_expenses(user_data).select_related('receipt_blob'), id=expense_id)
+    if not expense.receipt:
+        raise Http404('No receipt attached')
+    
+    # Blob content never changes under its digest; older receipts fall back to the file's mtime
+    if expense.receipt_blob:
+        etag, last_modified = expense.receipt_blob.digest, expense.receipt_blob.created_at
+    else:
+        try:
+            etag, last_modified = None, expense.receipt.storage.get_modified_time(expense.receipt.name)
+        except OSError:
+            raise Http404('Receipt file not found')
+    
+    response = send_file(request, expense.receipt.name, etag=etag, last_modified=last_modified,
+                         storage=expense.receipt.storage)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required
+def receipt_derivative(request, expense_id, size):
+    """Thumbnail or preview image of an expense's receipt, rendered on first request"""
+    if size not in DERIVATIVE_SIZES:
+        raise Http404('Unknown receipt size')
+    user_data = get_object_or_404(UserData, user=request.user)
+    expense = get_object_or_404(viewable_expenses(user_data), id=expense_id)
+    if not expense.receipt:
+        raise Http404('No receipt attached')
+    
+    try:
+        name = get_derivative(expense, size)
+    except (OSError, ValueError, ExtractionError, Image.DecompressionBombError):
+        raise Http404('Receipt preview unavailable')
+    
+    # The URL carries the receipt's digest, so the image never changes under it
+    response = send_file(request, name, content_type='image/jpeg')
+    patch_cache_control(response, private=True, max_age=DERIVATIVE_MAX_AGE, immutable=True)
+    return response
+
+
+def currency_catalogue(request):
+    """Bundled country and currency lists, the company's own currencies first.
+    Open to anonymous users for the signup form."""
+    company = None
+    if request.user.is_authenticated:
+        user_data = UserData.objects.filter(user=request.user).select_related('company').first()
+        company = user_data.company if user_data else None
+    preferred = preferred_currencies(company)
+    
+    # Rebuilt only when the dataset or the company's currencies change
+    etag = quote_etag(catalogue_etag(preferred))
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse({'success': True, **catalogue(preferred)})
+    response['ETag'] = etag
+    if company is None:
+        patch_cache_control(response, public=True, max_age=CATALOGUE_MAX_AGE)
+    else:
+        patch_cache_control(response, private=True, max_age=CATALOGUE_MAX_AGE)
+    return response
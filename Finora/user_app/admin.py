@@ -5,8 +5,8 @@ from .models import CompanyData, UserData, PasswordResetToken
 
 @admin.register(CompanyData)
 class CompanyDataAdmin(admin.ModelAdmin):
-    list_display = ('name', 'country', 'currency', 'created_at')
-    list_filter = ('country', 'currency', 'created_at')
+    list_display = ('name', 'country', 'currency', 'duplicate_policy', 'created_at')
+    list_filter = ('country', 'currency', 'duplicate_policy', 'created_at')
     search_fields = ('name', 'country')
 
 @admin.register(UserData)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_app', '0002_companydata_name_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='companydata',
+            name='duplicate_policy',
+            field=models.CharField(choices=[('warn', 'Warn and save'), ('block', 'Refuse the expense')], default='warn', help_text='What happens when an employee files an expense identical to one already on file', max_length=10),
+        ),
+    ]
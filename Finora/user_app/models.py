@@ -5,9 +5,17 @@ from django.utils import timezone
 
 
 class CompanyData(models.Model):
-    name = models.CharField(max_length=100)
+    DUPLICATE_POLICY_CHOICES = [
+        ('warn', 'Warn and save'),
+        ('block', 'Refuse the expense'),
+    ]
+    name = models.CharField(max_length=100, db_index=True)
     country = models.CharField(max_length=100)
     currency = models.CharField(max_length=100)
+    duplicate_policy = models.CharField(
+        max_length=10, choices=DUPLICATE_POLICY_CHOICES, default='warn',
+        help_text='What happens when an employee files an expense identical to one already on file'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     